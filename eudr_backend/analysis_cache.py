@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from eudr_backend.models import WhispAnalysisCacheModel
+from eudr_backend.utils import compute_geometry_hash
+
+# keep the number of query parameters below the SQLite limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def get_analysis_cache_key(feature):
+    """
+    Build the (geometry hash, commodity) pair a Whisp analysis is cached under.
+    """
+    properties = feature.get('properties') or {}
+    commodity = (properties.get('commodity') or 'Coffee').strip().lower()
+    return compute_geometry_hash(feature.get('geometry') or {}), commodity
+
+
+def get_cached_analyses(keys, dataset_version, ttl_days):
+    """
+    Return a dict mapping each cached key to its stored Whisp result and mark the hits as used.
+    """
+    hashes = list({geometry_hash for geometry_hash, _ in keys})
+    expires_before = timezone.now() - timedelta(days=ttl_days)
+    wanted = set(keys)
+    cached = {}
+    hit_ids = []
+
+    for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        entries = WhispAnalysisCacheModel.objects.filter(
+            geometry_hash__in=hashes[i:i + LOOKUP_BATCH_SIZE],
+            dataset_version=dataset_version,
+            created_at__gte=expires_before,
+        ).values_list('id', 'geometry_hash', 'commodity', 'result')
+        for entry_id, geometry_hash, commodity, result in entries:
+            if (geometry_hash, commodity) in wanted:
+                cached[(geometry_hash, commodity)] = result
+                hit_ids.append(entry_id)
+
+    for i in range(0, len(hit_ids), LOOKUP_BATCH_SIZE):
+        WhispAnalysisCacheModel.objects.filter(
+            id__in=hit_ids[i:i + LOOKUP_BATCH_SIZE]).update(last_used_at=timezone.now())
+
+    return cached
+
+
+def store_analyses(results_by_key, dataset_version, ttl_days, max_entries):
+    """
+    Save freshly computed Whisp results and evict expired or least recently used entries.
+    """
+    now = timezone.now()
+    WhispAnalysisCacheModel.objects.bulk_create(
+        [
+            WhispAnalysisCacheModel(
+                geometry_hash=geometry_hash,
+                commodity=commodity,
+                dataset_version=dataset_version,
+                result=result,
+                created_at=now,
+                last_used_at=now,
+            )
+            for (geometry_hash, commodity), result in results_by_key.items()
+        ],
+        batch_size=LOOKUP_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['geometry_hash', 'commodity', 'dataset_version'],
+        update_fields=['result', 'created_at', 'last_used_at'],
+    )
+    evict_analyses(ttl_days, max_entries)
+
+
+def evict_analyses(ttl_days, max_entries):
+    WhispAnalysisCacheModel.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=ttl_days)).delete()
+
+    overflow = WhispAnalysisCacheModel.objects.count() - max_entries
+    if overflow > 0:
+        stale_ids = list(WhispAnalysisCacheModel.objects.order_by(
+            'last_used_at').values_list('id', flat=True)[:overflow])
+        for i in range(0, len(stale_ids), LOOKUP_BATCH_SIZE):
+            WhispAnalysisCacheModel.objects.filter(
+                id__in=stale_ids[i:i + LOOKUP_BATCH_SIZE]).delete()
@@ -1,12 +1,22 @@
+import asyncio
 import json
+import logging
 import httpx
 from asgiref.sync import sync_to_async
-from django.db.models import Q
+from eudr_backend.analysis_cache import get_analysis_cache_key, get_cached_analyses, store_analyses
+from eudr_backend.bulk_operations import bulk_upsert_farms
+from eudr_backend.log_utils import LazyPayload
 from eudr_backend.models import EUDRFarmModel, EUDRUploadedFilesModel, WhispAPISetting
 from eudr_backend.serializers import EUDRFarmModelSerializer
 from eudr_backend.utils import flatten_geojson, format_geojson_data, transform_db_data_to_geojson
 from decouple import config
 
+logger = logging.getLogger(__name__)
+
+
+class WhispAPIError(Exception):
+    pass
+
 
 # Define an async function
 async def async_create_farm_data(data, file_id, isSyncing=False, hasCreatedFiles=[]):
@@ -31,13 +41,13 @@ async def async_create_farm_data(data, file_id, isSyncing=False, hasCreatedFiles
         # print(analysis_results)
         if err:
             # delete the file if there are errors
-            EUDRUploadedFilesModel.objects.get(id=file_id).delete()
+            await sync_to_async(EUDRUploadedFilesModel.objects.filter(id=file_id).delete)()
             errors.append(err)
         else:
             err, new_data = await save_farm_data(data, file_id, analysis_results)
             if err:
                 # delete the file if there are errors
-                EUDRUploadedFilesModel.objects.get(id=file_id).delete()
+                await sync_to_async(EUDRUploadedFilesModel.objects.filter(id=file_id).delete)()
                 errors.append(err)
             else:
                 created_data.extend(new_data)
@@ -70,7 +80,7 @@ async def perform_analysis(data, hasCreatedFiles=[]):
                "Content-Type": "application/json"}
     settings = await sync_to_async(WhispAPISetting.objects.first)()
     chunk_size = settings.chunk_size if settings else 500
-    analysis_results = []
+    concurrency_limit = max(settings.concurrency_limit, 1) if settings else 4
     data = json.loads(data) if isinstance(data, str) else data
     data = flatten_geojson(data)
     features = data.get('features', [])
@@ -78,59 +88,90 @@ async def perform_analysis(data, hasCreatedFiles=[]):
     if not features:
         return {"error": "No features found in the data."}, None
 
+    dataset_version = settings.dataset_version if settings else "v1"
+    cache_ttl_days = settings.cache_ttl_days if settings else 30
+    cache_max_entries = settings.cache_max_entries if settings else 100000
+
+    # only send the features whose geometry has not been analysed yet
+    cache_keys = [get_analysis_cache_key(feature) for feature in features]
+    cached_results = await sync_to_async(get_cached_analyses)(
+        cache_keys, dataset_version, cache_ttl_days)
+    missing_indices = [i for i, key in enumerate(
+        cache_keys) if key not in cached_results]
+    missing_features = [features[i] for i in missing_indices]
+
+    chunks = [
+        {
+            "type": data.get("type", "FeatureCollection"),
+            "features": missing_features[i:i + chunk_size]
+        }
+        for i in range(0, len(missing_features), chunk_size)
+    ]
+    semaphore = asyncio.Semaphore(concurrency_limit)
+
     async with httpx.AsyncClient(timeout=1200.0) as client:
-        for i in range(0, len(features), chunk_size):
-            chunk = features[i:i + chunk_size]
-            chunked_data = {
-                "type": data.get("type", "FeatureCollection"),
-                "features": chunk
-            }
-            response = await client.post(url, headers=headers, json=chunked_data)
-
-            if response.status_code != 200:
-                if hasCreatedFiles:
-                    EUDRUploadedFilesModel.objects.filter(
-                        id__in=hasCreatedFiles).delete()
-                return {"Validation against global database failed."}, None
-            analysis_results.extend(response.json().get(
-                'data', []). get('features', []))
+        tasks = [
+            asyncio.ensure_future(submit_analysis_chunk(
+                client, semaphore, url, headers, chunked_data))
+            for chunked_data in chunks
+        ]
+        try:
+            # gather keeps the results in the same order as the chunks
+            chunk_results = await asyncio.gather(*tasks)
+        except (WhispAPIError, httpx.HTTPError):
+            # one failed chunk fails the whole batch, stop the others
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if hasCreatedFiles:
+                await sync_to_async(EUDRUploadedFilesModel.objects.filter(
+                    id__in=hasCreatedFiles).delete)()
+            return {"error": "Validation against global database failed."}, None
+
+    fresh_results = []
+    for result in chunk_results:
+        fresh_results.extend(result)
+
+    if len(fresh_results) != len(missing_features):
+        # results can not be matched back to their features, nothing is cached
+        if not cached_results:
+            return None, fresh_results
+        return {"error": "Validation against global database failed."}, None
+
+    analysis_results = [cached_results.get(key) for key in cache_keys]
+    for i, result in zip(missing_indices, fresh_results):
+        analysis_results[i] = result
+
+    if fresh_results:
+        await sync_to_async(store_analyses)(
+            {cache_keys[i]: result for i, result in zip(
+                missing_indices, fresh_results)},
+            dataset_version, cache_ttl_days, cache_max_entries)
     return None, analysis_results
 
 
-async def save_farm_data(data, file_id, analysis_results=None):
-    print("analysis results",analysis_results)
-    formatted_data = format_geojson_data(data, analysis_results, file_id)
-    # print("formatted data",formatted_data)
-    saved_records = []
-
-    for item in formatted_data:
-        query = Q(farmer_name=item['farmer_name'],
-                  collection_site=item['collection_site'])
+async def submit_analysis_chunk(client, semaphore, url, headers, chunked_data):
+    """
+    Submit one chunk of features to the Whisp API, waiting for a free slot first.
+    """
+    async with semaphore:
+        response = await client.post(url, headers=headers, json=chunked_data)
 
-        # Additional condition if polygon exists
-        if item.get('polygon'):
-            query &= Q(polygon__isnull=False) & ~Q(polygon=[])
+    if response.status_code != 200:
+        raise WhispAPIError(response.status_code)
+    return response.json().get('data', {}).get('features', [])
 
-        # Additional condition if latitude and longitude are not 0 or 0.0
-        if item.get('latitude', 0) != 0 or item.get('longitude', 0) != 0:
-            query &= (Q(latitude=item['latitude'])
-                      | Q(longitude=item['longitude']))
 
-        # Retrieve the existing record based on the constructed query
-        existing_record = await sync_to_async(EUDRFarmModel.objects.filter(query).first)()
-
-        if existing_record:
-            serializer = EUDRFarmModelSerializer(
-                existing_record, data=item)
-        else:
-            serializer = EUDRFarmModelSerializer(data=item)
+async def save_farm_data(data, file_id, analysis_results=None):
+    logger.debug("Saving the farms of file %s with analysis results %s",
+                 file_id, LazyPayload(analysis_results))
+    formatted_data = format_geojson_data(data, analysis_results, file_id)
+    # print("formatted data",formatted_data)
 
-        if serializer.is_valid():
-            saved_instance = await sync_to_async(serializer.save)()
-            saved_records.append(saved_instance)
-        else:
-            # delete the file if there are errors
-            EUDRUploadedFilesModel.objects.get(id=file_id).delete()
-            return serializer.errors, None
+    errors, saved_records = await sync_to_async(bulk_upsert_farms)(formatted_data)
+    if errors:
+        # delete the file if there are errors
+        await sync_to_async(EUDRUploadedFilesModel.objects.filter(id=file_id).delete)()
+        return errors, None
 
-    return None, saved_records
\ No newline at end of file
+    return None, saved_records
@@ -0,0 +1,185 @@
+from django.db import transaction
+from django.utils import timezone
+
+from eudr_backend import settings
+from eudr_backend.models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRFarmModel
+from eudr_backend.serializers import EUDRFarmModelSerializer
+
+
+def get_farm_dedup_key(farmer_name, collection_site):
+    return farmer_name, collection_site
+
+
+def is_same_farm(record, item):
+    """
+    Check whether an existing farm record matches an incoming farm, on top of the dedup key.
+    """
+    if item.get('polygon') and record.polygon in (None, []):
+        return False
+
+    # compare the coordinates only when they are set
+    if item.get('latitude', 0) != 0 or item.get('longitude', 0) != 0:
+        return record.latitude == item['latitude'] or record.longitude == item['longitude']
+
+    return True
+
+
+def get_existing_farms(items, batch_size):
+    """
+    Retrieve the farms sharing a dedup key with the incoming farms, grouped by that key.
+    """
+    keys = {get_farm_dedup_key(item.get('farmer_name'), item.get(
+        'collection_site')) for item in items}
+    farmer_names = list({farmer_name for farmer_name, _ in keys})
+    collection_sites = list({collection_site for _, collection_site in keys})
+
+    existing_farms = {}
+    for i in range(0, len(farmer_names), batch_size):
+        records = EUDRFarmModel.objects.filter(
+            farmer_name__in=farmer_names[i:i + batch_size],
+            collection_site__in=collection_sites,
+        ).order_by('id')
+        for record in records:
+            key = get_farm_dedup_key(record.farmer_name, record.collection_site)
+            if key in keys:
+                existing_farms.setdefault(key, []).append(record)
+
+    return existing_farms
+
+
+def bulk_upsert_farms(items, batch_size=None):
+    """
+    Create or update the given formatted farms with a single lookup and batched writes.
+
+    Returns a tuple of (errors, saved_records).
+    """
+    batch_size = batch_size or settings.FARM_BULK_BATCH_SIZE
+
+    serializer = EUDRFarmModelSerializer(data=items, many=True)
+    if not serializer.is_valid():
+        return [
+            {"record": i, "errors": item_errors}
+            for i, item_errors in enumerate(serializer.errors, start=1) if item_errors
+        ], None
+
+    existing_farms = get_existing_farms(items, batch_size)
+    now = timezone.now()
+    to_create = []
+    to_update = {}
+    update_fields = {'updated_at'}
+    saved_records = []
+
+    for item, validated_data in zip(items, serializer.validated_data):
+        key = get_farm_dedup_key(
+            validated_data.get('farmer_name'), validated_data.get('collection_site'))
+        candidates = existing_farms.setdefault(key, [])
+        record = next(
+            (candidate for candidate in candidates if is_same_farm(candidate, item)), None)
+
+        if record is None:
+            record = EUDRFarmModel(**validated_data)
+            to_create.append(record)
+            # farms repeated later in the same batch update this new record
+            candidates.append(record)
+        else:
+            for field, value in validated_data.items():
+                setattr(record, field, value)
+            if record.pk:
+                record.updated_at = now
+                to_update[record.pk] = record
+                update_fields.update(validated_data.keys())
+        record.update_geometry_columns()
+        saved_records.append(record)
+
+    update_fields.update(EUDRFarmModel.GEOMETRY_FIELDS)
+    with transaction.atomic():
+        EUDRFarmModel.objects.bulk_create(to_create, batch_size=batch_size)
+        if to_update:
+            EUDRFarmModel.objects.bulk_update(
+                list(to_update.values()), sorted(update_fields), batch_size=batch_size)
+
+    return None, saved_records
+
+
+def get_records_by_key(model, key_field, keys, batch_size):
+    """
+    Retrieve the rows of a model whose key_field is one of keys, the first row of each key.
+    """
+    keys = list(keys)
+    records = {}
+    for i in range(0, len(keys), batch_size):
+        for record in model.objects.filter(
+                **{f'{key_field}__in': keys[i:i + batch_size]}).order_by('id'):
+            records.setdefault(getattr(record, key_field), record)
+    return records
+
+
+def bulk_upsert_by_key(model, key_field, rows, batch_size, new_rows=()):
+    """
+    Create or update the rows of a model matched on key_field, like update_or_create with
+    one lookup and batched writes. rows maps each key to the field values to save, new_rows
+    are always created.
+
+    Returns the saved records by key.
+    """
+    existing = get_records_by_key(model, key_field, rows.keys(), batch_size)
+    now = timezone.now()
+    to_create = [model(**values) for values in new_rows]
+    to_update = []
+    update_fields = {'updated_at'}
+    records = {}
+
+    for key, values in rows.items():
+        record = existing.get(key)
+        if record is None:
+            record = model(**values)
+            to_create.append(record)
+        else:
+            for field, value in values.items():
+                setattr(record, field, value)
+            record.updated_at = now
+            to_update.append(record)
+            update_fields.update(values.keys())
+        records[key] = record
+
+    model.objects.bulk_create(to_create, batch_size=batch_size)
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(update_fields), batch_size=batch_size)
+    return records
+
+
+def bulk_sync_farm_backups(entries, batch_size=None):
+    """
+    Save the collection sites and farms synced by the mobile app, the sites matched on their
+    name and the farms on their remote_id, in a single transaction.
+
+    Returns the remote_id of every synced farm, in the order they were sent.
+    """
+    batch_size = batch_size or settings.FARM_BULK_BATCH_SIZE
+
+    # a site or farm sent twice is saved once, its later values win
+    sites = {}
+    for entry in entries:
+        site_data = {**entry.get('collection_site'), 'device_id': entry.get('device_id')}
+        sites.setdefault(site_data['name'], {}).update(site_data)
+
+    with transaction.atomic():
+        site_records = bulk_upsert_by_key(EUDRCollectionSiteModel, 'name', sites, batch_size)
+
+        farms = {}
+        new_farms = []
+        synced_remote_ids = []
+        for entry in entries:
+            site = site_records[entry.get('collection_site')['name']]
+            for farm_data in entry.get('farms', []):
+                farm_data = {**farm_data, 'site_id': site}
+                remote_id = farm_data.get('remote_id')
+                if remote_id is None:
+                    new_farms.append(farm_data)
+                else:
+                    farms.setdefault(remote_id, {}).update(farm_data)
+                synced_remote_ids.append(remote_id)
+
+        bulk_upsert_by_key(EUDRFarmBackupModel, 'remote_id', farms, batch_size, new_rows=new_farms)
+
+    return synced_remote_ids
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from eudr_backend import settings
+
+STATS_KEY_PREFIX = "cache_stats"
+STATS_NAMESPACES_KEY = f"{STATS_KEY_PREFIX}:namespaces"
+
+_missing = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+class NamespacedCache:
+    """
+    Cache of one part of the app on top of a Django cache: keys are prefixed with the
+    namespace and every lookup is counted as a hit or a miss.
+    """
+
+    def __init__(self, namespace, alias="default"):
+        self.namespace = namespace
+        self.alias = alias
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.make_key(key), _missing)
+        hit = value is not _missing
+        record_lookups(self.namespace, hits=int(hit), misses=int(not hit))
+        return value if hit else default
+
+    def get_many(self, keys):
+        """
+        Return a dict of the cached keys and their values, the missing keys are left out.
+        """
+        keys = list(keys)
+        values = self.backend.get_many([self.make_key(key) for key in keys])
+        found = {key: values[self.make_key(key)] for key in keys if self.make_key(key) in values}
+        record_lookups(self.namespace, hits=len(found), misses=len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.backend.set(self.make_key(key), value, timeout=timeout)
+
+    def delete(self, key):
+        self.backend.delete(self.make_key(key))
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT):
+        """
+        Return the cached value, or call default and cache its result.
+        """
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = default()
+            self.set(key, value, timeout=timeout)
+        return value
+
+
+def record_lookups(namespace, hits=0, misses=0):
+    """
+    Count hits and misses in this process, adding them to the shared counters every
+    CACHE_STATS_FLUSH_INTERVAL seconds so lookups do not pay for a write each.
+    """
+    global _last_flush
+    with _stats_lock:
+        _stats[(namespace, "hits")] += hits
+        _stats[(namespace, "misses")] += misses
+        if time.monotonic() - _last_flush < settings.CACHE_STATS_FLUSH_INTERVAL:
+            return
+        pending = dict(_stats)
+        _stats.clear()
+        _last_flush = time.monotonic()
+    flush_stats(pending)
+
+
+def flush_stats(pending=None):
+    """
+    Add the counted lookups to the counters stored in the cache.
+    """
+    if pending is None:
+        with _stats_lock:
+            pending = dict(_stats)
+            _stats.clear()
+    backend = caches["default"]
+    namespaces = backend.get(STATS_NAMESPACES_KEY, set())
+    for (namespace, kind), count in pending.items():
+        namespaces.add(namespace)
+        if not count:
+            continue
+        key = f"{STATS_KEY_PREFIX}:{namespace}:{kind}"
+        # incr is not atomic on every backend, a few counts may be lost under contention
+        if not backend.add(key, count, timeout=None):
+            try:
+                backend.incr(key, count)
+            except ValueError:
+                backend.set(key, count, timeout=None)
+    backend.set(STATS_NAMESPACES_KEY, namespaces, timeout=None)
+
+
+def get_cache_stats():
+    """
+    Return the hits, misses and hit ratio of every namespace, from the shared counters.
+    """
+    backend = caches["default"]
+    stats = {}
+    for namespace in sorted(backend.get(STATS_NAMESPACES_KEY, set())):
+        hits = backend.get(f"{STATS_KEY_PREFIX}:{namespace}:hits", 0)
+        misses = backend.get(f"{STATS_KEY_PREFIX}:{namespace}:misses", 0)
+        stats[namespace] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return stats
+
+
+ee_tile_cache = NamespacedCache("ee_tiles")
+map_html_cache = NamespacedCache("map_html")
+farm_tile_cache = NamespacedCache("farm_tiles", alias="farm_tiles")
+upload_progress_cache = NamespacedCache("upload_progress")
+s3_listing_cache = NamespacedCache("s3_listing")
+dashboard_cache = NamespacedCache("dashboard")
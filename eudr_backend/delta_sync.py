@@ -0,0 +1,175 @@
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from eudr_backend import settings
+from eudr_backend.bulk_operations import bulk_sync_farm_backups
+from eudr_backend.models import EUDRCollectionSiteModel, EUDRDeletedFarmBackupModel, EUDRFarmBackupModel, EUDRSyncDeviceModel
+from eudr_backend.serializers import EUDRCollectionSiteModelSerializer, EUDRFarmBackupModelSerializer
+
+SYNC_TOKEN_SALT = "eudr_backend.delta_sync"
+# rows saved by a transaction still running when a sync reads its changes get a timestamp
+# just before the high-water mark, the next sync pulls them again from a bit earlier
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def encode_sync_token(device_id, synced_at):
+    return signing.dumps({"device_id": device_id, "synced_at": synced_at.isoformat()},
+                         salt=SYNC_TOKEN_SALT)
+
+
+def decode_sync_token(token, device_id):
+    """
+    Return the high-water mark of a sync token, raising ValueError when the token is invalid
+    or was issued to another device.
+    """
+    try:
+        data = signing.loads(token, salt=SYNC_TOKEN_SALT)
+    except signing.BadSignature as e:
+        raise ValueError("Invalid sync token") from e
+    synced_at = parse_datetime(data.get("synced_at") or "")
+    if data.get("device_id") != device_id or synced_at is None:
+        raise ValueError("Invalid sync token")
+    return synced_at
+
+
+def delete_device_farms(device_id, remote_ids):
+    """
+    Delete the backup farms of the device sites with the given remote ids, leaving a
+    tombstone for the other devices of their sites. Returns the deleted remote ids.
+    """
+    farms = list(EUDRFarmBackupModel.objects.filter(
+        remote_id__in=remote_ids, site_id__device_id=device_id).values_list('id', 'remote_id', 'site_id'))
+    if not farms:
+        return []
+    EUDRDeletedFarmBackupModel.objects.bulk_create([
+        EUDRDeletedFarmBackupModel(remote_id=remote_id, site_id_id=site_id)
+        for _, remote_id, site_id in farms
+    ], batch_size=settings.FARM_BULK_BATCH_SIZE)
+    EUDRFarmBackupModel.objects.filter(id__in=[farm_id for farm_id, _, _ in farms]).delete()
+    return [remote_id for _, remote_id, _ in farms]
+
+
+def get_device_changes(device_id, since=None, exclude_remote_ids=()):
+    """
+    Return the collection sites of a device with their farms changed since the high-water
+    mark, every farm when there is none, and the remote ids of the farms deleted since.
+
+    The farms of exclude_remote_ids, just pushed by the device, are left out of the changes
+    but not out of a full snapshot, which replaces the device data. A farm deleted then
+    created again since the mark is only sent as a change.
+    """
+    sites = {site.id: site for site in EUDRCollectionSiteModel.objects.filter(device_id=device_id)}
+    farms = EUDRFarmBackupModel.objects.filter(site_id__in=list(sites)).order_by('site_id', 'id')
+    deleted = EUDRDeletedFarmBackupModel.objects.filter(site_id__in=list(sites))
+    if since is not None:
+        farms = farms.filter(updated_at__gt=since - SYNC_OVERLAP).exclude(
+            remote_id__in=list(exclude_remote_ids))
+        deleted = deleted.filter(deleted_at__gt=since - SYNC_OVERLAP)
+
+    farms_by_site = {}
+    for farm in EUDRFarmBackupModelSerializer(farms, many=True).data:
+        farms_by_site.setdefault(farm['site_id'], []).append(farm)
+
+    changed_sites = [
+        site for site_id, site in sites.items()
+        if site_id in farms_by_site or since is None or site.updated_at > since - SYNC_OVERLAP
+    ]
+    changes = [{
+        "device_id": site.device_id,
+        "collection_site": EUDRCollectionSiteModelSerializer(site).data,
+        "farms": farms_by_site.get(site.id, []),
+    } for site in changed_sites]
+
+    if since is None:
+        return changes, []
+    # the farms existing again are sent above, the device must not delete them
+    pulled_remote_ids = {farm['remote_id'] for site_farms in farms_by_site.values() for farm in site_farms}
+    deleted_remote_ids = [
+        remote_id for remote_id in deleted.exclude(
+            remote_id__in=list(exclude_remote_ids)).values_list('remote_id', flat=True).distinct()
+        if remote_id not in pulled_remote_ids
+    ]
+    return changes, deleted_remote_ids
+
+
+def sync_device(device_id, token=None, changes=(), deleted_remote_ids=()):
+    """
+    Run one delta sync of a device: save the changes it pushes, then return the changes of
+    its sites since the high-water mark of its token, with a token for the next sync.
+
+    A device without a token, or with one older than the kept tombstones, gets a full
+    snapshot of its sites and has to replace its local copy with it.
+    """
+    since = decode_sync_token(token, device_id) if token else None
+    tombstones_kept_since = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    if since is not None and since < tombstones_kept_since:
+        since = None
+
+    with transaction.atomic():
+        synced_remote_ids = bulk_sync_farm_backups(
+            [{**entry, "device_id": device_id} for entry in changes]) if changes else []
+        deleted = delete_device_farms(device_id, list(deleted_remote_ids))
+        EUDRDeletedFarmBackupModel.objects.filter(deleted_at__lt=tombstones_kept_since).delete()
+
+    # the rows pushed above are older than the new mark, they are not sent back next time,
+    # nor in this delta
+    synced_at = timezone.now()
+    pulled_changes, pulled_deletions = get_device_changes(
+        device_id, since, exclude_remote_ids={*synced_remote_ids, *deleted} - {None})
+    # the server keeps the mark for monitoring, the device token stays the reference in
+    # case the device did not receive the response
+    EUDRSyncDeviceModel.objects.update_or_create(
+        device_id=device_id, defaults={"last_synced_at": synced_at})
+
+    return {
+        "sync_token": encode_sync_token(device_id, synced_at),
+        "full": since is None,
+        "synced_remote_ids": synced_remote_ids,
+        "synced_deleted_remote_ids": deleted,
+        "changes": pulled_changes,
+        "deleted_remote_ids": pulled_deletions,
+    }
+
+
+def get_row_fields(model):
+    """
+    Return the fields of a model as keyed by its "__all__" serializer, foreign keys by name.
+    """
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def iter_restore_data(collection_sites, chunk_size):
+    """
+    Yield the restore payload of collection sites as JSON text chunks: a list of the sites
+    with their device id and farms. The farms of every site are read in one query, as rows
+    encoded the same way as the API serializers, one site at a time.
+    """
+    # DRF's encoder writes dates the same way as the API serializers
+    encoder = JSONEncoder()
+    sites = list(collection_sites.order_by('id').values(*get_row_fields(EUDRCollectionSiteModel)))
+    farms = EUDRFarmBackupModel.objects.filter(
+        site_id__in=[site['id'] for site in sites]).order_by('site_id', 'id').values(
+        *get_row_fields(EUDRFarmBackupModel)).iterator(chunk_size=chunk_size)
+    # both the sites and the farms are ordered by site id
+    farms_by_site = groupby(farms, key=itemgetter('site_id'))
+    site_farms = next(farms_by_site, None)
+
+    yield "["
+    for i, site in enumerate(sites):
+        farms = []
+        if site_farms is not None and site_farms[0] == site['id']:
+            farms = list(site_farms[1])
+            site_farms = next(farms_by_site, None)
+        yield ("," if i else "") + encoder.encode({
+            "device_id": site['device_id'],
+            "collection_site": site,
+            "farms": farms,
+        })
+    yield "]"
@@ -0,0 +1,65 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from eudr_backend.geometry import BBOX_FIELDS
+from eudr_backend.models import EUDRFarmModel
+from eudr_backend.utils import farm_record_to_feature
+
+EXPORT_FORMATS = {
+    'geojson': ('application/geo+json', 'geojson'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def get_export_fields():
+    # attname keeps the file_id key of the file foreign key
+    return [field.attname for field in EUDRFarmModel._meta.concrete_fields
+            if field.name != 'geometry_wkb']
+
+
+def iter_farm_features(queryset, chunk_size):
+    """
+    Yield the GeoJSON feature of every farm, reading the rows in chunks of chunk_size.
+    Features get their bbox from the stored bounding box columns.
+    """
+    for record in queryset.values(*get_export_fields()).iterator(chunk_size=chunk_size):
+        bbox = [record.pop(name) for name in BBOX_FIELDS]
+        feature = farm_record_to_feature(record)
+        if feature:
+            if None not in bbox:
+                feature["bbox"] = bbox
+            yield feature
+
+
+def iter_farm_export(queryset, export_format, chunk_size):
+    """
+    Yield a farm export as text chunks, a FeatureCollection for geojson and one feature per
+    line for ndjson. Only one chunk of rows is held in memory at a time.
+    """
+    # DRF's encoder writes dates the same way as the API serializers
+    encoder = JSONEncoder()
+    chunks = iter_feature_chunks(
+        (encoder.encode(feature) for feature in iter_farm_features(queryset, chunk_size)),
+        chunk_size)
+
+    if export_format == 'ndjson':
+        for chunk in chunks:
+            yield "\n".join(chunk) + "\n"
+        return
+
+    yield '{"type": "FeatureCollection", "features": ['
+    for i, chunk in enumerate(chunks):
+        yield ("," if i else "") + ",".join(chunk)
+    yield ']}'
+
+
+def iter_feature_chunks(features, chunk_size):
+    chunk = []
+    for feature in features:
+        chunk.append(feature)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
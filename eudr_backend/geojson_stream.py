@@ -0,0 +1,145 @@
+import io
+import json
+
+import geopandas as gpd
+
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class GeoJSONFeatureReader:
+    """
+    Iterate over the features of a GeoJSON file without loading the whole collection.
+
+    The top level object is parsed member by member and the "features" array element by
+    element, so only one feature is decoded at a time. The other members (type, crs, ...)
+    are available in `collection` once iterated. Files that are not JSON are read with
+    GeoPandas instead.
+    """
+
+    def __init__(self, file, read_size=READ_SIZE):
+        self.file = file
+        self.read_size = read_size
+        self.collection = {}
+        self.has_features = False
+        self._decoder = json.JSONDecoder()
+        self._text = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        self.file.seek(0)
+        self._text = io.TextIOWrapper(self.file, encoding='utf-8-sig', errors='replace')
+        try:
+            is_json = self._peek() == '{'
+            if is_json:
+                yield from self._read_collection()
+        finally:
+            # keep the uploaded file open for the next pass and the S3 upload
+            self._text.detach()
+
+        if not is_json:
+            yield from self._read_with_geopandas()
+
+    def _read_with_geopandas(self):
+        self.file.seek(0)
+        data = json.loads(gpd.read_file(self.file).to_json())
+        self.file.seek(0)
+        self.collection = {k: v for k, v in data.items() if k != 'features'}
+        self.has_features = True
+        yield from data['features']
+
+    def _read_collection(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(':')
+            if key == 'features' and self._peek() == '[':
+                self.has_features = True
+                yield from self._read_features()
+            else:
+                self.collection[key] = self._decode()
+            if self._next_separator('}') is None:
+                break
+
+        # a single Feature is read as a collection of one feature
+        if self.collection.get('type') == 'Feature':
+            feature = self.collection
+            self.collection = {'type': 'FeatureCollection'}
+            self.has_features = True
+            yield feature
+
+    def _read_features(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._next_separator(']') is None:
+                return
+
+    def _fill(self):
+        """
+        Read the next part of the file, dropping the already parsed part of the buffer.
+        """
+        chunk = self._text.read(self.read_size)
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        self._eof = not chunk
+        return bool(chunk)
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Invalid GeoJSON: expected '{char}'")
+        self._pos += 1
+
+    def _next_separator(self, closing):
+        """
+        Consume a ',' and return it, or consume the closing bracket and return None.
+        """
+        char = self._peek()
+        if char not in (',', closing):
+            raise ValueError(f"Invalid GeoJSON: expected ',' or '{closing}'")
+        self._pos += 1
+        return char if char == ',' else None
+
+    def _decode(self):
+        """
+        Decode the next JSON value, reading more of the file while the value is incomplete.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof or not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def read_geojson_file(file):
+    """
+    Read a whole GeoJSON file into a FeatureCollection dict.
+    """
+    reader = GeoJSONFeatureReader(file)
+    features = list(reader)
+    return {**reader.collection, "features": features if reader.has_features else None}
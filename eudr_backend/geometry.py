@@ -0,0 +1,79 @@
+import shapely
+from shapely.errors import GEOSException
+
+BBOX_FIELDS = ['min_lon', 'min_lat', 'max_lon', 'max_lat']
+
+# size of a map tile in pixels
+TILE_SIZE = 256
+
+
+def build_farm_geometry(polygon, polygon_type=None):
+    """
+    Build the Shapely geometry of a farm polygon, None for points and invalid polygons.
+    """
+    if not polygon or not isinstance(polygon, list):
+        return None
+    try:
+        if polygon_type == 'MultiPolygon':
+            geometry = shapely.MultiPolygon(
+                [shapely.Polygon(rings[0], rings[1:]) for rings in polygon])
+        else:
+            geometry = shapely.Polygon(polygon[0], polygon[1:])
+    except (ValueError, TypeError, IndexError, AttributeError, GEOSException):
+        return None
+    return None if geometry.is_empty else geometry
+
+
+def get_geometry_columns(polygon, polygon_type=None, latitude=None, longitude=None):
+    """
+    Return the WKB geometry and the bounding box of a farm. Points only get a bounding box,
+    built from their latitude and longitude.
+    """
+    geometry = build_farm_geometry(polygon, polygon_type)
+    if geometry is not None:
+        return {'geometry_wkb': shapely.to_wkb(geometry), **dict(zip(BBOX_FIELDS, geometry.bounds))}
+
+    try:
+        lon, lat = float(longitude), float(latitude)
+    except (TypeError, ValueError):
+        return {'geometry_wkb': None, **dict.fromkeys(BBOX_FIELDS)}
+    return {'geometry_wkb': None, 'min_lon': lon, 'min_lat': lat, 'max_lon': lon, 'max_lat': lat}
+
+
+def read_farm_geometries(records):
+    """
+    Read the stored geometries of farm records, building the ones not stored yet from their polygon.
+    """
+    wkbs = [bytes(record.geometry_wkb) if record.geometry_wkb else None for record in records]
+    geometries = shapely.from_wkb(wkbs)
+    for i, record in enumerate(records):
+        if wkbs[i] is None:
+            geometries[i] = build_farm_geometry(record.polygon, record.polygon_type)
+    return geometries
+
+
+def get_zoom_tolerance(zoom):
+    """
+    Return the size in degrees of a pixel at the given web map zoom level.
+    """
+    return 360 / (TILE_SIZE * 2 ** zoom)
+
+
+def geometry_to_polygon(geometry):
+    """
+    Convert a Shapely polygon or multipolygon back to the nested lists stored in EUDRFarmModel.polygon.
+    """
+    if isinstance(geometry, shapely.MultiPolygon):
+        return [geometry_to_polygon(part) for part in geometry.geoms]
+    return [[list(point) for point in ring.coords]
+            for ring in [geometry.exterior, *geometry.interiors]]
+
+
+def simplify_farm_polygons(records, zoom):
+    """
+    Return the polygons of farm records simplified to the pixel size of a zoom level,
+    None for the farms without a polygon geometry.
+    """
+    geometries = shapely.simplify(
+        read_farm_geometries(records), get_zoom_tolerance(zoom), preserve_topology=True)
+    return [None if geometry is None else geometry_to_polygon(geometry) for geometry in geometries]
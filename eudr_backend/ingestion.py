@@ -0,0 +1,137 @@
+import csv
+import io
+from itertools import chain
+
+from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.utils import timezone
+
+from eudr_backend.async_tasks import perform_analysis, save_farm_data
+from eudr_backend.geojson_stream import GeoJSONFeatureReader
+from eudr_backend.models import EUDRFarmModel
+from eudr_backend.utils import csv_record_to_feature
+from eudr_backend.validators import validate_csv_rows, validate_geojson_collection, validate_geojson_features
+
+
+# number of records between two progress reports
+PROGRESS_INTERVAL = 1000
+
+
+def iter_csv_rows(file):
+    """
+    Yield the rows of an uploaded CSV file from its beginning, decoding it line by line.
+    """
+    file.seek(0)
+    text = io.TextIOWrapper(file, encoding='utf-8', errors='replace', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        # keep the uploaded file open for the next pass and the S3 upload
+        text.detach()
+
+
+def count_records(records, on_count):
+    """
+    Pass the records through, reporting the running count every PROGRESS_INTERVAL records
+    and once at the end.
+    """
+    count = 0
+    for record in records:
+        count += 1
+        if count % PROGRESS_INTERVAL == 0:
+            on_count(count)
+        yield record
+    on_count(count)
+
+
+def validate_csv_file(file, on_count=None):
+    rows = iter_csv_rows(file)
+    header = next(rows, [])
+    if on_count:
+        rows = count_records(rows, on_count)
+    return validate_csv_rows(chain([header], rows))
+
+
+def validate_geojson_file(file, on_count=None):
+    reader = GeoJSONFeatureReader(file)
+    features = iter(reader)
+    if on_count:
+        features = count_records(features, on_count)
+    try:
+        errors = validate_geojson_features(features)
+        # the validation can stop early, the members after the features are still needed
+        for _ in features:
+            pass
+    except ValueError:
+        return ['Invalid GeoJSON. Must be a dictionary']
+
+    collection_errors = validate_geojson_collection(
+        {**reader.collection, 'features': [] if reader.has_features else None})
+    return collection_errors or errors
+
+
+def validate_upload_file(file, data_format, on_count=None):
+    if data_format == 'csv':
+        return validate_csv_file(file, on_count)
+    return validate_geojson_file(file, on_count)
+
+
+def iter_feature_batches(features, batch_size):
+    """
+    Group features into FeatureCollections of at most batch_size features.
+    """
+    batch = []
+    for feature in features:
+        batch.append(feature)
+        if len(batch) >= batch_size:
+            yield {"type": "FeatureCollection", "features": batch}
+            batch = []
+    if batch:
+        yield {"type": "FeatureCollection", "features": batch}
+
+
+def iter_csv_feature_batches(file, batch_size):
+    rows = iter_csv_rows(file)
+    header = next(rows, [])
+    features = (csv_record_to_feature(dict(zip(header, row))) for row in rows)
+    return iter_feature_batches((feature for feature in features if feature), batch_size)
+
+
+def iter_upload_feature_batches(file, data_format, batch_size):
+    if data_format == 'csv':
+        return iter_csv_feature_batches(file, batch_size)
+    return iter_feature_batches(GeoJSONFeatureReader(file), batch_size)
+
+
+def ingest_feature_batches(batches, file_id, on_batch=None):
+    """
+    Analyse and save the feature batches of an upload one after the other, so only one batch
+    is held in memory. Returns the errors of the first failing batch, in which case the farms
+    the upload created in the file are deleted. on_batch is called with the size of every
+    saved batch.
+
+    The Whisp analysis runs outside of any transaction and each batch is saved in its own
+    short one, so the database is not locked for the whole upload and the cached analyses
+    are kept when a later batch fails.
+    """
+    started_at = timezone.now()
+    processed = False
+    for batch in batches:
+        errors, analysis_results = async_to_sync(perform_analysis)(batch)
+        if not errors:
+            with transaction.atomic():
+                errors, _ = async_to_sync(save_farm_data)(batch, file_id, analysis_results)
+                # save_farm_data deletes the file entry of a failed save, the callers only
+                # delete the entries they created
+                if errors:
+                    transaction.set_rollback(True)
+        if errors:
+            EUDRFarmModel.objects.filter(file_id=file_id, created_at__gte=started_at).delete()
+            return [errors]
+        processed = True
+        if on_batch:
+            on_batch(len(batch["features"]))
+
+    if not processed:
+        return [{"error": "No features found in the data."}]
+    return []
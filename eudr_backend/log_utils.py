@@ -0,0 +1,57 @@
+import json
+import logging
+import random
+
+from eudr_backend import settings
+
+# attributes every LogRecord has, the other ones come from `extra`
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line, with the fields passed in `extra`.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyPayload:
+    """
+    Debug payload serialised only when its record is emitted, cut to `limit` characters.
+    """
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = settings.LOG_PAYLOAD_LIMIT if limit is None else limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}... ({len(text)} characters)"
+        return text
+
+    __repr__ = __str__
+
+
+def log_sampled(logger, level, msg, *args, rate=None, **kwargs):
+    """
+    Log a per-feature event for a sample of the calls, LOG_SAMPLE_RATE of them by default.
+    The level is checked first so disabled events cost neither formatting nor a draw.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = settings.LOG_SAMPLE_RATE if rate is None else rate
+    if rate >= 1 or random.random() < rate:
+        logger.log(level, msg, *args, stacklevel=2, **kwargs)
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from eudr_backend import settings
+from eudr_backend.models import EUDRFarmModel
+
+
+class Command(BaseCommand):
+    help = "Fill the WKB geometry and bounding box columns of the farms saved before they existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Recompute the columns of every farm, not only the missing ones.")
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.FARM_BULK_BATCH_SIZE,
+            help="Number of farms read and written per query.")
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        farms = EUDRFarmModel.objects.only(
+            'id', 'polygon', 'polygon_type', 'latitude', 'longitude').order_by('id')
+        if not options['all']:
+            farms = farms.filter(min_lon__isnull=True)
+
+        updated = 0
+        last_id = 0
+        while True:
+            # page on the id so the updated rows do not shift the next batch
+            batch = list(farms.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            now = timezone.now()
+            for farm in batch:
+                farm.update_geometry_columns()
+                # the farm tiles and maps are cached on the last update of their farms
+                farm.updated_at = now
+            EUDRFarmModel.objects.bulk_update(batch, [*EUDRFarmModel.GEOMETRY_FIELDS, 'updated_at'])
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"Updated {updated} farms")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Filled the geometry columns of {updated} farms"))
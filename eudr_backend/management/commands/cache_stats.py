@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from eudr_backend.cache import flush_stats, get_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Show the hits, misses and hit ratio of every cache namespace."
+
+    def handle(self, *args, **options):
+        flush_stats()
+        stats = get_cache_stats()
+        if not stats:
+            self.stdout.write("No cache lookups recorded yet")
+            return
+        for namespace, counts in stats.items():
+            ratio = "-" if counts['hit_ratio'] is None else f"{counts['hit_ratio']:.2%}"
+            self.stdout.write(
+                f"{namespace}: {counts['hits']} hits, {counts['misses']} misses, hit ratio {ratio}")
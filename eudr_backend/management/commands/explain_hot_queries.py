@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from eudr_backend.models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRFarmModel, EUDRUploadedFilesModel
+
+INDEXED_MODELS = [EUDRFarmModel, EUDRUploadedFilesModel, EUDRFarmBackupModel, EUDRCollectionSiteModel]
+
+
+def get_hot_queries():
+    """
+    Return the (name, queryset) of the lookups made by the busiest endpoints, with values
+    taken from the first rows of the database.
+    """
+    farm = EUDRFarmModel.objects.order_by('id').first()
+    uploaded_file = EUDRUploadedFilesModel.objects.order_by('id').first()
+    backup = EUDRFarmBackupModel.objects.order_by('id').first()
+    site = EUDRCollectionSiteModel.objects.order_by('id').first()
+    file_id = uploaded_file.id if uploaded_file else 0
+    uploaded_by = uploaded_file.uploaded_by if uploaded_file else ""
+    now = timezone.now()
+
+    return [
+        ("farm list of the user's files", EUDRFarmModel.objects.filter(
+            file_id__in=[file_id]).order_by('-updated_at')),
+        ("farms of a file waiting for a geoid", EUDRFarmModel.objects.filter(
+            geoid__isnull=True, file_id=file_id)),
+        ("duplicate farm lookup", EUDRFarmModel.objects.filter(
+            farmer_name=farm.farmer_name if farm else "",
+            collection_site=farm.collection_site if farm else "")),
+        ("latest updated farms", EUDRFarmModel.objects.order_by('-updated_at')[:50]),
+        ("dashboard farm count", EUDRFarmModel.objects.filter(
+            created_at__range=(now - timedelta(days=30), now)).values('id')),
+        ("files of a user", EUDRUploadedFilesModel.objects.filter(
+            uploaded_by=uploaded_by).order_by('-updated_at')),
+        ("file entry of an upload", EUDRUploadedFilesModel.objects.filter(
+            uploaded_by=uploaded_by, file_name=uploaded_file.file_name if uploaded_file else "")),
+        ("backup farm sync", EUDRFarmBackupModel.objects.filter(
+            remote_id=backup.remote_id if backup else "")),
+        ("collection site sync", EUDRCollectionSiteModel.objects.filter(
+            name=site.name if site else "")),
+        ("collection sites of a device", EUDRCollectionSiteModel.objects.filter(
+            device_id=site.device_id if site else "")),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Show the query plans of the hot lookups with and without the model indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--after-only', action='store_true',
+            help="Only show the plans with the indexes.")
+
+    def handle(self, *args, **options):
+        queries = get_hot_queries()
+        # SQLite reuses the plans of statements it already compiled, read the ones with
+        # the indexes last
+        before = None if options['after_only'] else self.explain_without_indexes(queries)
+        after = [queryset.explain() for _, queryset in queries]
+
+        for i, (name, _) in enumerate(queries):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if before is not None:
+                self.stdout.write("  without indexes:")
+                self.stdout.write(self.indent(before[i]))
+                self.stdout.write("  with indexes:")
+            self.stdout.write(self.indent(after[i]))
+
+    def explain_without_indexes(self, queries):
+        """
+        Drop the indexes declared on the models in a transaction that is rolled back once
+        the plans are read.
+        """
+        schema_editor = connection.schema_editor()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for model in INDEXED_MODELS:
+                    for index in model._meta.indexes:
+                        cursor.execute(schema_editor.sql_delete_index % {
+                            "table": schema_editor.quote_name(model._meta.db_table),
+                            "name": schema_editor.quote_name(index.name),
+                        })
+            plans = [queryset.explain() for _, queryset in queries]
+            transaction.set_rollback(True)
+        return plans
+
+    def indent(self, plan):
+        return "\n".join(f"    {line}" for line in plan.splitlines())
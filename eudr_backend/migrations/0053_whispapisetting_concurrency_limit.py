@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0052_delete_eudrusermodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whispapisetting',
+            name='concurrency_limit',
+            field=models.PositiveIntegerField(default=4, help_text='Maximum number of WHISP API chunks submitted at the same time.'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0053_whispapisetting_concurrency_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='whispapisetting',
+            name='cache_max_entries',
+            field=models.PositiveIntegerField(default=100000, help_text='Maximum number of cached WHISP analyses to keep.'),
+        ),
+        migrations.AddField(
+            model_name='whispapisetting',
+            name='cache_ttl_days',
+            field=models.PositiveIntegerField(default=30, help_text='Number of days a cached WHISP analysis stays valid.'),
+        ),
+        migrations.AddField(
+            model_name='whispapisetting',
+            name='dataset_version',
+            field=models.CharField(default='v1', help_text='Tag of the WHISP datasets version, changing it invalidates cached analyses.', max_length=255),
+        ),
+        migrations.CreateModel(
+            name='WhispAnalysisCacheModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geometry_hash', models.CharField(max_length=64)),
+                ('commodity', models.CharField(max_length=255)),
+                ('dataset_version', models.CharField(max_length=255)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('geometry_hash', 'commodity', 'dataset_version')},
+            },
+        ),
+    ]
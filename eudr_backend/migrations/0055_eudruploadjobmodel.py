@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-17 20:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0054_whispanalysiscachemodel_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EUDRUploadJobModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('data_format', models.CharField(max_length=255)),
+                ('uploaded_by', models.CharField(max_length=255)),
+                ('stored_file', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=255)),
+                ('stage', models.CharField(choices=[('queued', 'Queued'), ('validating', 'Validating'), ('processing', 'Analysing and saving'), ('storing', 'Storing file'), ('done', 'Done')], default='queued', max_length=255)),
+                ('total_records', models.PositiveIntegerField(default=0)),
+                ('processed_records', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('file_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
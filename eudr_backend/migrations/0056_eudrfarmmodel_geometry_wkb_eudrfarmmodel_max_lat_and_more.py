@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0055_eudruploadjobmodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eudrfarmmodel',
+            name='geometry_wkb',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eudrfarmmodel',
+            name='max_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eudrfarmmodel',
+            name='max_lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eudrfarmmodel',
+            name='min_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eudrfarmmodel',
+            name='min_lon',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0056_eudrfarmmodel_geometry_wkb_eudrfarmmodel_max_lat_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['min_lon', 'max_lon'], name='farm_bbox_lon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['min_lat', 'max_lat'], name='farm_bbox_lat_idx'),
+        ),
+    ]
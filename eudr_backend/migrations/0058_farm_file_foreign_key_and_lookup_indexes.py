@@ -0,0 +1,85 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+ORPHAN_BATCH_SIZE = 500
+
+
+def clear_orphan_file_ids(apps, schema_editor):
+    """
+    Null the farm file ids that are not the id of an uploaded file, so the column can
+    become a foreign key.
+    """
+    farm_model = apps.get_model('eudr_backend', 'EUDRFarmModel')
+    file_model = apps.get_model('eudr_backend', 'EUDRUploadedFilesModel')
+    file_ids = set(file_model.objects.values_list('id', flat=True))
+    orphans = [
+        file_id for file_id in farm_model.objects.exclude(file_id__isnull=True).values_list(
+            'file_id', flat=True).distinct()
+        if not (file_id.strip().isdigit() and int(file_id) in file_ids)
+    ]
+    # update() leaves updated_at as it is
+    for i in range(0, len(orphans), ORPHAN_BATCH_SIZE):
+        farm_model.objects.filter(file_id__in=orphans[i:i + ORPHAN_BATCH_SIZE]).update(file_id=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0057_eudrfarmmodel_farm_bbox_lon_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_orphan_file_ids, migrations.RunPython.noop),
+        # keep the file_id column while the field becomes file
+        migrations.AlterField(
+            model_name='eudrfarmmodel',
+            name='file_id',
+            field=models.CharField(blank=True, db_column='file_id', max_length=255, null=True),
+        ),
+        migrations.RenameField(
+            model_name='eudrfarmmodel',
+            old_name='file_id',
+            new_name='file',
+        ),
+        migrations.AlterField(
+            model_name='eudrfarmmodel',
+            name='file',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='farms', to='eudr_backend.eudruploadedfilesmodel'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['file', '-updated_at'], name='farm_file_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(condition=models.Q(('geoid__isnull', True)), fields=['file'], name='farm_missing_geoid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['farmer_name', 'collection_site'], name='farm_name_site_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['-updated_at'], name='farm_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmmodel',
+            index=models.Index(fields=['created_at'], name='farm_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmbackupmodel',
+            index=models.Index(fields=['remote_id'], name='backup_remote_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrcollectionsitemodel',
+            index=models.Index(fields=['name'], name='site_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrcollectionsitemodel',
+            index=models.Index(fields=['device_id'], name='site_device_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudruploadedfilesmodel',
+            index=models.Index(fields=['uploaded_by', 'file_name'], name='file_uploader_name_idx'),
+        ),
+    ]
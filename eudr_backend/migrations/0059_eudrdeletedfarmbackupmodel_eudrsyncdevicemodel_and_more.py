@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eudr_backend', '0058_farm_file_foreign_key_and_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EUDRDeletedFarmBackupModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remote_id', models.CharField(max_length=255)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EUDRSyncDeviceModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=255, unique=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='eudrfarmbackupmodel',
+            index=models.Index(fields=['site_id', 'updated_at'], name='backup_site_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='eudrdeletedfarmbackupmodel',
+            name='site_id',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='eudr_backend.eudrcollectionsitemodel'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrdeletedfarmbackupmodel',
+            index=models.Index(fields=['site_id', 'deleted_at'], name='deleted_backup_site_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eudrdeletedfarmbackupmodel',
+            index=models.Index(fields=['deleted_at'], name='deleted_backup_date_idx'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from eudr_backend.geometry import BBOX_FIELDS, get_geometry_columns
 from my_eudr_app import models
 
 
@@ -20,13 +21,71 @@ class EUDRFarmModel(models.models.Model):
     is_validated = models.models.BooleanField(default=False)
     analysis = models.models.JSONField(null=True, blank=True)
     validated_at = models.models.DateTimeField(null=True, blank=True)
-    file_id = models.models.CharField(max_length=255, null=True, blank=True)
+    # farm lookups by file go through the file + updated_at index
+    file = models.models.ForeignKey(
+        "EUDRUploadedFilesModel", on_delete=models.models.SET_NULL, null=True, blank=True,
+        related_name="farms", db_index=False)
+    geometry_wkb = models.models.BinaryField(null=True, blank=True, editable=False)
+    min_lon = models.models.FloatField(null=True, blank=True)
+    min_lat = models.models.FloatField(null=True, blank=True)
+    max_lon = models.models.FloatField(null=True, blank=True)
+    max_lat = models.models.FloatField(null=True, blank=True)
     created_at = models.models.DateTimeField(auto_now_add=True)
     updated_at = models.models.DateTimeField(auto_now=True)
 
+    # columns computed from polygon, polygon_type, latitude and longitude
+    GEOMETRY_FIELDS = ['geometry_wkb', *BBOX_FIELDS]
+
+    class Meta:
+        indexes = [
+            # used by the bbox filter of the farm list endpoints
+            models.models.Index(fields=['min_lon', 'max_lon'], name='farm_bbox_lon_idx'),
+            models.models.Index(fields=['min_lat', 'max_lat'], name='farm_bbox_lat_idx'),
+            # farm lists of files, ordered by their last update
+            models.models.Index(fields=['file', '-updated_at'], name='farm_file_updated_idx'),
+            # farms of a file still waiting for their geoid
+            models.models.Index(fields=['file'], condition=models.models.Q(geoid__isnull=True),
+                                name='farm_missing_geoid_idx'),
+            # duplicate farm lookups of the uploads
+            models.models.Index(fields=['farmer_name', 'collection_site'], name='farm_name_site_idx'),
+            models.models.Index(fields=['-updated_at'], name='farm_updated_idx'),
+            # dashboard date ranges
+            models.models.Index(fields=['created_at'], name='farm_created_idx'),
+        ]
+
     def __str__(self):
         return self.farmer_name
 
+    def update_geometry_columns(self):
+        """
+        Compute the WKB geometry and bounding box columns. bulk_create and bulk_update
+        do not call save(), so the bulk paths call this themselves.
+        """
+        for name, value in get_geometry_columns(
+                self.polygon, self.polygon_type, self.latitude, self.longitude).items():
+            setattr(self, name, value)
+
+    def save(self, *args, **kwargs):
+        self.update_geometry_columns()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *self.GEOMETRY_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class WhispAnalysisCacheModel(models.models.Model):
+    geometry_hash = models.models.CharField(max_length=64)
+    commodity = models.models.CharField(max_length=255)
+    dataset_version = models.models.CharField(max_length=255)
+    result = models.models.JSONField()
+    created_at = models.models.DateTimeField(auto_now_add=True)
+    last_used_at = models.models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('geometry_hash', 'commodity', 'dataset_version')
+
+    def __str__(self):
+        return self.geometry_hash
+
 
 class EUDRFarmBackupModel(models.models.Model):
     remote_id = models.models.CharField(max_length=255, null=True, blank=True)
@@ -45,10 +104,50 @@ class EUDRFarmBackupModel(models.models.Model):
     created_at = models.models.DateTimeField(auto_now_add=True)
     updated_at = models.models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # the mobile sync updates the backups by remote_id
+            models.models.Index(fields=['remote_id'], name='backup_remote_id_idx'),
+            # farms of the device sites changed since its last delta sync
+            models.models.Index(fields=['site_id', 'updated_at'], name='backup_site_updated_idx'),
+        ]
+
     def __str__(self):
         return self.remote_id
 
 
+class EUDRDeletedFarmBackupModel(models.models.Model):
+    """
+    Tombstone of a deleted backup farm, pulled by the devices of its site in the delta sync.
+    """
+    remote_id = models.models.CharField(max_length=255)
+    site_id = models.models.ForeignKey(
+        "EUDRCollectionSiteModel", on_delete=models.models.CASCADE, null=True, blank=True)
+    deleted_at = models.models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.models.Index(fields=['site_id', 'deleted_at'], name='deleted_backup_site_idx'),
+            models.models.Index(fields=['deleted_at'], name='deleted_backup_date_idx'),
+        ]
+
+    def __str__(self):
+        return self.remote_id
+
+
+class EUDRSyncDeviceModel(models.models.Model):
+    """
+    High-water mark of the last delta sync of a mobile device.
+    """
+    device_id = models.models.CharField(max_length=255, unique=True)
+    last_synced_at = models.models.DateTimeField(null=True, blank=True)
+    created_at = models.models.DateTimeField(auto_now_add=True)
+    updated_at = models.models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.device_id
+
+
 class EUDRCollectionSiteModel(models.models.Model):
     name = models.models.CharField(max_length=255)
     local_cs_id = models.models.CharField(max_length=255, null=True)
@@ -63,6 +162,13 @@ class EUDRCollectionSiteModel(models.models.Model):
     created_at = models.models.DateTimeField(auto_now_add=True)
     updated_at = models.models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # the mobile sync looks the sites up by name and device
+        indexes = [
+            models.models.Index(fields=['name'], name='site_name_idx'),
+            models.models.Index(fields=['device_id'], name='site_device_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -73,10 +179,50 @@ class EUDRUploadedFilesModel(models.models.Model):
     created_at = models.models.DateTimeField(auto_now_add=True)
     updated_at = models.models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # files of a user, and the file entry of an upload
+        indexes = [
+            models.models.Index(fields=['uploaded_by', 'file_name'], name='file_uploader_name_idx'),
+        ]
+
     def __str__(self):
         return self.file_name
 
 
+class EUDRUploadJobModel(models.models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    STAGE_CHOICES = [
+        ('queued', 'Queued'),
+        ('validating', 'Validating'),
+        ('processing', 'Analysing and saving'),
+        ('storing', 'Storing file'),
+        ('done', 'Done'),
+    ]
+
+    file_name = models.models.CharField(max_length=255)
+    data_format = models.models.CharField(max_length=255)
+    uploaded_by = models.models.CharField(max_length=255)
+    stored_file = models.models.CharField(max_length=255)
+    status = models.models.CharField(
+        max_length=255, choices=STATUS_CHOICES, default='pending')
+    stage = models.models.CharField(
+        max_length=255, choices=STAGE_CHOICES, default='queued')
+    total_records = models.models.PositiveIntegerField(default=0)
+    processed_records = models.models.PositiveIntegerField(default=0)
+    errors = models.models.JSONField(default=list, blank=True)
+    file_id = models.models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.models.DateTimeField(auto_now_add=True)
+    updated_at = models.models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
+
+
 class EUDRSharedMapAccessCodeModel(models.models.Model):
     file_id = models.models.CharField(max_length=255)
     access_code = models.models.CharField(max_length=255)
@@ -91,6 +237,14 @@ class EUDRSharedMapAccessCodeModel(models.models.Model):
 class WhispAPISetting(models.models.Model):
     chunk_size = models.models.PositiveIntegerField(
         default=500, help_text="Size of WHISP API data chunks to fetch.")
+    concurrency_limit = models.models.PositiveIntegerField(
+        default=4, help_text="Maximum number of WHISP API chunks submitted at the same time.")
+    dataset_version = models.models.CharField(
+        max_length=255, default="v1", help_text="Tag of the WHISP datasets version, changing it invalidates cached analyses.")
+    cache_ttl_days = models.models.PositiveIntegerField(
+        default=30, help_text="Number of days a cached WHISP analysis stays valid.")
+    cache_max_entries = models.models.PositiveIntegerField(
+        default=100000, help_text="Maximum number of cached WHISP analyses to keep.")
 
     def __str__(self):
         return f"Whisp API Settings (Chunk Size: {self.chunk_size})"
@@ -0,0 +1,188 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.response import Response
+
+from eudr_backend.geometry import simplify_farm_polygons
+from eudr_backend.serializers import EUDRFarmModelSerializer, EUDRFarmSummarySerializer
+from eudr_backend.services import filter_by_bbox
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+MAX_ZOOM = 24
+
+FARM_LIST_PARAMETERS = [
+    openapi.Parameter(
+        name="limit",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        required=False,
+        description=f"Page size (max {MAX_PAGE_SIZE}). When set, the response is "
+                    "{results, next_cursor} and polygon/analysis are left out unless listed in fields",
+    ),
+    openapi.Parameter(
+        name="cursor",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="next_cursor of the previous page",
+    ),
+    openapi.Parameter(
+        name="fields",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="Comma separated list of the farm fields to return",
+    ),
+    openapi.Parameter(
+        name="bbox",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="min_lon,min_lat,max_lon,max_lat: only the farms intersecting this box are returned",
+    ),
+    openapi.Parameter(
+        name="zoom",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        required=False,
+        description=f"Map zoom level (0-{MAX_ZOOM}): polygons are simplified to the pixel size of this zoom",
+    ),
+]
+
+
+def encode_cursor(farm):
+    position = json.dumps([farm.updated_at.isoformat(), farm.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return the (updated_at, id) position stored in a cursor, raise ValueError when it is not valid.
+    """
+    try:
+        updated_at, farm_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        updated_at = parse_datetime(updated_at)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
+    if updated_at is None or not isinstance(farm_id, int):
+        raise ValueError("Invalid cursor")
+    return updated_at, farm_id
+
+
+def get_requested_fields(request):
+    """
+    Return the fields listed in the fields query parameter, None when it is not set.
+    """
+    fields = request.query_params.get("fields")
+    if not fields:
+        return None
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(fields) - set(EUDRFarmModelSerializer().fields)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def get_page_size(request):
+    limit = request.query_params.get("limit")
+    if not limit:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except ValueError as e:
+        raise ValueError("limit must be an integer") from e
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def get_bbox(request):
+    """
+    Return the (min_lon, min_lat, max_lon, max_lat) box of the bbox query parameter, None when it is not set.
+    """
+    bbox = request.query_params.get("bbox")
+    if not bbox:
+        return None
+    try:
+        min_lon, min_lat, max_lon, max_lat = [float(value) for value in bbox.split(",")]
+    except ValueError as e:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat") from e
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not be greater than its maximums")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def get_zoom(request):
+    zoom = request.query_params.get("zoom")
+    if not zoom:
+        return None
+    try:
+        zoom = int(zoom)
+    except ValueError as e:
+        raise ValueError("zoom must be an integer") from e
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def serialize_farms(farms, zoom, serializer_class=EUDRFarmModelSerializer, **kwargs):
+    """
+    Serialize farms, simplifying their polygons to the zoom level when one is given.
+    """
+    farms = list(farms)
+    data = serializer_class(farms, many=True, **kwargs).data
+    if zoom is not None and data and "polygon" in data[0]:
+        for farm, polygon in zip(data, simplify_farm_polygons(farms, zoom)):
+            if polygon is not None:
+                farm["polygon"] = polygon
+    return data
+
+
+def farm_list_response(request, queryset):
+    """
+    Serialize a farm queryset for the list endpoints.
+
+    Without limit, cursor or fields the full list is returned as before. Otherwise the farms are
+    paginated on (updated_at, id), newest first, and only the requested fields are loaded.
+    bbox keeps the farms in a map viewport and zoom simplifies their polygons in every mode.
+    """
+    paginate = "limit" in request.query_params or "cursor" in request.query_params
+    try:
+        fields = get_requested_fields(request)
+        bbox = get_bbox(request)
+        zoom = get_zoom(request)
+        if bbox:
+            queryset = filter_by_bbox(queryset, bbox)
+        # the stored geometries are simplified instead of the polygon JSON
+        geometry_fields = ["geometry_wkb", "polygon_type"] if zoom is not None else []
+        if not paginate:
+            if fields is None:
+                return Response(serialize_farms(queryset, zoom))
+            return Response(serialize_farms(
+                queryset.only(*fields, *geometry_fields, "id"), zoom,
+                EUDRFarmSummarySerializer, fields=fields))
+
+        page_size = get_page_size(request)
+        cursor = request.query_params.get("cursor")
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer_fields = fields or EUDRFarmSummarySerializer.summary_fields()
+    queryset = queryset.only(
+        *serializer_fields, *geometry_fields, "id", "updated_at").order_by("-updated_at", "-id")
+    if position:
+        updated_at, farm_id = position
+        queryset = queryset.filter(
+            Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=farm_id))
+
+    # fetch one extra row to know whether there is a next page
+    farms = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(farms[page_size - 1]) if len(farms) > page_size else None
+    farms = farms[:page_size]
+
+    return Response({
+        "results": serialize_farms(farms, zoom, EUDRFarmSummarySerializer, fields=serializer_fields),
+        "next_cursor": next_cursor,
+    })
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRFarmModel, EUDRSharedMapAccessCodeModel, EUDRUploadedFilesModel
+from .models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRFarmModel, EUDRSharedMapAccessCodeModel, EUDRUploadedFilesModel, EUDRUploadJobModel
 from django.contrib.auth.models import User
 
 
@@ -10,10 +10,58 @@ class EUDRUserModelSerializer(serializers.ModelSerializer):
                   'username', 'is_active', 'date_joined', 'is_staff', 'is_superuser']
 
 
+class UploadedFileIdField(serializers.PrimaryKeyRelatedField):
+    """
+    File of a farm, read and written by id. Unknown ids are rejected, each id is only
+    looked up once per serializer so the farms of an upload share one query.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=EUDRUploadedFilesModel.objects.all(), allow_null=True,
+                         required=False, **kwargs)
+
+    def to_representation(self, value):
+        # ids stored before the foreign key may still be read as text
+        return int(value.pk)
+
+    def to_internal_value(self, data):
+        files = self.__dict__.setdefault('_files', {})
+        if str(data) not in files:
+            files[str(data)] = super().to_internal_value(data)
+        return files[str(data)]
+
+
 class EUDRFarmModelSerializer(serializers.ModelSerializer):
+    file_id = UploadedFileIdField(source='file')
+
     class Meta:
         model = EUDRFarmModel
-        fields = "__all__"
+        exclude = ['geometry_wkb', 'file']
+
+
+class EUDRFarmSummarySerializer(serializers.ModelSerializer):
+    """
+    Farm list entry restricted to the given fields, without the geometry and analysis by default.
+    """
+    detail_fields = ('polygon', 'accuracies', 'analysis')
+
+    file_id = UploadedFileIdField(source='file')
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = set(fields or self.summary_fields())
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+    @classmethod
+    def summary_fields(cls):
+        return [field.attname for field in EUDRFarmModel._meta.concrete_fields
+                if field.name not in cls.detail_fields and field.name != 'geometry_wkb']
+
+    class Meta:
+        model = EUDRFarmModel
+        exclude = ['geometry_wkb', 'file']
 
 
 class EUDRUploadedFilesModelSerializer(serializers.ModelSerializer):
@@ -38,3 +86,12 @@ class EUDRSharedMapAccessCodeModelSerializer(serializers.ModelSerializer):
     class Meta:
         model = EUDRSharedMapAccessCodeModel
         fields = "__all__"
+
+
+class EUDRUploadJobModelSerializer(serializers.ModelSerializer):
+    # sent as an integer like the file ids of the farms
+    file_id = serializers.IntegerField(allow_null=True, read_only=True)
+
+    class Meta:
+        model = EUDRUploadJobModel
+        exclude = ['stored_file']
@@ -0,0 +1,135 @@
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from eudr_backend import settings
+from eudr_backend.geometry import read_farm_geometries
+from eudr_backend.models import EUDRFarmModel, EUDRSharedMapAccessCodeModel, EUDRUploadedFilesModel
+from eudr_backend.serializers import EUDRFarmModelSerializer
+from eudr_backend.spatial import find_overlapping_farms, find_overlapping_pairs
+
+
+def get_uploader_name(user):
+    return user.username if user.is_authenticated else "admin"
+
+
+def get_user_file_ids(user):
+    """
+    Return the ids of the files uploaded by the user.
+    """
+    return list(EUDRUploadedFilesModel.objects.filter(
+        uploaded_by=get_uploader_name(user)).values_list('id', flat=True))
+
+
+def get_map_farms(user):
+    """
+    Farms shown on the map: all farms for staff, the farms of the user's files otherwise.
+    """
+    if user.is_staff:
+        return EUDRFarmModel.objects.all().order_by("-updated_at")
+    return EUDRFarmModel.objects.filter(
+        file_id__in=get_user_file_ids(user)).order_by("-updated_at")
+
+
+def filter_by_bbox(queryset, bbox):
+    """
+    Keep the farms whose bounding box intersects the (min_lon, min_lat, max_lon, max_lat) box.
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return queryset.filter(
+        max_lon__gte=min_lon, min_lon__lte=max_lon, max_lat__gte=min_lat, min_lat__lte=max_lat)
+
+
+def check_map_access_code(file_id, access_code):
+    """
+    Return None when the access code opens the map of the file, the error message otherwise.
+    """
+    access_record = EUDRSharedMapAccessCodeModel.objects.filter(
+        file_id=file_id, access_code=access_code).first()
+    if access_record is None:
+        return "Invalid file ID or access code."
+    if access_record.valid_until and access_record.valid_until < timezone.now():
+        return "Access Code Expired"
+    return None
+
+
+def get_tile_farms(user, file_id=None, farm_id=None, shared=False):
+    """
+    Farms drawn on the map tiles: every farm of the file when it is opened with an access
+    code, the user's map farms otherwise.
+    """
+    farms = get_file_farms(file_id) if shared else get_map_farms(user)
+    if file_id:
+        farms = farms.filter(file_id=file_id)
+    if farm_id:
+        farms = farms.filter(id=farm_id)
+    return farms
+
+
+def get_map_view_queryset(user, file_id=None, farm_id=None):
+    """
+    Farms drawn by map_view, as a queryset: the farm, the file's farms or the user's map farms.
+    """
+    if farm_id:
+        return EUDRFarmModel.objects.filter(id=farm_id)
+    if file_id:
+        return get_file_farms(file_id)
+    return get_map_farms(user)
+
+
+def get_farms_version(queryset):
+    """
+    Return a version of a set of farms that changes whenever one of them is saved, added or deleted.
+    """
+    version = queryset.order_by().aggregate(updated_at=Max('updated_at'), count=Count('id'))
+    updated_at = version['updated_at'].timestamp() if version['updated_at'] else 0
+    return f"{updated_at}:{version['count']}"
+
+
+def get_file_farms(file_id):
+    return EUDRFarmModel.objects.filter(file_id=file_id)
+
+
+def get_overlapping_farms(file_id):
+    """
+    Return the serialized farms of a file overlapping at least one other farm of the same file.
+    """
+    farms = list(EUDRFarmModel.objects.filter(
+        file_id=file_id).order_by("-updated_at"))
+    return find_overlapping_farms(
+        EUDRFarmModelSerializer(farms, many=True).data, read_farm_geometries(farms))
+
+
+def get_farm_geometries(farm_ids, batch_size=None):
+    """
+    Return the geometries of the given farms in the same order, read from their stored WKB.
+    """
+    batch_size = batch_size or settings.FARM_BULK_BATCH_SIZE
+    records = {}
+    for i in range(0, len(farm_ids), batch_size):
+        records.update((record.id, record) for record in EUDRFarmModel.objects.filter(
+            id__in=farm_ids[i:i + batch_size]).only('id', 'geometry_wkb', 'polygon', 'polygon_type'))
+    found = list(records.values())
+    geometries = dict(zip((record.id for record in found), read_farm_geometries(found)))
+    return [geometries.get(farm_id) for farm_id in farm_ids]
+
+
+def filter_overlapping_farms(queryset):
+    """
+    Keep the farms of a queryset overlapping at least one other farm of the same queryset.
+    """
+    farm_ids = list(queryset.order_by('id').values_list('id', flat=True))
+    pairs = find_overlapping_pairs(get_farm_geometries(farm_ids))
+    return queryset.filter(id__in={farm_ids[k] for i, j, _ in pairs for k in (i, j)})
+
+
+def get_map_view_farm(user, file_id=None, farm_id=None, overlapping=False):
+    """
+    Return the farm a map is zoomed to: the requested farm, or the latest farm of the file or
+    of the user's map farms. None when there is no farm to draw.
+    """
+    queryset = get_map_view_queryset(user, file_id, farm_id)
+    if overlapping and file_id and not farm_id:
+        queryset = filter_overlapping_farms(queryset)
+    return queryset.order_by('-updated_at', '-id').only(
+        'id', 'polygon_type', 'latitude', 'longitude',
+        'min_lon', 'min_lat', 'max_lon', 'max_lat').first()
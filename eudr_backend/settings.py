@@ -85,11 +85,46 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 ]
 
+# Caches shared by every worker process, stored in files without an external service.
+# Once a cache holds MAX_ENTRIES files, every write deletes a third of them at random, so
+# the farm vector tiles, written by the dozen for every map, have their own cache and
+# do not push the Earth Engine URLs, upload progress and hit counters out of the default one
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "/var/tmp/django_cache",
-    }
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": config('CACHE_LOCATION', default='/var/tmp/django_cache'),
+        "OPTIONS": {"MAX_ENTRIES": config('CACHE_MAX_ENTRIES', default=5000, cast=int)},
+    },
+    "farm_tiles": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": config('FARM_TILE_CACHE_LOCATION', default='/var/tmp/django_farm_tile_cache'),
+        # every write lists the cached files, a larger cache makes the writes slower
+        "OPTIONS": {"MAX_ENTRIES": config('FARM_TILE_CACHE_MAX_ENTRIES', default=20000, cast=int)},
+    },
+}
+
+# Cache hit and miss counts are added to the shared counters at most this often, in seconds
+CACHE_STATS_FLUSH_INTERVAL = config('CACHE_STATS_FLUSH_INTERVAL', default=10, cast=int)
+
+# The app loggers write one JSON object per line. Below WARNING the upload path logs
+# debug payloads, cut to LOG_PAYLOAD_LIMIT characters, and LOG_SAMPLE_RATE of its
+# per-feature events
+LOG_LEVEL = config('LOG_LEVEL', default='WARNING')
+LOG_SAMPLE_RATE = config('LOG_SAMPLE_RATE', default=0.01, cast=float)
+LOG_PAYLOAD_LIMIT = config('LOG_PAYLOAD_LIMIT', default=2000, cast=int)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "structured": {"()": "eudr_backend.log_utils.StructuredFormatter"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "structured"},
+    },
+    "loggers": {
+        "eudr_backend": {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False},
+        "my_eudr_app": {"handlers": ["console"], "level": LOG_LEVEL, "propagate": False},
+    },
 }
 
 SWAGGER_SETTINGS = {
@@ -124,6 +159,35 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100 MB
 
 FILE_UPLOAD_MAX_MEMORY_SIZE = 104857600  # 100 MB
 
+# Number of farm rows written per bulk_create/bulk_update query
+FARM_BULK_BATCH_SIZE = config('FARM_BULK_BATCH_SIZE', default=500, cast=int)
+
+# Number of farm rows read per query when streaming an export
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Deleted backup farms are pulled by the delta sync for this many days, devices that did
+# not sync for longer get a full snapshot instead
+SYNC_TOMBSTONE_RETENTION_DAYS = config('SYNC_TOMBSTONE_RETENTION_DAYS', default=90, cast=int)
+
+# Number of features of an uploaded file analysed and saved at a time
+INGEST_BATCH_SIZE = config('INGEST_BATCH_SIZE', default=5000, cast=int)
+
+# Earth Engine tile URLs of the reference layers are cached for the lifetime of the EE
+# access token and refreshed in the background shortly before they expire
+EE_TILE_CACHE_TIMEOUT = config('EE_TILE_CACHE_TIMEOUT', default=3600, cast=int)
+EE_TILE_REFRESH_MARGIN = config('EE_TILE_REFRESH_MARGIN', default=300, cast=int)
+
+# Farm vector tiles are cached per scope and data version, so they only expire to free space
+VECTOR_TILE_CACHE_TIMEOUT = config('VECTOR_TILE_CACHE_TIMEOUT', default=86400, cast=int)
+
+# Rendered map documents are versioned on their farms and reference tile URLs, they
+# cannot outlive the Earth Engine tile URLs they embed
+MAP_HTML_CACHE_TIMEOUT = config('MAP_HTML_CACHE_TIMEOUT', default=EE_TILE_CACHE_TIMEOUT, cast=int)
+
+# The S3 listing is also dropped whenever a file is stored, the dashboard metrics only expire
+S3_LISTING_CACHE_TIMEOUT = config('S3_LISTING_CACHE_TIMEOUT', default=300, cast=int)
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=300, cast=int)
+
 LOGIN_URL = 'login'
 
 LOGIN_REDIRECT_URL = 'home'
@@ -208,6 +272,8 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AGSTACK_EMAIL = config('AGSTACK_API_EMAIL')
 AGSTACK_PASSWORD = config('AGSTACK_API_PASSWORD')
+# Number of field boundaries registered with AgStack at the same time
+AGSTACK_CONCURRENCY = config('AGSTACK_CONCURRENCY', default=8, cast=int)
 WHISP_API_KEY = config('WHISP_API_KEY')
 
 # email credentials
@@ -231,5 +297,24 @@ AWS_S3_BASE_URL = (
     f"https://{AWS_STORAGE_BUCKET_NAME}.s3.{AWS_S3_REGION_NAME}.amazonaws.com/"
 )
 
-# Django-storages config
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+# Django-storages config. "upload_jobs" keeps the uploaded files until the background
+# worker processes them, so the web and worker processes must both reach it: the file
+# system storage only works when they share UPLOAD_JOB_LOCATION, use
+# storages.backends.s3boto3.S3Boto3Storage when they run on different hosts (the location
+# is then a prefix in the bucket)
+UPLOAD_JOB_STORAGE = config(
+    'UPLOAD_JOB_STORAGE', default='django.core.files.storage.FileSystemStorage')
+UPLOAD_JOB_LOCATION = config(
+    'UPLOAD_JOB_LOCATION', default=os.path.join(BASE_DIR, 'media', 'upload_jobs'))
+STORAGES = {
+    "default": {
+        "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "upload_jobs": {
+        "BACKEND": UPLOAD_JOB_STORAGE,
+        "OPTIONS": {"location": UPLOAD_JOB_LOCATION},
+    },
+}
@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.errors import GEOSException
+
+from eudr_backend.utils import flatten_multipolygon_coordinates
+
+# length of one degree of latitude in metres
+METRES_PER_DEGREE = 111320
+
+
+def get_farm_ring(farm):
+    """
+    Return the single ring used to compare a farm with the others, or None for points
+    and polygons with holes.
+    """
+    polygon = farm.get('polygon')
+    if not polygon or not isinstance(polygon, list):
+        return None
+    if farm.get('polygon_type') == 'MultiPolygon':
+        polygon = flatten_multipolygon_coordinates(polygon)
+    if len(polygon) != 1:
+        return None
+    return flatten_multipolygon_coordinates(polygon)[0]
+
+
+def build_farm_geometries(farms):
+    """
+    Build one Shapely polygon per farm, None when the farm has no usable polygon.
+    """
+    geometries = np.empty(len(farms), dtype=object)
+    for i, farm in enumerate(farms):
+        ring = get_farm_ring(farm)
+        try:
+            geometries[i] = shapely.polygons(ring) if ring else None
+        except (ValueError, TypeError, GEOSException):
+            geometries[i] = None
+    return geometries
+
+
+def approximate_area_hectares(geometries):
+    """
+    Approximate the area in hectares of lon/lat geometries, scaling by the latitude of their centroids.
+    """
+    latitudes = shapely.get_y(shapely.centroid(geometries))
+    scale = METRES_PER_DEGREE ** 2 * np.cos(np.radians(latitudes)) / 10000
+    return shapely.area(geometries) * scale
+
+
+def find_overlapping_pairs(geometries):
+    """
+    Find the pairs of overlapping geometries with an STRtree.
+
+    Returns a list of (first index, second index, overlap area in hectares) with first < second.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    valid_indices = np.flatnonzero(shapely.is_geometry(geometries))
+    if len(valid_indices) < 2:
+        return []
+
+    valid_geometries = geometries[valid_indices]
+    tree = STRtree(valid_geometries)
+    left, right = tree.query(valid_geometries, predicate='intersects')
+    unique_pairs = left < right
+    left, right = left[unique_pairs], right[unique_pairs]
+
+    overlapping = shapely.overlaps(valid_geometries[left], valid_geometries[right])
+    left, right = left[overlapping], right[overlapping]
+    if not len(left):
+        return []
+
+    intersections = shapely.intersection(
+        shapely.make_valid(valid_geometries[left]), shapely.make_valid(valid_geometries[right]))
+    areas = approximate_area_hectares(intersections)
+
+    return [
+        (int(valid_indices[i]), int(valid_indices[j]), float(area) if math.isfinite(area) else 0.0)
+        for i, j, area in zip(left, right, areas)
+    ]
+
+
+def find_overlapping_farms(farms, geometries=None):
+    """
+    Return the farms overlapping at least one other farm, each with the list of farms it
+    overlaps and the overlap area. The geometries are built from the farms' polygons when
+    they are not given.
+    """
+    if geometries is None:
+        geometries = build_farm_geometries(farms)
+    overlaps = {}
+    for i, j, area in find_overlapping_pairs(geometries):
+        overlaps.setdefault(i, []).append(
+            {"farm_id": farms[j].get('id'), "overlap_area_ha": round(area, 6)})
+        overlaps.setdefault(j, []).append(
+            {"farm_id": farms[i].get('id'), "overlap_area_ha": round(area, 6)})
+
+    return [
+        {**farm, "overlaps": overlaps[i]}
+        for i, farm in enumerate(farms) if i in overlaps
+    ]
@@ -1,74 +1,115 @@
-import requests
+import asyncio
+import logging
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.utils import timezone
 from shapely import Polygon
 
 from eudr_backend import settings
-from .models import EUDRFarmModel, EUDRUploadedFilesModel
+from .models import EUDRFarmModel
+from .upload_jobs import run_upload_job
 from background_task import background
 from shapely import wkt
 
+logger = logging.getLogger(__name__)
+
 AG_BASE_URL = "https://api-ar.agstack.org"
 
 
-def get_access_token():
+async def get_access_token(client):
     login_url = f'{AG_BASE_URL}/login'
     payload = {
         "email": settings.AGSTACK_EMAIL,
         "password": settings.AGSTACK_PASSWORD
     }
-    response = requests.post(login_url, json=payload)
+    response = await client.post(login_url, json=payload)
     response.raise_for_status()  # Raise an error for bad responses
     data = response.json()
-    print("login successfully",data)
+    logger.debug("Logged in to AgStack")
     return data['access_token']
 
 
-# @background(schedule=60)  # Schedule task to run every 5 minutes
-def update_geoid(user_id):
-    access_token = get_access_token()
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'Content-Type': 'application/json'
-    }
-    # Get all file IDs corresponding to the user
-    user_files = EUDRUploadedFilesModel.objects.filter(uploaded_by=user_id)
-    file_ids = user_files.values_list('id', flat=True)
-
-    print("fileids",file_ids)
-
-    # Filter farms based on these file IDs and geoid being null
-    farms = EUDRFarmModel.objects.filter(
-        geoid__isnull=True, file_id__in=file_ids)
-    for farm in farms:
-        print("Raw polygon value:", farm.polygon)
-        # check if polygon has only one ring
-        if len(farm.polygon) != 1:
-            continue
+def get_farm_wkt(farm):
+    """
+    Return the WKT of a single ring farm polygon, None for points, multi ring and invalid polygons.
+    """
+    # check if polygon has only one ring
+    if not isinstance(farm.polygon, list) or len(farm.polygon) != 1:
+        return None
+    try:
+        return wkt.dumps(Polygon(farm.polygon[0]))
+    except (ValueError, TypeError):
+        return None
 
-        reversed_coords = [[(lat, lon) for lat, lon in ring]
-                           for ring in farm.polygon]
 
-        # Create a Shapely Polygon
-        polygon = Polygon(reversed_coords[0])
+async def register_field_boundary(client, semaphore, headers, farm_wkt):
+    """
+    Register a field boundary with AgStack and return its geoid, the matched one if it
+    was already registered.
+    """
+    async with semaphore:
+        response = await client.post(
+            f'{AG_BASE_URL}/register-field-boundary',
+            json={"wkt": farm_wkt},
+            headers=headers
+        )
+    data = response.json()
+    if response.status_code == 200:
+        return data.get("Geo Id")
+    matched_geo_ids = data.get("matched geo ids") or []
+    return matched_geo_ids[0] if matched_geo_ids else None
 
-        print("converted polygon",polygon )
 
-        # Convert to WKT format
-        wkt_format = wkt.dumps(polygon)
+async def register_file_geoids(file_id):
+    """
+    Register the farms of a file that have no geoid yet and save the returned geoids.
+    """
+    farms = await sync_to_async(list)(EUDRFarmModel.objects.filter(
+        geoid__isnull=True, file_id=file_id).only('id', 'polygon', 'geoid'))
+    farm_wkts = [(farm, get_farm_wkt(farm)) for farm in farms]
+    farm_wkts = [(farm, farm_wkt) for farm, farm_wkt in farm_wkts if farm_wkt]
+    if not farm_wkts:
+        return []
 
-        print("WKT format",wkt_format)
+    semaphore = asyncio.Semaphore(max(settings.AGSTACK_CONCURRENCY, 1))
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        access_token = await get_access_token(client)
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        geoids = await asyncio.gather(*[
+            register_field_boundary(client, semaphore, headers, farm_wkt)
+            for _, farm_wkt in farm_wkts
+        ], return_exceptions=True)
 
-        response = requests.post(
-            f'{AG_BASE_URL}/register-field-boundary',
-            json={"wkt": wkt_format},
-            headers=headers
-        )
-        print("API response status:", response.status_code)
-        print("API response text:", response.text)
-        data = response.json()
-        print("geo id data", data)
-        if response.status_code == 200:
-            farm.geoid = data.get("Geo Id")
-            farm.save()
-        else:
-            farm.geoid = data.get("matched geo ids")[0]
-            farm.save()
+    now = timezone.now()
+    updated_farms = []
+    for (farm, _), geoid in zip(farm_wkts, geoids):
+        if isinstance(geoid, Exception):
+            # the farm keeps a null geoid, the other farms are still saved
+            logger.warning("Failed to register farm %s: %s", farm.id, geoid,
+                           extra={"farm_id": farm.id, "file_id": file_id})
+            continue
+        if geoid:
+            farm.geoid = geoid
+            farm.updated_at = now
+            updated_farms.append(farm)
+
+    await sync_to_async(EUDRFarmModel.objects.bulk_update)(
+        updated_farms, ['geoid', 'updated_at'], batch_size=settings.FARM_BULK_BATCH_SIZE)
+    return updated_farms
+
+
+@background(schedule=0)
+def update_geoid(file_id):
+    async_to_sync(register_file_geoids)(file_id)
+
+
+@background(schedule=0)
+def process_upload_job(job_id):
+    file_id = run_upload_job(job_id)
+    if file_id:
+        # register the geoids of the new farms in the background worker
+        update_geoid(file_id)
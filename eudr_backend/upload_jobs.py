@@ -0,0 +1,112 @@
+import logging
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.files.storage import storages
+
+from eudr_backend import settings
+from eudr_backend.cache import upload_progress_cache
+from eudr_backend.ingestion import ingest_feature_batches, iter_upload_feature_batches, validate_upload_file
+from eudr_backend.models import EUDRUploadedFilesModel, EUDRUploadJobModel
+from eudr_backend.utils import store_file_in_s3
+
+logger = logging.getLogger(__name__)
+
+def get_upload_job_storage():
+    return storages["upload_jobs"]
+
+
+def store_upload_job(file, data_format, uploaded_by):
+    """
+    Keep a copy of the uploaded file for the worker and create its pending job.
+    """
+    stored_file = get_upload_job_storage().save(f"{uuid.uuid4()}_{file.name}", file)
+    return EUDRUploadJobModel.objects.create(
+        file_name=file.name.split('.')[0],
+        data_format=data_format,
+        uploaded_by=uploaded_by,
+        stored_file=stored_file,
+    )
+
+
+def get_processed_records(job):
+    """
+    Return the number of saved records, read from the cache while the job is saving.
+
+    The count is only written to the job row once every batch is saved, the cache is
+    updated after each batch is committed.
+    """
+    if job.status == 'running' and job.stage == 'processing':
+        return upload_progress_cache.get(job.id, job.processed_records)
+    return job.processed_records
+
+
+def update_upload_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.save(update_fields=[*fields, 'updated_at'])
+
+
+def run_upload_job(job_id):
+    """
+    Validate, analyse and save the records of an upload job, then store its file in S3.
+
+    Returns the id of the uploaded file entry, None when the job failed.
+    """
+    job = EUDRUploadJobModel.objects.get(id=job_id)
+    update_upload_job(job, status='running')
+    try:
+        with get_upload_job_storage().open(job.stored_file, 'rb') as file:
+            return process_upload(job, file)
+    except Exception:
+        logger.exception("Upload job %s failed", job.id, extra={"job_id": job.id})
+        update_upload_job(job, status='failed', errors=[
+                          {"error": "Error while processing the uploaded file."}])
+        return None
+    finally:
+        upload_progress_cache.delete(job.id)
+        get_upload_job_storage().delete(job.stored_file)
+
+
+def process_upload(job, file):
+    user = User.objects.get(username=job.uploaded_by)
+
+    update_upload_job(job, stage='validating')
+    errors = validate_upload_file(
+        file, job.data_format,
+        on_count=lambda count: update_upload_job(job, total_records=count))
+    if errors:
+        file.seek(0)
+        store_file_in_s3(file, user, job.file_name)
+        update_upload_job(job, status='failed', errors=errors)
+        return None
+
+    # a file uploaded again under the same name adds its farms to the existing entry
+    uploaded_file, created = EUDRUploadedFilesModel.objects.get_or_create(
+        file_name=f"{job.file_name}.{job.data_format}", uploaded_by=job.uploaded_by)
+    update_upload_job(job, stage='processing', file_id=str(uploaded_file.id))
+
+    processed = 0
+
+    def report_batch(size):
+        nonlocal processed
+        processed += size
+        upload_progress_cache.set(job.id, processed, timeout=None)
+
+    errors = ingest_feature_batches(
+        iter_upload_feature_batches(file, job.data_format, settings.INGEST_BATCH_SIZE),
+        uploaded_file.id, report_batch)
+    if errors:
+        # the farms of the earlier uploads stay in the entry they were saved in
+        if created:
+            uploaded_file.delete()
+        file.seek(0)
+        store_file_in_s3(file, user, job.file_name)
+        update_upload_job(job, status='failed', errors=errors)
+        return None
+
+    update_upload_job(job, stage='storing', processed_records=processed)
+    file.seek(0)
+    store_file_in_s3(file, user, job.file_name, True)
+    update_upload_job(job, status='completed', stage='done')
+    return uploaded_file.id
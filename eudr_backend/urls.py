@@ -21,9 +21,12 @@ from django.urls import include, path, re_path
 
 from eudr_backend.views import (
     create_farm_data,
+    create_upload_job,
     create_user,
     delete_user,
+    delta_sync_farm_data,
     download_template,
+    export_farm_data,
     generate_map_link,
     restore_farm_data,
     retrieve_all_synced_farm_data,
@@ -32,11 +35,13 @@ from eudr_backend.views import (
     retrieve_farm_data,
     retrieve_farm_data_from_file_id,
     retrieve_farm_detail,
+    retrieve_farm_tile,
     retrieve_file,
     retrieve_files,
     retrieve_map_data,
     retrieve_overlapping_farm_data,
     retrieve_s3_files,
+    retrieve_upload_job,
     retrieve_user,
     retrieve_user_farm_data,
     retrieve_users,
@@ -101,8 +106,12 @@ urlpatterns = [
     path("api/users/update/<int:pk>/", update_user, name="user_update"),
     path("api/users/delete/<int:pk>/", delete_user, name="user_delete"),
     path("api/farm/add/", create_farm_data, name="create_farm_data"),
+    path("api/farm/upload/", create_upload_job, name="create_upload_job"),
+    path("api/farm/upload/<int:pk>/", retrieve_upload_job,
+         name="retrieve_upload_job"),
     path("api/farm/update/<int:pk>/", update_farm_data, name="update_farm_data"),
     path("api/farm/sync/", sync_farm_data, name="sync_farm_data"),
+    path("api/farm/sync/delta/", delta_sync_farm_data, name="delta_sync_farm_data"),
     path("api/farm/restore/", restore_farm_data, name="restore_farm_data"),
     path("api/farm/revalidate/", revalidate_farm_data,
          name="revalidate_farm_data"),
@@ -128,6 +137,9 @@ urlpatterns = [
         retrieve_farm_data_from_file_id,
         name="retrieve_farm_data_from_file_id",
     ),
+    path("api/farm/export/", export_farm_data, name="export_farm_data"),
+    path("api/farm/tiles/<int:z>/<int:x>/<int:y>.mvt", retrieve_farm_tile,
+         name="retrieve_farm_tile"),
     path("api/download-template/", download_template, name="download_template"),
     path("api/map-share/", generate_map_link, name="map_share"),
 
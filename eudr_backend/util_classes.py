@@ -1,5 +1,12 @@
+import gzip
+import io
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import BasePermission
 
+from eudr_backend import settings
+
 
 class IsSuperUser(BasePermission):
     """
@@ -8,3 +15,24 @@ class IsSuperUser(BasePermission):
 
     def has_permission(self, request, view):
         return request.user and request.user.is_superuser
+
+
+class GzipJSONParser(JSONParser):
+    """
+    JSON parser that also reads request bodies sent with a gzip Content-Encoding.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '') if request is not None else ''
+        if stream is not None and encoding.lower() == 'gzip':
+            limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+            try:
+                with gzip.GzipFile(fileobj=stream) as body:
+                    data = body.read(limit + 1)
+            except (OSError, EOFError) as e:
+                raise ParseError(f"Invalid gzip request body - {e}")
+            if len(data) > limit:
+                raise ParseError("The decompressed request body is too large.")
+            stream = io.BytesIO(data)
+        return super().parse(stream, media_type, parser_context)
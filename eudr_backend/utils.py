@@ -1,14 +1,45 @@
 import ast
 import csv
+import hashlib
 import json
+import logging
 import uuid
 
 import boto3
 import pandas as pd
-import geopandas as gpd
 from eudr_backend import settings
+from eudr_backend.cache import s3_listing_cache
+from eudr_backend.geojson_stream import read_geojson_file
+from eudr_backend.log_utils import log_sampled
 from eudr_backend.models import EUDRUploadedFilesModel
 
+logger = logging.getLogger(__name__)
+
+S3_LISTING_CACHE_KEY = "objects"
+
+# Whisp risk property of each commodity
+COMMODITY_RISK_MAP = {
+    "Coffee": "risk_pcrop",
+    "Cocoa": "risk_pcrop",
+    "Rubber": "risk_acrop",
+    "Oil palm": "risk_acrop",
+    "Soy": "risk_acrop",
+    "Livestock": "risk_livestock",
+    "Timber": "risk_timber",
+}
+DEFAULT_COMMODITY = "Coffee"
+# the mobile app sends the commodities in upper case
+COMMODITY_RISK_KEYS = {commodity.casefold(): key for commodity, key in COMMODITY_RISK_MAP.items()}
+
+
+def get_commodity_risk_key(commodity):
+    """
+    Return the Whisp risk property of a commodity whatever its case, the one of the
+    default commodity for the commodities without their own.
+    """
+    return COMMODITY_RISK_KEYS.get(
+        str(commodity).casefold(), COMMODITY_RISK_MAP[DEFAULT_COMMODITY])
+
 
 def flatten_multipolygon(multipolygon):
     """
@@ -42,31 +73,35 @@ def flatten_multipolygon_coordinates(multipolygon_coords):
     return [flattened_coordinates]
 
 
+def farm_record_to_feature(record):
+    """
+    Convert a farm record to a GeoJSON feature, None when it has no coordinates.
+    """
+    # check if latitude, longitude, and polygon fields are not found in the record, skip the record
+    if 'latitude' not in record or 'longitude' not in record:
+        return None
+    if not record.get('polygon') or record.get('polygon') in [''] or ((len(record.get('polygon', [])) == 1 and not isinstance(record.get('polygon', [])[0], list))):
+        geometry = {
+            "type": "Point",
+            "coordinates": [float(record['longitude']), float(record['latitude'])]
+        }
+    else:
+        geometry = {
+            "type": "Polygon",
+            "coordinates": ast.literal_eval(record.get('polygon', '[]')) if type(record.get('polygon', '[]')) == str else record.get('polygon', '[]')
+        }
+    return {
+        "type": "Feature",
+        "geometry": geometry,
+        "properties": {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
+    }
+
+
 def transform_db_data_to_geojson(data, isSyncing=False):
     features = []
     for record in data:
-        # check if latitude, longitude, and polygon fields are not found in the record, skip the record
-        if 'latitude' not in record or 'longitude' not in record:
-            continue
-        if not record.get('polygon') or record.get('polygon') in [''] or ((len(record.get('polygon', [])) == 1 and not isinstance(record.get('polygon', [])[0], list))):
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [float(record['longitude']), float(record['latitude'])]
-                },
-                "properties": {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
-            }
-            features.append(feature)
-        else:
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": ast.literal_eval(record.get('polygon', '[]')) if type(record.get('polygon', '[]')) == str else record.get('polygon', '[]')
-                },
-                "properties": {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
-            }
+        feature = farm_record_to_feature(record)
+        if feature:
             features.append(feature)
 
     geojson = {
@@ -78,6 +113,41 @@ def transform_db_data_to_geojson(data, isSyncing=False):
     return geojson
 
 
+def csv_record_to_feature(record):
+    """
+    Convert a CSV record to a GeoJSON feature, None when it has no coordinates or its polygon can not be parsed.
+    """
+    # Ensure that latitude, longitude, and polygon fields exist
+    if 'latitude' not in record or 'longitude' not in record:
+        return None
+
+    properties = {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
+
+    # Handle empty or missing polygon field
+    if not record['polygon'] or record['polygon'] in ['']:
+        return {
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [float(record['longitude']), float(record['latitude'])]
+            },
+            "properties": properties
+        }
+    try:
+        coordinates = ast.literal_eval(record['polygon'])
+    except (ValueError, SyntaxError):
+        # Skip record if polygon parsing fails
+        return None
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [coordinates]
+        },
+        "properties": properties
+    }
+
+
 def transform_csv_to_json(data):
     features = []
 
@@ -87,38 +157,9 @@ def transform_csv_to_json(data):
     # Iterate over data starting from the second row (actual data)
     for row in data[1:]:
         # Create a record as a dictionary mapping headers to row values
-        record = dict(zip(headers, row))
-
-        # Ensure that latitude, longitude, and polygon fields exist
-        if 'latitude' not in record or 'longitude' not in record:
-            continue
-
-        # Handle empty or missing polygon field
-        if not record['polygon'] or record['polygon'] in ['']:
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [float(record['longitude']), float(record['latitude'])]
-                },
-                "properties": {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
-            }
+        feature = csv_record_to_feature(dict(zip(headers, row)))
+        if feature:
             features.append(feature)
-        else:
-            try:
-                coordinates = ast.literal_eval(record['polygon'])
-                feature = {
-                    "type": "Feature",
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": [coordinates]
-                    },
-                    "properties": {k: v for k, v in record.items() if k not in ['latitude', 'longitude', 'polygon']}
-                }
-                features.append(feature)
-            except (ValueError, SyntaxError):
-                # Skip record if polygon parsing fails
-                continue
 
     geojson = {
         "type": "FeatureCollection",
@@ -204,6 +245,34 @@ def flatten_geojson(geojson):
 #     return formatted_data_list
 
 
+def get_analysis_properties(result):
+    """
+    Return the properties of a Whisp result, which is a GeoJSON feature or already a
+    flat dict of properties.
+    """
+    if not result:
+        return {}
+    if 'properties' in result:
+        return result['properties'] or {}
+    return result
+
+
+def match_analysis_results(features, analysis):
+    """
+    Return the Whisp properties of each feature. The results are in the order of the
+    features when there is one per feature, otherwise they are matched on the feature id.
+    """
+    analysis = analysis or []
+    if len(analysis) == len(features):
+        return [get_analysis_properties(result) for result in analysis]
+
+    results_by_id = {
+        result.get('id'): get_analysis_properties(result)
+        for result in analysis if result and result.get('id') is not None
+    }
+    return [results_by_id.get(feature.get('id'), {}) for feature in features]
+
+
 def format_geojson_data(geojson, analysis, file_id=None):
     """
     Format GeoJSON data with proper field mapping and transformations
@@ -226,80 +295,6 @@ def format_geojson_data(geojson, analysis, file_id=None):
             return value
         return 0 if keep_zero else None
     
-    # Mapping of commodity to corresponding risk key
-    COMMODITY_RISK_MAP = {
-        "Coffee": "risk_pcrop",
-        "Cocoa": "risk_pcrop",
-        "Rubber": "risk_acrop",
-        "Oil palm": "risk_acrop",
-        "Soy": "risk_acrop",
-        "Livestock": "risk_livestock",
-        "Timber": "risk_timber"
-    }
-
-
-    def extract_risk_level_by_commodity(analysis_result, commodity):
-        try:
-            properties = analysis_result[0]['properties']
-            commodity = properties.get("commodity", "Coffee")  # Default to 'Coffee' if missing
-            risk_key = COMMODITY_RISK_MAP.get(commodity)
-
-            if risk_key and risk_key in properties:
-                return properties[risk_key]
-            else:
-                print(f"No risk key found for commodity: {commodity}")
-                return None
-
-        except (IndexError, KeyError, TypeError) as e:
-            print(f"Error extracting risk level for {commodity}: {e}")
-            return None
-
-    
-    # def derive_eudr_risk_level(properties):
-    #     """Derive EUDR risk level from individual risk fields"""
-    #     # risk_fields = ['risk_pcrop', 'risk_acrop', 'risk_timber']
-    #     # risk_values = [properties.get(field) for field in risk_fields if properties.get(field)]
-        
-    #     risk_values= properties.get('risk_pcrop')
-    #     # if not risk_values:
-    #     #     return 'low'  # Default to 'low' instead of None
-
-    #     print("risk value",risk_values)
-            
-    #     # Priority order: high > medium > low > more_info_needed
-    #     if 'high' in risk_values:
-    #         return 'high'
-    #     elif 'medium' in risk_values:
-    #         return 'medium'
-    #     elif 'low' in risk_values:
-    #         return 'low'
-    #     elif 'more_info_needed' in risk_values:
-    #         return 'more_info_needed'
-    #     # else:
-    #     #     return 'low'  # Default fallback
-
-    def extract_risk_levels(analysis_result):
-        try:
-            properties = analysis_result[0]['properties']
-            risk_keys = ['risk_pcrop', 'risk_acrop', 'risk_timber']
-            
-            risk_values = {}
-            for key in risk_keys:
-                if key in properties:
-                    risk_values[key] = properties[key]
-                else:
-                    # Optionally skip or handle missing keys
-                    risk_values[key] = None  # or simply skip adding it
-            
-            return risk_values  # Dictionary of actual values or None if not found
-
-        except (IndexError, KeyError, TypeError) as e:
-            print(f"Error extracting risk levels: {e}")
-            return None
-        
-    
-    risk_info = extract_risk_levels(analysis)
-
     # Ensure the GeoJSON contains features
     geojson = json.loads(geojson) if isinstance(geojson, str) else geojson
     features = geojson.get('features', [])
@@ -307,17 +302,14 @@ def format_geojson_data(geojson, analysis, file_id=None):
         return []
 
     formatted_data_list = []
-    for i, feature in enumerate(features):
+    feature_analyses = match_analysis_results(features, analysis)
+    for feature, feature_analysis in zip(features, feature_analyses):
         properties = feature.get('properties', {})
         geometry = feature.get('geometry', {})
-
-        risk_info_commodity = extract_risk_level_by_commodity( analysis, commodity=properties.get("commodity") or "Coffee",)
-        print(risk_info_commodity)
-        
-        # # Debug: Print available property keys for first feature
-        # if i == 0:
-        #     print(f"Available property keys: {list(properties.keys())}")
-        #     print(f"Analysis array length: {len(analysis) if analysis else 0}")
+        commodity = properties.get("commodity") or DEFAULT_COMMODITY
+        if not feature_analysis:
+            log_sampled(logger, logging.DEBUG, "No Whisp result for feature %s of file %s",
+                        properties.get("remote_id"), file_id)
 
         # Determine if the geometry is a Polygon and extract coordinates
         is_polygon = geometry.get('type') == 'Polygon' or geometry.get('type') == 'MultiPolygon'
@@ -343,10 +335,6 @@ def format_geojson_data(geojson, analysis, file_id=None):
         #     merged_data = {**properties, **feature_analysis}
         # else:
         #     merged_data = properties
-        feature_analysis = {}
-        if analysis and i < len(analysis) and analysis[i]:
-            feature_analysis = analysis[i]
-        
         # Debug: Print analysis data for first feature
         # if i == 0 and feature_analysis:
         #     print(f"Analysis data keys: {list(feature_analysis.keys())}")
@@ -360,7 +348,7 @@ def format_geojson_data(geojson, analysis, file_id=None):
         
         formatted_data = {
             "remote_id": properties.get("remote_id"),
-            "commodity":properties.get("commodity") or "Coffee",
+            "commodity": commodity,
             "farmer_name": properties.get("farmer_name"),
             "farm_size": float(properties.get("farm_size", properties.get('Area', properties.get('Plot_area_ha', 0)))),
             "collection_site": properties.get("collection_site"),
@@ -449,7 +437,7 @@ def format_geojson_data(geojson, analysis, file_id=None):
                     # derive_eudr_risk_level(properties) or 
                     # derive_eudr_risk_level(feature_analysis) 
                     # risk_info['risk_pcrop']
-                   risk_info_commodity
+                    feature_analysis.get(get_commodity_risk_key(commodity))
                 )
             }
         }
@@ -477,6 +465,50 @@ def reverse_polygon_points(polygon):
     return reversed_polygon
 
 
+def normalize_ring(ring, precision=7):
+    """
+    Round a ring's points, drop the closing point and start it from its smallest point
+    so the same ring always gives the same list whatever its starting vertex.
+    """
+    points = [[round(float(value), precision) for value in point[:2]] for point in ring]
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+    if not points:
+        return points
+
+    # use a counter-clockwise orientation for every ring
+    signed_area = sum(
+        x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]))
+    if signed_area < 0:
+        points.reverse()
+
+    start = points.index(min(points))
+    return points[start:] + points[:start]
+
+
+def compute_geometry_hash(geometry, precision=7):
+    """
+    Compute a content hash of a GeoJSON geometry that ignores coordinate noise
+    beyond `precision` decimals, ring starting points and ring orientation.
+    """
+    geometry_type = geometry.get('type')
+    coordinates = geometry.get('coordinates', [])
+
+    if geometry_type == 'Point':
+        normalized = [round(float(value), precision) for value in coordinates[:2]]
+    elif geometry_type == 'Polygon':
+        normalized = [normalize_ring(ring, precision) for ring in coordinates]
+    elif geometry_type == 'MultiPolygon':
+        normalized = sorted(
+            [normalize_ring(ring, precision) for ring in polygon] for polygon in coordinates)
+    else:
+        normalized = coordinates
+
+    payload = json.dumps(
+        {"type": geometry_type, "coordinates": normalized}, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
 def generate_access_code():
     return str(uuid.uuid4())
 
@@ -490,9 +522,7 @@ def extract_data_from_file(file, data_format):
             for row in reader:
                 data.append(row)
         elif data_format == 'geojson':
-            data = gpd.read_file(file)
-            # convert to geojson
-            data = json.loads(data.to_json())
+            data = read_geojson_file(file)
         else:
             raise ValueError(
                 "Unsupported data format. Please use 'csv' or 'geojson'.")
@@ -501,6 +531,24 @@ def extract_data_from_file(file, data_format):
         raise e
 
 
+def list_s3_objects():
+    """
+    Return the Key, LastModified and Size of the objects in the bucket. The listing is
+    cached for S3_LISTING_CACHE_TIMEOUT seconds and dropped when a file is stored.
+    """
+    def list_objects():
+        s3 = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
+        response = s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+        return [
+            {key: content.get(key) for key in ('Key', 'LastModified', 'Size')}
+            for content in response.get('Contents', [])
+        ]
+
+    return s3_listing_cache.get_or_set(
+        S3_LISTING_CACHE_KEY, list_objects, timeout=settings.S3_LISTING_CACHE_TIMEOUT)
+
+
 def store_file_in_s3(file, user, file_name, is_failed=False):
     # Store the file in the AWS S3 bucket's failed directory
     if file:
@@ -513,11 +561,13 @@ def store_file_in_s3(file, user, file_name, is_failed=False):
             f"{folder}/{user.username}_{file_name}", 
             ExtraArgs={'ACL': 'public-read'}
         )
+        s3_listing_cache.delete(S3_LISTING_CACHE_KEY)
 
 
 
 def handle_failed_file_entry(file_serializer, file, user):
     if "id" in file_serializer.data:
-        EUDRUploadedFilesModel.objects.get(
+        # the analysis step may already have deleted the file entry
+        EUDRUploadedFilesModel.objects.filter(
             id=file_serializer.data.get("id")).delete()
     store_file_in_s3(file, user, file_serializer.data.get('file_name'))
\ No newline at end of file
@@ -1,6 +1,16 @@
 import json
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
 from eudr_backend.utils import is_valid_polygon
 
+# number of CSV records validated in one columnar pass
+VALIDATION_BATCH_SIZE = 10000
+
+_invalid = object()
+
 
 REQUIRED_FIELDS = [
     'farmer_name',
@@ -36,11 +46,10 @@ GEOJSON_REQUIRED_FIELDS = ['geometry',
                            ]
 
 
-def validate_csv(data):
+def validate_csv_header(header):
     errors = []
 
     # Check if required fields are present in the header
-    header = data[0]
     for field in REQUIRED_FIELDS:
         if field not in header:
             errors.append(f'"{field}" is required.')
@@ -51,51 +60,180 @@ def validate_csv(data):
     for field in header:
         if field not in REQUIRED_FIELDS and field not in OPTIONAL_FIELDS:
             errors.append(f'"{field}" is not a valid field.')
-    if len(errors) > 0:
-        return errors
+    return errors
 
-    # Check each record for data validation
-    for i, record in enumerate(data[1:], start=1):
-        record_dict = dict(zip(header, record))
 
-        # Validate numerical fields
-        if not record_dict.get('latitude'):
-            record_dict['latitude'] = 0.0
+def parse_number_column(values):
+    """
+    Parse a column of CSV values the way float() does.
 
-        if not record_dict.get('longitude'):
-            record_dict['longitude'] = 0.0
+    Returns the parsed numbers and a mask of the values float() accepts. Most values are
+    parsed in one vectorized pass, the ones pandas rejects are checked with float().
+    """
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(numbers)
+    # pandas rejects some values float() accepts, like "nan" or padded numbers
+    for i in np.flatnonzero(~valid):
         try:
-            float(record_dict['farm_size'])
-        except (ValueError, KeyError):
-            errors.append(f'Record {i}: "farm_size" must be a number.')
+            numbers[i] = float(values.iat[i])
+            valid[i] = True
+        except (TypeError, ValueError):
+            pass
+    return numbers, valid
 
-        try:
-            float(record_dict['latitude'])
-        except (ValueError, KeyError):
-            errors.append(f'Record {i}: "latitude" must be a number.')
 
-        try:
-            float(record_dict['longitude'])
-        except (ValueError, KeyError):
-            errors.append(f'Record {i}: "longitude" must be a number.')
+def is_empty_column(values):
+    return (values.isna() | (values == '')).to_numpy()
+
+
+def get_csv_column(frame, header, field):
+    """
+    Return the column of a field, the last one when the header repeats it.
+    """
+    if field not in header:
+        return pd.Series([None] * len(frame), dtype=object)
+    position = len(header) - 1 - header[::-1].index(field)
+    if position >= frame.shape[1]:
+        return pd.Series([None] * len(frame), dtype=object)
+    return frame.iloc[:, position]
 
-        # Validate polygon field
+
+def is_joinable_json(texts):
+    """
+    Return a mask of the texts that can be parsed inside a joined JSON array: without
+    strings and with as many closing as opening brackets, a text can not open a value
+    that the next one closes.
+    """
+    return (~texts.str.contains('"', regex=False)
+            & (texts.str.count(r'\[') == texts.str.count(r'\]'))
+            & (texts.str.count('{') == texts.str.count('}'))).to_numpy()
+
+
+def parse_joined_json(texts):
+    """
+    Parse joinable JSON texts with one json.loads call, halving the texts around the
+    invalid ones. Returns the parsed values, _invalid for the texts json.loads rejects.
+    """
+    if not texts:
+        return []
+    try:
+        values = json.loads(f"[{','.join(texts)}]")
+        # a text holding several values shifts the others
+        if len(values) == len(texts):
+            return values
+    except ValueError:
+        pass
+    if len(texts) == 1:
+        return [_invalid]
+    middle = len(texts) // 2
+    return parse_joined_json(texts[:middle]) + parse_joined_json(texts[middle:])
+
+
+def parse_json_column(values):
+    """
+    Parse a column of JSON texts the way json.loads does.
+
+    Returns the parsed values and a mask of the texts json.loads accepts. Most texts are
+    parsed in one joined json.loads call, the ones with strings or unbalanced brackets
+    one by one.
+    """
+    texts = values.astype(str)
+    parsed = np.empty(len(texts), dtype=object)
+    joinable = is_joinable_json(texts)
+    joined_indices = np.flatnonzero(joinable)
+    for i, value in zip(joined_indices, parse_joined_json(list(texts.iloc[joined_indices]))):
+        parsed[i] = value
+    for i in np.flatnonzero(~joinable):
         try:
-            polygon = record_dict.get('polygon', '')
-            if polygon:
-                if float(record_dict['farm_size']) >= 4 and not is_valid_polygon(json.loads(polygon)):
-                    errors.append(
-                        f'Record {i}: Should have valid polygon format.')
-                elif not is_valid_polygon(json.loads(polygon)):
-                    errors.append(
-                        f'Record {i}: Should have valid polygon format.')
-        except (ValueError, SyntaxError, KeyError):
+            parsed[i] = json.loads(texts.iat[i])
+        except (ValueError, TypeError):
+            parsed[i] = _invalid
+    valid = np.array([value is not _invalid for value in parsed], dtype=bool)
+    return parsed, valid
+
+
+def validate_polygon_column(polygons, farm_size_valid):
+    """
+    Check the non empty polygons of a batch.
+
+    Returns masks of the records whose polygon is not a valid list and of the records
+    whose polygon does not have a valid format.
+    """
+    not_a_list = np.zeros(len(polygons), dtype=bool)
+    invalid_format = np.zeros(len(polygons), dtype=bool)
+    non_empty = ~is_empty_column(polygons)
+    not_a_list[non_empty & ~farm_size_valid] = True
+
+    indices = np.flatnonzero(non_empty & farm_size_valid)
+    parsed, valid = parse_json_column(polygons.iloc[indices])
+    not_a_list[indices[~valid]] = True
+    invalid_format[indices[valid]] = [not is_valid_polygon(polygon) for polygon in parsed[valid]]
+    return not_a_list, invalid_format
+
+
+def validate_csv_batch(header, rows, start=1):
+    """
+    Validate a batch of CSV records column by column.
+
+    The numeric columns are parsed in vectorized passes and the error messages are
+    collected per record afterwards, in the same order as the record by record checks.
+    """
+    frame = pd.DataFrame(rows, dtype=object)
+
+    _, farm_size_valid = parse_number_column(
+        get_csv_column(frame, header, 'farm_size'))
+    invalid = {'farm_size': ~farm_size_valid}
+    # empty coordinates are saved as 0.0
+    for field in ('latitude', 'longitude'):
+        values = get_csv_column(frame, header, field)
+        _, valid = parse_number_column(values)
+        invalid[field] = ~(valid | is_empty_column(values))
+    polygon_not_a_list, polygon_invalid_format = validate_polygon_column(
+        get_csv_column(frame, header, 'polygon'), farm_size_valid)
+
+    errors = []
+    has_errors = (invalid['farm_size'] | invalid['latitude'] | invalid['longitude']
+                  | polygon_not_a_list | polygon_invalid_format)
+    for index in np.flatnonzero(has_errors):
+        i = start + int(index)
+        for field in ('farm_size', 'latitude', 'longitude'):
+            if invalid[field][index]:
+                errors.append(f'Record {i}: "{field}" must be a number.')
+        if polygon_invalid_format[index]:
+            errors.append(f'Record {i}: Should have valid polygon format.')
+        if polygon_not_a_list[index]:
             errors.append(f'Record {i}: "polygon" must be a valid list.')
 
     return errors
 
 
-def validate_geojson(data: dict) -> bool:
+def validate_csv_rows(rows, batch_size=VALIDATION_BATCH_SIZE):
+    """
+    Validate CSV rows given as an iterable, the first row being the header.
+    """
+    rows = iter(rows)
+    header = next(rows, [])
+    errors = validate_csv_header(header)
+    if len(errors) > 0:
+        return errors
+
+    # Check the records in columnar batches
+    start = 1
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        errors.extend(validate_csv_batch(header, batch, start))
+        start += len(batch)
+
+    return errors
+
+
+def validate_csv(data):
+    return validate_csv_rows(data)
+
+
+def validate_geojson_collection(data):
     errors = []
 
     try:
@@ -106,10 +244,50 @@ def validate_geojson(data: dict) -> bool:
     except AttributeError:
         errors.append('Invalid GeoJSON. Must be a dictionary')
 
+    return errors
+
+
+def validate_geojson(data: dict) -> bool:
+    errors = validate_geojson_collection(data)
     if len(errors) > 0:
         return errors
 
-    for feature in data['features']:
+    return validate_geojson_features(data['features'])
+
+
+def validate_ring_coordinates(ring):
+    """
+    Check that every coordinate of a ring is a pair of numbers.
+
+    A ring converting to a numeric (n, 2) array is valid as a whole, the others are
+    checked coordinate by coordinate to report the same errors.
+    """
+    try:
+        array = np.array(ring)
+        if array.ndim == 2 and array.shape[1] == 2 and array.dtype.kind in 'biuf':
+            return []
+    except ValueError:
+        pass
+
+    errors = []
+    for coord in ring:
+        if not (isinstance(coord, list) and len(coord) == 2):
+            errors.append(
+                'Invalid GeoJSON coordinates. Must be a list of lists with 2 coordinates')
+        if not all(isinstance(c, (int, float)) for c in coord):
+            errors.append(
+                'Invalid GeoJSON coordinates. Must be a list of lists with numbers')
+    return errors
+
+
+def validate_geojson_features(features):
+    """
+    Validate GeoJSON features given as an iterable, stopping at the first feature with
+    invalid properties once errors were found.
+    """
+    errors = []
+
+    for feature in features:
         if feature.get('type') != 'Feature':
             errors.append('Invalid GeoJSON feature. Must be Feature')
             continue
@@ -153,13 +331,7 @@ def validate_geojson(data: dict) -> bool:
             if properties.get('farm_size') >= 4 and not is_valid_polygon(coordinates):
                 errors.append(
                     'Invalid GeoJSON coordinates. Must be a valid polygon')
-            for coord in coordinates[0]:
-                if not (isinstance(coord, list) and len(coord) == 2):
-                    errors.append(
-                        'Invalid GeoJSON coordinates. Must be a list of lists with 2 coordinates')
-                if not all(isinstance(c, (int, float)) for c in coord):
-                    errors.append(
-                        'Invalid GeoJSON coordinates. Must be a list of lists with numbers')
+            errors.extend(validate_ring_coordinates(coordinates[0]))
         elif geometry_type == 'Point':
             if not (isinstance(coordinates, list) and len(coordinates) == 2):
                 errors.append(
@@ -184,13 +356,7 @@ def validate_geojson(data: dict) -> bool:
                 if properties.get('farm_size') >= 4 and not is_valid_polygon(polygon):
                     errors.append(
                         'Invalid GeoJSON coordinates. Must be a valid polygon')
-                for coord in polygon[0]:
-                    if not (isinstance(coord, list) and len(coord) == 2):
-                        errors.append(
-                            'Invalid GeoJSON coordinates. Must be a list of lists with 2 coordinates')
-                    if not all(isinstance(c, (int, float)) for c in coord):
-                        errors.append(
-                            'Invalid GeoJSON coordinates. Must be a list of lists with numbers')
+                errors.extend(validate_ring_coordinates(polygon[0]))
         else:
             errors.append(
                 'Invalid GeoJSON geometry type. Must be Point or Polygon')
@@ -0,0 +1,317 @@
+import json
+import math
+import struct
+
+import numpy as np
+import shapely
+from django.core import signing
+
+from eudr_backend.services import filter_by_bbox, get_farms_version
+from eudr_backend.spatial import find_overlapping_pairs
+
+# Mapbox Vector Tile 2.1, https://github.com/mapbox/vector-tile-spec
+EXTENT = 4096
+# geometries are kept this many tile units past the tile edges so shapes join across tiles
+BUFFER = 64
+LAYER_NAME = "farms"
+TILE_VERSION_SALT = "eudr_backend.vector_tiles"
+MAX_LATITUDE = 85.0511287798
+MAX_ZOOM = 24
+
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+
+TILE_FARM_FIELDS = ['id', 'farmer_name', 'farm_size', 'geoid', 'collection_site', 'agent_name',
+                    'farm_village', 'farm_district', 'polygon_type', 'analysis', 'geometry_wkb',
+                    'min_lon', 'min_lat', 'max_lon', 'max_lat']
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def get_tile_bounds(z, x, y, buffer=0):
+    """
+    Return the (min_lon, min_lat, max_lon, max_lat) of a web mercator tile, grown by
+    buffer tile widths on each side.
+    """
+    n = 2 ** z
+
+    def tile_latitude(tile_y):
+        tile_y = min(max(tile_y, 0), n)
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return (
+        max((x - buffer) / n * 360 - 180, -180),
+        tile_latitude(y + 1 + buffer),
+        min((x + 1 + buffer) / n * 360 - 180, 180),
+        tile_latitude(y - buffer),
+    )
+
+
+def to_tile_coordinates(coordinates, z, x, y):
+    """
+    Project lon/lat coordinates to the tile coordinates of tile z/x/y, y pointing down.
+    """
+    n = 2 ** z
+    lon = coordinates[:, 0]
+    lat = np.radians(np.clip(coordinates[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+    tile_x = ((lon + 180) / 360 * n - x) * EXTENT
+    tile_y = ((1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n - y) * EXTENT
+    return np.column_stack([tile_x, tile_y])
+
+
+def sign_tile_version(version):
+    return signing.Signer(salt=TILE_VERSION_SALT).sign(version)
+
+
+def unsign_tile_version(value):
+    """
+    Return the farms version signed into a tile URL, None when it is missing or tampered with.
+    """
+    try:
+        return signing.Signer(salt=TILE_VERSION_SALT).unsign(value) if value else None
+    except signing.BadSignature:
+        return None
+
+
+def get_tile_cache_key(scope, queryset, z, x, y, version=None):
+    """
+    Build the cache key of a tile, versioned on the last update and the number of the
+    scope's farms so any change to them invalidates the cached tiles. The maps pass the
+    version they were rendered with, so their tiles are served without reading it again.
+    """
+    return f"{scope}:{version or get_farms_version(queryset)}:{z}/{x}/{y}"
+
+
+def get_overlapping_ids(queryset, geometries, farm_ids):
+    """
+    Return the ids of the tile farms overlapping another farm of the same scope, including
+    farms outside of the tile.
+    """
+    bounds = shapely.bounds(geometries[shapely.is_geometry(geometries)])
+    if not len(bounds):
+        return set()
+    neighbours = list(filter_by_bbox(queryset, (
+        bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max(),
+    )).exclude(geometry_wkb__isnull=True).values_list('id', 'geometry_wkb'))
+    neighbour_ids = [farm_id for farm_id, _ in neighbours]
+    pairs = find_overlapping_pairs(shapely.from_wkb([bytes(wkb) for _, wkb in neighbours]))
+    tile_ids = set(farm_ids)
+    return {neighbour_ids[k] for i, j, _ in pairs for k in (i, j)} & tile_ids
+
+
+def build_farm_tile(queryset, z, x, y):
+    """
+    Encode the farms of a queryset intersecting tile z/x/y as a vector tile with one
+    "farms" layer. Each feature has the farm details shown in the map popups, its EUDR risk
+    level, analysis as JSON and whether it overlaps another farm.
+    """
+    farms = list(filter_by_bbox(queryset, get_tile_bounds(z, x, y, BUFFER / EXTENT)).only(
+        *TILE_FARM_FIELDS).order_by('id'))
+    if not farms:
+        return b""
+
+    # farms without a stored geometry are points, their bounding box is the point
+    geometries = shapely.from_wkb(
+        [bytes(farm.geometry_wkb) if farm.geometry_wkb else None for farm in farms])
+    for i, farm in enumerate(farms):
+        if geometries[i] is None:
+            geometries[i] = shapely.Point(farm.min_lon, farm.min_lat)
+    overlapping_ids = get_overlapping_ids(
+        queryset, np.where(shapely.get_type_id(geometries) == 0, None, geometries),
+        [farm.id for farm in farms])
+
+    tile_geometries = shapely.transform(
+        geometries, lambda coordinates: to_tile_coordinates(coordinates, z, x, y))
+    clipped = shapely.clip_by_rect(
+        tile_geometries, -BUFFER, -BUFFER, EXTENT + BUFFER, EXTENT + BUFFER)
+    snapped = shapely.set_precision(clipped, 1.0)
+
+    layer = VectorTileLayer(LAYER_NAME)
+    for farm, clipped_geometry, geometry in zip(farms, clipped, snapped):
+        if clipped_geometry.is_empty:
+            continue
+        if geometry.is_empty:
+            # plots smaller than a tile unit are drawn as their centroid
+            geometry = shapely.set_precision(shapely.centroid(clipped_geometry), 1.0)
+        layer.add_feature(farm.id, geometry, {
+            "id": farm.id,
+            "farmer_name": farm.farmer_name,
+            "farm_size": farm.farm_size,
+            "geoid": farm.geoid,
+            "collection_site": farm.collection_site,
+            "agent_name": farm.agent_name,
+            "farm_village": farm.farm_village,
+            "farm_district": farm.farm_district,
+            "polygon_type": farm.polygon_type,
+            "eudr_risk_level": (farm.analysis or {}).get("eudr_risk_level") or "",
+            "analysis": json.dumps(farm.analysis or {}),
+            "overlapping": farm.id in overlapping_ids,
+        })
+    return encode_tile([layer])
+
+
+class VectorTileLayer:
+    """
+    A layer of a vector tile, with its features already encoded and the attribute keys and
+    values shared by its features.
+    """
+
+    def __init__(self, name, extent=EXTENT):
+        self.name = name
+        self.extent = extent
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def add_feature(self, feature_id, geometry, properties):
+        """
+        Add a Point, Polygon or MultiPolygon in tile coordinates. Other geometries and
+        polygons collapsed by the rounding are left out.
+        """
+        if shapely.get_type_id(geometry) == 0:
+            geometry_type = GEOM_POINT
+            commands = encode_point(geometry)
+        else:
+            geometry_type = GEOM_POLYGON
+            commands = encode_polygons(
+                [part for part in shapely.get_parts(geometry) if part.geom_type == 'Polygon'])
+        if not commands:
+            return
+
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            # bools are ints in Python, keep them apart from 0 and 1
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+
+        self.features.append(b"".join([
+            encode_varint_field(1, feature_id),
+            encode_packed_field(2, tags),
+            encode_varint_field(3, geometry_type),
+            encode_packed_field(4, commands),
+        ]))
+
+    def encode(self):
+        return b"".join([
+            encode_varint_field(15, 2),
+            encode_bytes_field(1, self.name.encode()),
+            *[encode_bytes_field(2, feature) for feature in self.features],
+            *[encode_bytes_field(3, key.encode()) for key in self.keys],
+            *[encode_bytes_field(4, encode_value(value)) for _, value in self.values],
+            encode_varint_field(5, self.extent),
+        ])
+
+
+def encode_tile(layers):
+    return b"".join(encode_bytes_field(3, layer.encode()) for layer in layers if layer.features)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def encode_point(point):
+    x, y = int(point.x), int(point.y)
+    if not (-BUFFER <= x <= EXTENT + BUFFER and -BUFFER <= y <= EXTENT + BUFFER):
+        return []
+    return [command(CMD_MOVE_TO, 1), zigzag(x), zigzag(y)]
+
+
+def get_ring_points(ring):
+    """
+    Return the integer points of a ring without its closing point and repeated points,
+    None when fewer than 3 points are left.
+    """
+    points = np.asarray(ring.coords, dtype=np.int64)[:-1]
+    if len(points) > 1:
+        keep = np.any(points != np.roll(points, 1, axis=0), axis=1)
+        keep[0] = True
+        points = points[keep]
+    return points if len(points) >= 3 else None
+
+
+def ring_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return int(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+
+
+def encode_polygons(polygons):
+    """
+    Encode polygons as MVT geometry commands: exterior rings have a positive area and
+    holes a negative one in tile coordinates.
+    """
+    commands = []
+    cursor = np.zeros(2, dtype=np.int64)
+    for polygon in polygons:
+        exterior = get_ring_points(polygon.exterior)
+        if exterior is None:
+            continue
+        rings = [(exterior, True)] + [
+            (points, False) for points in map(get_ring_points, polygon.interiors)
+            if points is not None]
+        for points, is_exterior in rings:
+            area = ring_area(points)
+            if area == 0:
+                continue
+            if (area > 0) != is_exterior:
+                # rewind the ring from the same starting point
+                points = np.vstack([points[:1], points[:0:-1]])
+            deltas = np.diff(np.vstack([cursor, points]), axis=0)
+            cursor = points[-1]
+            commands.append(command(CMD_MOVE_TO, 1))
+            commands.extend(zigzag(int(value)) for value in deltas[0])
+            commands.append(command(CMD_LINE_TO, len(points) - 1))
+            commands.extend(zigzag(int(value)) for value in deltas[1:].ravel())
+            commands.append(command(CMD_CLOSE_PATH, 1))
+    return commands
+
+
+def encode_varint(value):
+    value &= (1 << 64) - 1
+    encoded = bytearray()
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_key(field_number, wire_type):
+    return encode_varint((field_number << 3) | wire_type)
+
+
+def encode_varint_field(field_number, value):
+    return encode_key(field_number, WIRE_VARINT) + encode_varint(value)
+
+
+def encode_bytes_field(field_number, data):
+    return encode_key(field_number, WIRE_BYTES) + encode_varint(len(data)) + data
+
+
+def encode_packed_field(field_number, values):
+    return encode_bytes_field(field_number, b"".join(encode_varint(value) for value in values))
+
+
+def encode_value(value):
+    if isinstance(value, bool):
+        return encode_varint_field(7, int(value))
+    if isinstance(value, int):
+        return encode_varint_field(4, value)
+    if isinstance(value, float):
+        return encode_key(3, WIRE_FIXED64) + struct.pack('<d', value)
+    return encode_bytes_field(1, str(value).encode())
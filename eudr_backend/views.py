@@ -1,34 +1,48 @@
 import json
-from django.http import HttpResponse, JsonResponse
+import logging
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from datetime import datetime
 from django.utils import timezone
+from django.views.decorators.gzip import gzip_page
 import pandas as pd
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.decorators import api_view, authentication_classes, parser_classes, permission_classes
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from asgiref.sync import async_to_sync
 from django.contrib.auth.models import User
-import boto3
-from shapely import Polygon
 from eudr_backend import settings
 from eudr_backend.async_tasks import async_create_farm_data
-from eudr_backend.models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRSharedMapAccessCodeModel, EUDRFarmModel, EUDRUploadedFilesModel
+from eudr_backend.bulk_operations import bulk_sync_farm_backups
+from eudr_backend.cache import dashboard_cache, farm_tile_cache
+from eudr_backend.delta_sync import iter_restore_data, sync_device
+from eudr_backend.exports import EXPORT_FORMATS, iter_farm_export
+from eudr_backend.log_utils import LazyPayload
+from eudr_backend.ingestion import ingest_feature_batches, iter_upload_feature_batches, validate_upload_file
+from eudr_backend.models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRSharedMapAccessCodeModel, EUDRFarmModel, EUDRUploadedFilesModel, EUDRUploadJobModel
+from eudr_backend.pagination import FARM_LIST_PARAMETERS, farm_list_response
 from datetime import timedelta
-from eudr_backend.tasks import update_geoid
-from eudr_backend.util_classes import IsSuperUser
-from eudr_backend.utils import extract_data_from_file, flatten_multipolygon_coordinates, generate_access_code, handle_failed_file_entry, store_file_in_s3, transform_csv_to_json, transform_db_data_to_geojson
+from eudr_backend.services import check_map_access_code, filter_overlapping_farms, get_file_farms, get_map_farms, get_overlapping_farms, get_tile_farms
+from eudr_backend.tasks import process_upload_job, update_geoid
+from eudr_backend.upload_jobs import get_processed_records, store_upload_job
+from eudr_backend.util_classes import GzipJSONParser, IsSuperUser
+from eudr_backend.utils import extract_data_from_file, generate_access_code, handle_failed_file_entry, list_s3_objects, store_file_in_s3, transform_csv_to_json, transform_db_data_to_geojson
 from eudr_backend.validators import validate_csv, validate_geojson
+from eudr_backend.vector_tiles import build_farm_tile, get_tile_cache_key, is_valid_tile, unsign_tile_version
 from .serializers import (
     EUDRCollectionSiteModelSerializer,
     EUDRFarmBackupModelSerializer,
     EUDRFarmModelSerializer,
     EUDRUploadedFilesModelSerializer,
+    EUDRUploadJobModelSerializer,
     EUDRUserModelSerializer,
 )
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+
+logger = logging.getLogger(__name__)
 
 
 @swagger_auto_schema(
@@ -552,23 +566,28 @@ def create_farm_data(request):
     if not file and not raw_data:
         return Response({'error': 'Either a file or data is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    # uploaded files are validated and processed in batches straight from the upload
+    stream_file = bool(file) and data_format in ('csv', 'geojson')
+
     # Determine the data source (file or raw_data)
     if file:
         file_name = file.name.split('.')[0]
-        # Custom function to read data from file if needed
-        raw_data = extract_data_from_file(file, data_format)
-        print("raw data",raw_data)
+        if not stream_file:
+            # Custom function to read data from file if needed
+            raw_data = extract_data_from_file(file, data_format)
+            logger.debug("Read %s upload %s: %s", data_format, file.name, LazyPayload(raw_data))
     else:
         file_name = "uploaded_data"
 
     # Validate the format
-    if not data_format or not raw_data:
+    if not data_format or not (raw_data or stream_file):
         return Response({'error': 'Format and data are required'}, status=status.HTTP_400_BAD_REQUEST)
+    elif stream_file:
+        errors = validate_upload_file(file, data_format)
     elif data_format == 'geojson':
         errors = validate_geojson(raw_data)
     elif data_format == 'csv':
         errors = validate_csv(raw_data)
-        print("errors",errors)
     else:
         return Response({'error': 'Unsupported format'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -577,9 +596,9 @@ def create_farm_data(request):
         store_file_in_s3(file, request.user, file_name)
         return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
 
-    if data_format == 'csv':
+    if data_format == 'csv' and not stream_file:
         raw_data = transform_csv_to_json(raw_data)
-        print("raw data converted to json",raw_data)
+        logger.debug("Converted the CSV upload to GeoJSON: %s", LazyPayload(raw_data))
 
     # Combine file_name and format for database entry
     file_data = {
@@ -599,8 +618,12 @@ def create_farm_data(request):
             uploaded_by=request.user.username if request.user.is_authenticated else "admin"
         ).id
 
-        errors, _ = async_to_sync(async_create_farm_data)(
-            raw_data, file_id)
+        if stream_file:
+            errors = ingest_feature_batches(iter_upload_feature_batches(
+                file, data_format, settings.INGEST_BATCH_SIZE), file_id)
+        else:
+            errors, _ = async_to_sync(async_create_farm_data)(
+                raw_data, file_id)
         if errors:
             # Custom function to handle failed file entries
             handle_failed_file_entry(file_serializer, file, request.user)
@@ -609,15 +632,127 @@ def create_farm_data(request):
         # Custom function to handle failed file entries
         handle_failed_file_entry(file_serializer, file, request.user)
         return Response({'error': 'File serialization failed'}, status=status.HTTP_400_BAD_REQUEST)
-    print("username",request.user.username,request.user.is_authenticated )
+    logger.info("Saved the farms of file %s", file_id, extra={
+        "file_id": file_id, "uploaded_by": file_data["uploaded_by"]})
     # Proceed with other operations...
-    # update_geoid(repeat=60,
-    #              user_id=request.user.username if request.user.is_authenticated else "admin")
-    update_geoid(user_id=request.user.username if request.user.is_authenticated else "admin")
+    # register the geoids of the new farms in the background worker
+    update_geoid(file_id)
     store_file_in_s3(file, request.user, file_name, True) if file else None
     return Response({'message': 'File/data processed successfully', 'file_id': file_id}, status=status.HTTP_201_CREATED)
 
 
+@swagger_auto_schema(
+    method="post",
+    operation_summary="Upload a farm data file for background processing",
+    manual_parameters=[openapi.Parameter(
+        name="file",
+        in_=openapi.IN_FORM,
+        type=openapi.TYPE_FILE,
+        required=True,
+        description="CSV or GeoJSON file with the farm data",
+    ), openapi.Parameter(
+        name="format",
+        in_=openapi.IN_FORM,
+        type=openapi.TYPE_STRING,
+        required=True,
+        description="File format (csv or geojson)",
+    )],
+    responses={
+        202: openapi.Response(
+            description="Upload job created",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "job_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "status": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+            examples={
+                "application/json": {
+                    "job_id": 1,
+                    "status": "pending",
+                },
+            },
+        ),
+        400: openapi.Response(
+            description="Bad request",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "error": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+            examples={
+                "application/json": {
+                    "error": "A csv or geojson file is required",
+                },
+            },
+        ),
+    },
+    tags=["Farm Data Management"]
+)
+@api_view(["POST"])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def create_upload_job(request):
+    file = request.FILES.get('file')
+    data_format = request.data.get('format', "geojson")
+
+    if not file or data_format not in ('csv', 'geojson'):
+        return Response({'error': 'A csv or geojson file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    job = store_upload_job(file, data_format, request.user.username)
+    process_upload_job(job.id)
+
+    return Response({'job_id': job.id, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
+
+
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Retrieve the progress of an upload job",
+    responses={
+        200: openapi.Response(
+            description="Upload job retrieved successfully",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "status": openapi.Schema(type=openapi.TYPE_STRING),
+                    "stage": openapi.Schema(type=openapi.TYPE_STRING),
+                    "total_records": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "processed_records": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "errors": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                    "file_id": openapi.Schema(type=openapi.TYPE_INTEGER),
+                },
+            ),
+        ),
+        404: openapi.Response(
+            description="Upload job not found",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "error": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+        ),
+    },
+    tags=["Farm Data Management"]
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def retrieve_upload_job(request, pk):
+    jobs = EUDRUploadJobModel.objects.all() if request.user.is_staff else EUDRUploadJobModel.objects.filter(
+        uploaded_by=request.user.username)
+    job = jobs.filter(id=pk).first()
+    if not job:
+        return Response({"error": "Upload job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    data = EUDRUploadJobModelSerializer(job).data
+    data['processed_records'] = get_processed_records(job)
+    return Response(data)
+
+
 @swagger_auto_schema(
     method="post",
     operation_summary="Sync farm data",
@@ -724,27 +859,7 @@ def create_farm_data(request):
 )
 @api_view(["POST"])
 def sync_farm_data(request):
-    sync_results = []
-    data = request.data
-    for entry in data:
-        # Check or create collection site
-        site_data = entry.get('collection_site')
-        # append device_id to site_data
-        site_data['device_id'] = entry.get("device_id")
-        site, created = EUDRCollectionSiteModel.objects.update_or_create(
-            name=site_data['name'],
-            defaults=site_data
-        )
-
-        # Sync farms
-        for farm_data in entry.get('farms', []):
-            farm_data['site_id'] = site
-            farm, farm_created = EUDRFarmBackupModel.objects.update_or_create(
-                remote_id=farm_data.get('remote_id'),
-                defaults=farm_data
-            )
-            sync_results.append(farm.remote_id)
-
+    sync_results = bulk_sync_farm_backups(request.data)
     return Response({"synced_remote_ids": sync_results}, status=status.HTTP_200_OK)
 
 
@@ -847,8 +962,6 @@ def restore_farm_data(request):
     phone_number = request.data.get("phone_number")
     email = request.data.get("email")
 
-    collection_sites = []
-
     # Query based on priority: device_id, phone_number, or email
     if device_id:
         collection_sites = EUDRCollectionSiteModel.objects.filter(
@@ -858,26 +971,89 @@ def restore_farm_data(request):
             phone_number=phone_number)
     elif email:
         collection_sites = EUDRCollectionSiteModel.objects.filter(email=email)
-
-    if not collection_sites:
+    else:
         return Response([], status=status.HTTP_200_OK)
 
-    # Prepare the restore data in the required format
-    restore_data = []
+    # the sites and their farms are streamed in the restore format, one site at a time
+    return StreamingHttpResponse(
+        iter_restore_data(collection_sites, settings.EXPORT_CHUNK_SIZE),
+        content_type="application/json")
 
-    for site in collection_sites:
-        # Fetch all farms linked to this collection site
-        farms = EUDRFarmBackupModel.objects.filter(site_id=site.id)
-        farm_data = EUDRFarmBackupModelSerializer(farms, many=True).data
 
-        # Construct the structure with the collection site and farms
-        restore_data.append({
-            "device_id": site.device_id,
-            "collection_site": EUDRCollectionSiteModelSerializer(site).data,
-            "farms": farm_data
-        })
+@swagger_auto_schema(
+    method="post",
+    operation_summary="Sync the farm changes of a device",
+    operation_description=(
+        "Saves the collection sites, farms and deletions changed on the device, then returns "
+        "the changes of its sites since the sync_token of its previous sync. Without a "
+        "sync_token, or when full is true in the response, the changes are a full snapshot "
+        "that replaces the device data, including the farms pushed in the same request. "
+        "A farm deleted and created again since the previous sync is only sent in the "
+        "changes, not in deleted_remote_ids. The request body may be gzip encoded and the "
+        "response is gzip encoded when the device accepts it."),
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "device_id": openapi.Schema(type=openapi.TYPE_STRING),
+            "sync_token": openapi.Schema(type=openapi.TYPE_STRING),
+            "changes": openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        "collection_site": openapi.Schema(type=openapi.TYPE_OBJECT),
+                        "farms": openapi.Schema(
+                            type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                    },
+                ),
+            ),
+            "deleted_remote_ids": openapi.Schema(
+                type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+        },
+        required=["device_id"],
+    ),
+    responses={
+        200: openapi.Response(
+            description="Changes synced successfully",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "sync_token": openapi.Schema(type=openapi.TYPE_STRING),
+                    "full": openapi.Schema(type=openapi.TYPE_BOOLEAN),
+                    "synced_remote_ids": openapi.Schema(
+                        type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                    "synced_deleted_remote_ids": openapi.Schema(
+                        type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                    "changes": openapi.Schema(
+                        type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+                    "deleted_remote_ids": openapi.Schema(
+                        type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                },
+            ),
+        ),
+        400: openapi.Response(description="Missing device_id or invalid sync_token"),
+    },
+    tags=["Farm Data Management"]
+)
+@gzip_page
+@api_view(["POST"])
+@parser_classes([GzipJSONParser])
+@permission_classes([IsAuthenticated])
+def delta_sync_farm_data(request):
+    device_id = request.data.get("device_id")
+    if not device_id:
+        return Response({'error': 'device_id is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-    return Response(restore_data, status=status.HTTP_200_OK)
+    try:
+        result = sync_device(
+            device_id,
+            token=request.data.get("sync_token"),
+            changes=request.data.get("changes") or [],
+            deleted_remote_ids=request.data.get("deleted_remote_ids") or [],
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(
@@ -1007,7 +1183,7 @@ def update_farm_data(request, pk):
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         properties={
-            "file_id": openapi.Schema(type=openapi.TYPE_STRING),
+            "file_id": openapi.Schema(type=openapi.TYPE_INTEGER),
         },
     ),
     responses={
@@ -1052,6 +1228,8 @@ def revalidate_farm_data(request):
     # if file_id is not provided, return an error
     if not file_id:
         return Response({'error': 'File ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if not str(file_id).isdigit():
+        return Response({'error': 'Invalid file id'}, status=status.HTTP_400_BAD_REQUEST)
 
     # get all the data belonging to the file_ids
     data = EUDRFarmModel.objects.filter(
@@ -1108,6 +1286,7 @@ def revalidate_farm_data(request):
             ),
         ),
     },
+    manual_parameters=FARM_LIST_PARAMETERS,
     tags=["Farm Data Management"]
 )
 @api_view(["GET"])
@@ -1122,9 +1301,7 @@ def retrieve_farm_data(request):
         file_id__in=[file["id"] for file in filesSerializer.data]
     ).order_by("-updated_at")
 
-    serializer = EUDRFarmModelSerializer(data, many=True)
-
-    return Response(serializer.data)
+    return farm_list_response(request, data)
 
 
 @swagger_auto_schema(
@@ -1165,32 +1342,8 @@ def retrieve_farm_data(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def retrieve_overlapping_farm_data(request, pk):
-    files = EUDRUploadedFilesModel.objects.filter(
-        id=pk) if not request.user.is_staff else EUDRUploadedFilesModel.objects.all()
-
-    filesSerializer = EUDRUploadedFilesModelSerializer(files, many=True)
-
-    farms = EUDRFarmModel.objects.filter(
-        file_id=filesSerializer.data[0].get("id")
-    ).order_by("-updated_at")
-
-    farmSerializer = EUDRFarmModelSerializer(farms, many=True)
-
-    overLaps = []
-    farms = farmSerializer.data
-
-    for farm in farms:
-        # Assuming farm data has 'farmer_name', 'latitude', 'longitude', 'farm_size', and 'polygon' fields
-        polygon = flatten_multipolygon_coordinates(
-            farm['polygon']) if farm['polygon_type'] == 'MultiPolygon' else farm['polygon']
-        if 'polygon' in farm and len(polygon) == 1:
-            polygon = flatten_multipolygon_coordinates(farm['polygon'])
-
-            if polygon:
-                farm_polygon = Polygon(polygon[0])
-                is_overlapping = any(farm_polygon.overlaps(
-                    Polygon(other_farm['polygon'][0])) for other_farm in farms)
-                overLaps.append(farm) if is_overlapping else None
+    # compare every farm against its STRtree candidates only
+    overLaps = get_overlapping_farms(pk)
 
     return Response(overLaps)
 
@@ -1228,6 +1381,7 @@ def retrieve_overlapping_farm_data(request, pk):
             ),
         ),
     },
+    manual_parameters=FARM_LIST_PARAMETERS,
     tags=["Farm Data Management"]
 )
 @api_view(["GET"])
@@ -1243,9 +1397,7 @@ def retrieve_user_farm_data(request, pk):
         file_id__in=[file["id"] for file in filesSerializer.data]
     ).order_by("-updated_at")
 
-    serializer = EUDRFarmModelSerializer(data, many=True)
-
-    return Response(serializer.data)
+    return farm_list_response(request, data)
 
 
 @swagger_auto_schema(
@@ -1434,23 +1586,15 @@ def retrieve_collection_sites(request):
             ),
         ),
     },
+    manual_parameters=FARM_LIST_PARAMETERS,
     tags=["Farm Data Management"]
 )
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def retrieve_map_data(request):
-    files = EUDRUploadedFilesModel.objects.filter(
-        uploaded_by=request.user.username if request.user.is_authenticated else "admin"
-    )
-    filesSerializer = EUDRUploadedFilesModelSerializer(files, many=True)
+    data = get_map_farms(request.user)
 
-    data = EUDRFarmModel.objects.filter(
-        file_id__in=[file["id"] for file in filesSerializer.data]
-    ).order_by("-updated_at") if not request.user.is_staff else EUDRFarmModel.objects.all().order_by("-updated_at")
-
-    serializer = EUDRFarmModelSerializer(data, many=True)
-
-    return Response(serializer.data)
+    return farm_list_response(request, data)
 
 
 @swagger_auto_schema(
@@ -1557,19 +1701,166 @@ def retrieve_farm_detail(request, pk):
             },
         ),
     },
+    manual_parameters=FARM_LIST_PARAMETERS,
     tags=["Farm Data Management"]
 )
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def retrieve_farm_data_from_file_id(request, pk):
     try:
-        data = EUDRFarmModel.objects.filter(file_id=pk)
-        serializer = EUDRFarmModelSerializer(data, many=True)
-        return Response(serializer.data)
+        data = get_file_farms(pk)
+        return farm_list_response(request, data)
     except EUDRFarmModel.DoesNotExist:
         return Response({'message': 'Farm does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
 
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Export farm data",
+    responses={
+        200: openapi.Response(
+            description="GeoJSON FeatureCollection or newline delimited GeoJSON features, streamed",
+        ),
+        400: openapi.Response(
+            description="Bad request",
+            schema=openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "error": openapi.Schema(type=openapi.TYPE_STRING),
+                },
+            ),
+            examples={
+                "application/json": {
+                    "error": "Format parameter is missing or incorrect",
+                },
+            },
+        ),
+    }, manual_parameters=[openapi.Parameter(
+        name="file_format",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="Export format (geojson or ndjson), defaults to geojson",
+    ), openapi.Parameter(
+        name="file_id",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        required=False,
+        description="Only export the farms of this file",
+    )],
+    tags=["Farm Data Management"]
+)
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_farm_data(request):
+    file_format = request.query_params.get("file_format", "geojson")
+    if file_format not in EXPORT_FORMATS:
+        return Response({"error": "Format parameter is missing or incorrect"}, status=400)
+
+    data = get_map_farms(request.user).order_by("id")
+    file_id = request.query_params.get("file_id")
+    if file_id and not file_id.isdigit():
+        return Response({"error": "Invalid file id"}, status=400)
+    if file_id:
+        data = data.filter(file_id=file_id)
+
+    content_type, extension = EXPORT_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        iter_farm_export(data, file_format, settings.EXPORT_CHUNK_SIZE), content_type=content_type)
+    timestamp_str = timezone.now().strftime("%Y-%m-%d-%H-%M-%S")
+    response["Content-Disposition"] = f'attachment; filename="farms_{timestamp_str}.{extension}"'
+    return response
+
+
+@swagger_auto_schema(
+    method="get",
+    operation_summary="Retrieve a vector tile of the farms",
+    operation_description="Mapbox Vector Tile with a \"farms\" layer. Features have the farm id, farmer_name, "
+                          "farm_size, eudr_risk_level and overlapping attributes. Opened with a session, a token "
+                          "or the access code of a shared map.",
+    responses={
+        200: openapi.Response(description="Vector tile (application/vnd.mapbox-vector-tile)"),
+        400: openapi.Response(description="Invalid tile, file or farm id"),
+        403: openapi.Response(description="Not logged in or invalid access code"),
+    }, manual_parameters=[openapi.Parameter(
+        name="file-id",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        required=False,
+        description="Only draw the farms of this file",
+    ), openapi.Parameter(
+        name="farm-id",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_INTEGER,
+        required=False,
+        description="Only draw this farm",
+    ), openapi.Parameter(
+        name="access-code",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="Access code of the shared map of file-id",
+    ), openapi.Parameter(
+        name="overlapping",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_BOOLEAN,
+        required=False,
+        description="Only draw the farms overlapping another farm of the same scope",
+    ), openapi.Parameter(
+        name="version",
+        in_=openapi.IN_QUERY,
+        type=openapi.TYPE_STRING,
+        required=False,
+        description="Signed version of the farms, written in the tile URLs of the maps",
+    )],
+    tags=["Farm Data Management"]
+)
+@api_view(["GET"])
+@authentication_classes([SessionAuthentication, TokenAuthentication])
+@permission_classes([AllowAny])
+def retrieve_farm_tile(request, z, x, y):
+    if not is_valid_tile(z, x, y):
+        return Response({"message": "Invalid tile"}, status=status.HTTP_400_BAD_REQUEST)
+
+    file_id = request.query_params.get("file-id")
+    farm_id = request.query_params.get("farm-id")
+    access_code = request.query_params.get("access-code")
+    overlapping = request.query_params.get("overlapping") == "true"
+    if farm_id and not farm_id.isdigit():
+        return Response({"message": "Invalid farm id"}, status=status.HTTP_400_BAD_REQUEST)
+    if file_id and not file_id.isdigit():
+        return Response({"message": "Invalid file id"}, status=status.HTTP_400_BAD_REQUEST)
+
+    shared = bool(file_id and access_code)
+    if shared:
+        access_error = check_map_access_code(file_id, access_code)
+        if access_error:
+            return Response({"message": access_error}, status=status.HTTP_403_FORBIDDEN)
+        scope = f"file:{file_id}:{farm_id or ''}"
+    elif request.user.is_authenticated:
+        user_scope = "staff" if request.user.is_staff else request.user.id
+        scope = f"user:{user_scope}:{file_id or ''}:{farm_id or ''}"
+    else:
+        return Response({"message": "Authentication credentials were not provided."},
+                        status=status.HTTP_403_FORBIDDEN)
+
+    farms = get_tile_farms(request.user, file_id, farm_id, shared)
+    # the overlapping farms only change with the farms of the scope, they are only
+    # looked for when the tile is built
+    cache_key = get_tile_cache_key(f"{scope}:overlaps:{overlapping}", farms, z, x, y,
+                                   unsign_tile_version(request.query_params.get("version")))
+    tile = farm_tile_cache.get(cache_key)
+    if tile is None:
+        if overlapping:
+            farms = filter_overlapping_farms(farms)
+        tile = build_farm_tile(farms, z, x, y)
+        farm_tile_cache.set(cache_key, tile, timeout=settings.VECTOR_TILE_CACHE_TIMEOUT)
+
+    response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @swagger_auto_schema(
     method="get",
     operation_summary="Retrieve files",
@@ -1680,13 +1971,10 @@ def retrieve_files(request):
 def retrieve_s3_files(request):
     try:
         # Retrieve all files from all directories in the S3 bucket
-        s3 = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-        response = s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
         # get file urls and date uploaded
         files = []
         count = 0
-        for content in response.get('Contents', []):
+        for content in list_s3_objects():
             file = {
                 'id': count,
                 'file_name': content.get('Key').split("/")[1].split("_", 1)[1],
@@ -1981,16 +2269,9 @@ def filter_backup(request):
 
 def get_filtered_files_uploaded(start_date, end_date):
     """Retrieve files uploaded within a specific date range in the S3 bucket"""
-    s3 = boto3.client(
-        's3',
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY
-    )
-    
-    response = s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
     filtered_files = []
 
-    for content in response.get('Contents', []):
+    for content in list_s3_objects():
         last_modified = content.get('LastModified')
 
         # Convert S3 LastModified to datetime and check if it's within range
@@ -2034,6 +2315,15 @@ def filter_dashboard_metrics(request):
     except ValueError:
         return JsonResponse({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
 
+    metrics = dashboard_cache.get_or_set(
+        f"{start_date_str}:{end_date_str}",
+        lambda: get_dashboard_metrics(start_date, end_date),
+        timeout=settings.DASHBOARD_CACHE_TIMEOUT)
+    return JsonResponse(metrics)
+
+
+def get_dashboard_metrics(start_date, end_date):
+    """Compute the dashboard metrics of a date range"""
     # Filter metrics based on the date range
     total_farms = EUDRFarmModel.objects.filter(created_at__range=(start_date, end_date)).count()
     total_files_uploaded = EUDRUploadedFilesModel.objects.filter(created_at__range=(start_date, end_date)).count()
@@ -2052,8 +2342,7 @@ def filter_dashboard_metrics(request):
 
     low_farms_rate = (low_risk_plots / total_farms * 100) if total_farms > 0 else 0
 
-    # Return filtered metrics as JSON
-    return JsonResponse({
+    return {
         'total_farms': total_farms,
         'total_files_uploaded': total_files_uploaded,
         'low_farms_rate': round(low_farms_rate, 2),
@@ -2061,8 +2350,7 @@ def filter_dashboard_metrics(request):
         'all_files_uploaded': all_files_uploaded,
         'files_uploaded': files_uploaded,
         'total_backups': total_backups,
-    })
-
+    }
 
 
 def filter_total_plots(request):
@@ -2129,12 +2417,9 @@ def filter_total_files(request):
 
     try:
         # Retrieve all files from S3 bucket
-        s3 = boto3.client('s3', aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                          aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY)
-        response = s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
         files = []
         count = 0
-        for content in response.get('Contents', []):
+        for content in list_s3_objects():
             # Extract file metadata
             last_modified = content.get('LastModified').date()  # Convert to date for filtering
             if start_date <= last_modified <= end_date:
@@ -1,14 +1,18 @@
 from django.contrib import admin
 
-from eudr_backend.models import EUDRCollectionSiteModel, EUDRFarmBackupModel, EUDRSharedMapAccessCodeModel, EUDRUploadedFilesModel,  WhispAPISetting, EUDRFarmModel
+from eudr_backend.models import EUDRCollectionSiteModel, EUDRDeletedFarmBackupModel, EUDRFarmBackupModel, EUDRSyncDeviceModel, EUDRSharedMapAccessCodeModel, EUDRUploadedFilesModel, EUDRUploadJobModel,  WhispAPISetting, WhispAnalysisCacheModel, EUDRFarmModel
 
 admin.site.register(
     [
         EUDRFarmModel,
         EUDRUploadedFilesModel,
+        EUDRUploadJobModel,
         EUDRCollectionSiteModel,
         EUDRFarmBackupModel,
+        EUDRDeletedFarmBackupModel,
+        EUDRSyncDeviceModel,
         EUDRSharedMapAccessCodeModel,
-        WhispAPISetting
+        WhispAPISetting,
+        WhispAnalysisCacheModel
     ]
 )
@@ -443,7 +443,6 @@ def password_reset_request(request):
                     subject = "TerraTrav Validation Portal - Password Reset Requested"
                     email_template_name = "auth/password_reset_email.html"
                     recipient = user.email if user.email else user.username
-                    print(f"Recipient: {recipient}")  # Debugging line
                     c = {
                         "email": recipient,
                         "domain": request.get_host(),
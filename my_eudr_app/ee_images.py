@@ -1,5 +1,13 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import ee
+from django.conf import settings
+from eudr_backend.cache import ee_tile_cache
+
+logger = logging.getLogger(__name__)
 
 # Tree Cover/Forest Cover
 
@@ -298,3 +306,100 @@ def combine_disturbances_after_2020_images():
     radd_after_2020 = radd_after_2020_prep()
 
     return tmf_deg_after_2020.addBands(tmf_def_after_2020).addBands(gfc_loss_after_2020).addBands(modis_fire_after_2020).addBands(radd_after_2020)
+
+
+# Protected areas (WDPA), without proposed or unreported sites and biosphere reserves
+
+
+def protected_areas_prep():
+    wdpa_poly = ee.FeatureCollection("WCMC/WDPA/current/polygons")
+    wdpa_filt = wdpa_poly.filter(
+        ee.Filter.And(ee.Filter.neq('STATUS', 'Proposed'),
+                      ee.Filter.neq('STATUS', 'Not Reported'),
+                      ee.Filter.neq('DESIG_ENG', 'UNESCO-MAB Biosphere Reserve'))
+    )
+    return ee.Image().paint(wdpa_filt, 1)
+
+
+# Static reference layers drawn on every map: key -> (image builder, visualization params)
+REFERENCE_LAYERS = {
+    'protected_areas': (protected_areas_prep, {'palette': ['#585858']}),
+    'forest_cover': (combine_forest_cover_images, {}),
+    'commodities': (combine_commodities_images, {}),
+    'disturbances_before_2020': (combine_disturbances_before_2020_images, {}),
+    'disturbances_after_2020': (combine_disturbances_after_2020_images, {}),
+}
+
+_refreshing_layers = set()
+_refreshing_lock = threading.Lock()
+
+
+def fetch_reference_tile_url(layer_key):
+    """
+    Request a new map ID for a reference layer from Earth Engine and cache its tile URL.
+    """
+    build_image, vis_params = REFERENCE_LAYERS[layer_key]
+    map_id = ee.Image(build_image()).getMapId(dict(vis_params))
+    url = map_id['tile_fetcher'].url_format
+    ee_tile_cache.set(layer_key, {'url': url, 'fetched_at': time.time()},
+                      timeout=settings.EE_TILE_CACHE_TIMEOUT)
+    return url
+
+
+def refresh_reference_tile_url(layer_key):
+    """
+    Fetch a new tile URL in a background thread, unless one is already being fetched.
+    """
+    with _refreshing_lock:
+        if layer_key in _refreshing_layers:
+            return
+        _refreshing_layers.add(layer_key)
+
+    def refresh():
+        try:
+            fetch_reference_tile_url(layer_key)
+        except Exception:
+            # the cached URL stays valid until it expires, the next request retries
+            logger.warning("Failed to refresh the %s tile URL", layer_key, exc_info=True)
+        finally:
+            with _refreshing_lock:
+                _refreshing_layers.discard(layer_key)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_reference_tile_version(layer_keys):
+    """
+    Return a version string of the cached tile URLs of the layers, from their fetch times,
+    None when one of them is not cached.
+    """
+    entries = ee_tile_cache.get_many(layer_keys)
+    if len(entries) < len(layer_keys):
+        return None
+    return ":".join(str(entries[layer_key]['fetched_at']) for layer_key in layer_keys)
+
+
+def get_reference_tile_urls(layer_keys):
+    """
+    Return the tile URL of each reference layer, requesting map IDs only for the layers
+    that are not cached. URLs close to expiry are served and refreshed in the background.
+    """
+    urls = {}
+    missing = []
+    refresh_after = settings.EE_TILE_CACHE_TIMEOUT - settings.EE_TILE_REFRESH_MARGIN
+    for layer_key in layer_keys:
+        entry = ee_tile_cache.get(layer_key)
+        if entry is None:
+            missing.append(layer_key)
+            continue
+        urls[layer_key] = entry['url']
+        if time.time() - entry['fetched_at'] >= refresh_after:
+            refresh_reference_tile_url(layer_key)
+
+    if missing:
+        # getMapId is a blocking round trip, request the missing layers in parallel
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            urls.update(zip(missing, executor.map(
+                fetch_reference_tile_url, missing)))
+
+    return urls
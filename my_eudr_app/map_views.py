@@ -1,17 +1,161 @@
-import ee
+import logging
+from urllib.parse import urlencode
+
 import folium
-import geemap.foliumap as geemap
 from django.http import JsonResponse
-from django.utils import timezone
-import requests
-from shapely import Polygon
-from eudr_backend.utils import flatten_multipolygon_coordinates, is_valid_polygon, reverse_polygon_points
+from django.urls import reverse
+from branca.element import MacroElement
+from folium.plugins import VectorGridProtobuf
+from jinja2 import Template
+from eudr_backend import settings
+from eudr_backend.cache import map_html_cache
 from eudr_backend.settings import initialize_earth_engine
-from my_eudr_app.ee_images import combine_commodities_images, combine_disturbances_after_2020_images, combine_disturbances_before_2020_images, combine_forest_cover_images
-from eudr_backend.models import EUDRSharedMapAccessCodeModel
+from my_eudr_app.ee_images import get_reference_tile_urls, get_reference_tile_version
+from eudr_backend.services import check_map_access_code, get_farms_version, get_map_view_farm, get_map_view_queryset
+from eudr_backend.vector_tiles import LAYER_NAME, sign_tile_version
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 
+logger = logging.getLogger(__name__)
+
+# Reference layers from ee_images.py, in the order they appear in the layer control
+REFERENCE_LAYER_NAMES = [
+    ('protected_areas', 'Protected Areas'),
+    ('forest_cover', 'Forest Mapped Areas'),
+    ('commodities', 'Commodity Areas'),
+    ('disturbances_before_2020', 'Disturbed Areas Before 2020'),
+    ('disturbances_after_2020', 'Disturbed Areas After 2020'),
+]
+
+
+# Risk layers drawn from the farm vector tiles: (eudr_risk_level, layer name, color)
+RISK_LAYERS = [
+    ('high', 'EUDR Risk Level (High)', '#F64468'),
+    ('low', 'EUDR Risk Level (Low)', '#3AD190'),
+    ('more_info_needed', 'EUDR Risk Level (More Info Needed)', '#ACDCE8'),
+]
+
+# Fill of the farms overlapping another farm
+OVERLAPPING_COLOR = '#800080'
+
+# Builds the popup of a farm from the properties of its vector tile feature
+FARM_POPUP_SCRIPT = r"""
+function escapeFarmPopupText(value) {
+    return String(value).replace(/[&<>"']/g, function(character) {
+        return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[character];
+    });
+}
+
+function titleFarmPopupText(value) {
+    return String(value).replace(/_/g, " ").toLowerCase().replace(/(^|[^a-z])([a-z])/g, function(match, before, letter) {
+        return before + letter.toUpperCase();
+    });
+}
+
+function getFarmPopupHtml(properties) {
+    var row = function(label, value) {
+        return "<div class='d-flex justify-content-between mb-2'><b>" + label + ":</b> <span class='align-self-end'>" +
+            escapeFarmPopupText(value === undefined ? "-" : value) + "</span></div>";
+    };
+    var html = "<div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Plot Info</div>" +
+        row("GeoID", properties.geoid) + row("Farmer Name", properties.farmer_name) +
+        row("Farm Size", properties.farm_size) + row("Collection Site", properties.collection_site) +
+        row("Agent Name", properties.agent_name) + row("Farm Village", properties.farm_village) +
+        row("District", properties.farm_district);
+    if (properties.polygon_type === "MultiPolygon") {
+        html += "<b>N.B:</b> <i>This is a Multi Polygon Type Plot</i>";
+    }
+    html += "<br><br><div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Farm Analysis</div>";
+    var analysis = JSON.parse(properties.analysis || "{}");
+    Object.keys(analysis).forEach(function(key) {
+        var value = analysis[key];
+        var label = key.replace(/_/g, " ");
+        label = label.charAt(0).toUpperCase() + label.slice(1).toLowerCase();
+        var text = value ? escapeFarmPopupText(titleFarmPopupText(value)) : "-";
+        if (key === "eudr_risk_level") {
+            var level = String(value).toLowerCase();
+            var badge = level === "low" ? "bg-success" : level === "high" ? "bg-danger" : "bg-info";
+            text = "<span class='rounded px-2 py-1 text-white " + badge + "'>" + text + "</span>";
+        }
+        html += "<div class='d-flex justify-content-between mb-2'><b>" + escapeFarmPopupText(label) +
+            ":</b> <span class='align-self-end'>" + text + "</span></div>";
+    });
+    return html;
+}
+"""
+
+
+class FarmTilePopup(MacroElement):
+    """
+    Open the popup of the farm clicked on the parent vector tile layer.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this._parent.get_name() }}.on('click', function(e) {
+            L.popup({minWidth: 300, maxWidth: 500})
+                .setLatLng(e.latlng)
+                .setContent(getFarmPopupHtml(e.layer.properties))
+                .openOn({{ this._parent._parent.get_name() }});
+        });
+        {% endmacro %}
+    """)
+
+
+def get_farm_tile_url(request, file_id=None, farm_id=None, access_code=None, overlapping=False,
+                      farms_version=None):
+    """
+    Return the Leaflet URL template of the farm vector tiles drawn on a map, only drawing
+    the overlapping farms on the overlaps page. The signed version of the map farms keys
+    the cached tiles without reading it again for every tile.
+    """
+    params = {'file-id': file_id, 'farm-id': farm_id, 'access-code': access_code,
+              'overlapping': 'true' if overlapping else None,
+              'version': sign_tile_version(farms_version) if farms_version else None}
+    query = urlencode({key: value for key, value in params.items() if value})
+    tile_url = request.build_absolute_uri(
+        reverse('retrieve_farm_tile', args=[0, 0, 0])).replace('/0/0/0.mvt', '/{z}/{x}/{y}.mvt')
+    return f"{tile_url}?{query}" if query else tile_url
+
+
+def get_risk_tile_layer(tile_url, risk_level, layer_name, color):
+    """
+    Vector tile layer drawing the farms of one EUDR risk level with a solid border and a
+    light fill, darker for the farms overlapping another one. The farms of the other levels
+    are skipped by the style function.
+    """
+    options = f"""{{
+        "rendererFactory": L.canvas.tile,
+        "interactive": true,
+        "maxZoom": 24,
+        "vectorTileLayerStyles": {{
+            "{LAYER_NAME}": function(properties) {{
+                if (properties.eudr_risk_level !== "{risk_level}") {{
+                    return [];
+                }}
+                return {{
+                    "weight": 2, "color": "{color}", "fill": true,
+                    "fillColor": properties.overlapping ? "{OVERLAPPING_COLOR}" : "{color}",
+                    "fillOpacity": properties.overlapping ? 0.3 : 0.1, "radius": 4
+                }};
+            }}
+        }}
+    }}"""
+    return VectorGridProtobuf(tile_url, layer_name, options, overlay=True, control=True, show=True)
+
+
+def get_map_cache_key(request, file_id, farm_id, access_code, overlapping, farms_version, reference_version):
+    """
+    Build the cache key of a rendered map from what it shows: the farm, the file's farms or
+    the user's farms, the versions of those farms and of the reference tile URLs. The
+    host and access code are part of the farm tile URLs written in the map.
+    """
+    if farm_id or file_id:
+        scope = f"file:{file_id or ''}:farm:{farm_id or ''}:overlaps:{bool(overlapping)}"
+    else:
+        scope = f"user:{'staff' if request.user.is_staff else request.user.id}"
+    return (f"{scope}:{farms_version}:{reference_version}:"
+            f"{request.get_host()}:{access_code or ''}")
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -26,14 +170,23 @@ def map_view(request):
     farmId = int(farmId) if farmId else None
 
     if accessCode:
-        try:
-            access_record = EUDRSharedMapAccessCodeModel.objects.get(
-                file_id=fileId, access_code=accessCode)
-            if access_record.valid_until and (access_record.valid_until < timezone.now()):
-                return JsonResponse({"message": "Access Code Expired", "status": 403}, status=403)
-        except BaseException:
-            return JsonResponse(
-                {"message": "Invalid file ID or access code.", "status": 403}, status=403)
+        access_error = check_map_access_code(fileId, accessCode)
+        if access_error:
+            return JsonResponse({"message": access_error, "status": 403}, status=403)
+    if fileId and not fileId.isdigit():
+        return JsonResponse({"message": "Invalid file ID", "status": 400}, status=400)
+
+    # Serve the map rendered for the same farms while its reference tile URLs are cached
+    cache_key = None
+    farms_version = get_farms_version(get_map_view_queryset(request.user, fileId, farmId))
+    reference_version = get_reference_tile_version(
+        [layer_key for layer_key, _ in REFERENCE_LAYER_NAMES])
+    if reference_version:
+        cache_key = get_map_cache_key(
+            request, fileId, farmId, accessCode, overLap, farms_version, reference_version)
+        map_html = map_html_cache.get(cache_key)
+        if map_html is not None:
+            return JsonResponse({'map_html': map_html}, status=200)
 
     initialize_earth_engine()
 
@@ -47,246 +200,45 @@ def map_view(request):
     folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
                      attr='Google', name='Google Satellite', show=False).add_to(m)
 
-    # Fetch protected areas
-    wdpa_poly = ee.FeatureCollection("WCMC/WDPA/current/polygons")
-
-    wdpa_filt = wdpa_poly.filter(
-        ee.Filter.And(ee.Filter.neq('STATUS', 'Proposed'),
-                      ee.Filter.neq('STATUS', 'Not Reported'),
-                      ee.Filter.neq('DESIG_ENG', 'UNESCO-MAB Biosphere Reserve'))
-    )
-    protected_areas = ee.Image().paint(wdpa_filt, 1)
-
     try:
-        # Fetch data from the RESTful API endpoint.
-        base_url = f"{request.scheme}://{request.get_host()}"
-        response = requests.get(f"""{base_url}/api/farm/map/list/""", headers={'Authorization': f"Token {request.user.auth_token}"}) if not fileId and not farmId else requests.get(f"""{base_url}/api/farm/list/{farmId}""", headers={'Authorization': f"Token {request.user.auth_token}"}) if farmId else requests.get(
-            f"""{base_url}/api/farm/list/file/{fileId}/""", headers={'Authorization': f"Token {request.user.auth_token}"}) if not overLap else requests.get(f"""{base_url}/api/farm/overlapping/{fileId}/""", headers={'Authorization': f"Token {request.user.auth_token}"})
-        if response.status_code == 200:
-            farms = [response.json()] if farmId else response.json()
-            if len(farms) > 0:
-                # Try to get the cached tile layers
-                high_risk_tile_layer = None
-                # cache.get(high_risk_tile_cache_key)
-                low_risk_tile_layer = None
-                # cache.get(low_risk_tile_cache_key)
-                more_info_needed_tile_layer = None
-                # cache.get(
-                #     more_info_needed_tile_cache_key)
-
-                high_risk_farms = ee.FeatureCollection([
-                    ee.Feature(
-                        ee.Geometry.Point([farm['longitude'], farm['latitude']]) if not farm.get('polygon') or farm.get('polygon') in ['[]', ''] or not is_valid_polygon(farm.get('polygon'))
-                        else ee.Geometry.Polygon(farm['polygon']),
-                        {
-                            'color': "#F64468",  # Border color
-                        }
-                    )
-                    for farm in farms if farm['analysis']['eudr_risk_level'] == 'high'
-                ])
-
-                # Low-risk farms with border and low-opacity background
-                low_risk_farms = ee.FeatureCollection([
-                    ee.Feature(
-                        ee.Geometry.Point([farm['longitude'], farm['latitude']]) if not farm.get('polygon') or farm.get('polygon') in ['[]', ''] or not is_valid_polygon(farm.get('polygon'))
-                        else ee.Geometry.Polygon(farm['polygon']),
-                        {
-                            'color': "#3AD190",  # Border color
-                        }
-                    )
-                    for farm in farms if farm['analysis']['eudr_risk_level'] == 'low'
-                ])
-
-                # Farms needing more information with border and low-opacity background
-                more_info_needed_farms = ee.FeatureCollection([
-                    ee.Feature(
-                        ee.Geometry.Point([farm['longitude'], farm['latitude']]) if not farm.get('polygon') or farm.get('polygon') in ['[]', ''] or not is_valid_polygon(farm.get('polygon'))
-                        else ee.Geometry.Polygon(farm['polygon']),
-                        {
-                            'color': "#ACDCE8",  # Border color
-                        }
-                    )
-                    for farm in farms if farm['analysis']['eudr_risk_level'] == 'more_info_needed'
-                ])
-
-                # If any of the tile layers are not cached, create and cache them
-                if not high_risk_tile_layer:
-                    high_risk_layer = ee.Image().paint(
-                        # Paint the fill (1) and the border width (2)
-                        high_risk_farms, 1, 2
-                    )
-
-                    # Add the layer with low-opacity fill and a solid border color
-                    high_risk_tile_layer = geemap.ee_tile_layer(
-                        high_risk_layer,
-                        # add the fill color and border color
-                        {'palette': ["#F64468"]},
-                        'EUDR Risk Level (High)',
-                        shown=True
-                    )
-                    # cache.set(high_risk_tile_cache_key, high_risk_tile_layer, timeout=3600)  # Cache for 1 hour
-
-                if not low_risk_tile_layer:
-                    low_risk_layer = ee.Image().paint(low_risk_farms, 1, 2)
-                    low_risk_tile_layer = geemap.ee_tile_layer(
-                        low_risk_layer, {'palette': ["#3AD190"]}, 'EUDR Risk Level (Low)', shown=True)
-                    # cache.set(low_risk_tile_cache_key, low_risk_tile_layer, timeout=3600)
-
-                if not more_info_needed_tile_layer:
-                    more_info_needed_layer = ee.Image().paint(more_info_needed_farms, 1, 2)
-                    more_info_needed_tile_layer = geemap.ee_tile_layer(
-                        more_info_needed_layer, {'palette': ["#ACDCE8"]}, 'EUDR Risk Level (More Info Needed)', shown=True)
-                    # cache.set(more_info_needed_tile_cache_key, more_info_needed_tile_layer, timeout=3600)
-
-                # Add the high risk level farms to the map
-                m.add_child(high_risk_tile_layer)
-
-                # Add the low risk level farms to the map
-                m.add_child(low_risk_tile_layer)
-
-                # Add the more info needed farms to the map
-                m.add_child(more_info_needed_tile_layer)
-
-                for farm in farms:
-                    # Assuming farm data has 'farmer_name', 'latitude', 'longitude', 'farm_size', and 'polygon' fields
-                    polygon = flatten_multipolygon_coordinates(
-                        farm['polygon']) if farm['polygon_type'] == 'MultiPolygon' else farm['polygon']
-                    if 'polygon' in farm and len(polygon) == 1:
-                        polygon = flatten_multipolygon_coordinates(
-                            farm['polygon'])
-
-                        if farm['polygon_type'] != 'Point':
-                            farm_polygon = Polygon(polygon[0])
-                            try:
-                                is_overlapping = any(farm_polygon.overlaps(
-                                    Polygon(other_farm['polygon'][0])) for other_farm in farms)
-                            except BaseException as e:
-                                is_overlapping = False
-
-                            # Define GeoJSON data for Folium
-                            js = {
-                                "type": "FeatureCollection",
-                                "features": [
-                                    {
-                                        "type": "Feature",
-                                        "properties": {},
-                                        "geometry": {
-                                            "coordinates": polygon,
-                                            "type": "Polygon"
-                                        }
-                                    }
-                                ]
-                            }
-
-                            # If overlapping, change the fill color
-                            fill_color = '#800080' if is_overlapping else '#777'
-
-                            # Create the GeoJson object with the appropriate style
-                            geo_pol = folium.GeoJson(
-                                data=js,
-                                control=False,
-                                style_function=lambda x, fill_color=fill_color: {
-                                    'color': 'transparent',
-                                    'fillColor': fill_color
-                                }
-                            )
-                            folium.Popup(
-                                html=f"""
-                    <div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Plot Info</div>
-                    <div class='d-flex justify-content-between mb-2'><b>GeoID:</b> <span class='align-self-end'>{farm['geoid']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farmer Name:</b> <span class='align-self-end'>{farm['farmer_name']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farm Size:</b> <span class='align-self-end'>{farm['farm_size']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Collection Site:</b> <span class='align-self-end'>{farm['collection_site']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Agent Name:</b> <span class='align-self-end'>{farm['agent_name']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farm Village:</b> <span class='align-self-end'>{farm['farm_village']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>District:</b> <span class='align-self-end'>{farm['farm_district']}</span></div>
-                {'<b>N.B:</b> <i>This is a Multi Polygon Type Plot</i>' if farm['polygon_type'] == 'MultiPolygon' else ''}
-                <br><br>
-                <div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Farm Analysis</div>
-                {
-                                    "".join([
-                                        f"<div class='d-flex justify-content-between mb-2'><b>{
-                                            key.replace('_', ' ').capitalize()}:</b> "
-                                        f"<span class='align-self-end'>"
-                                        f"{f'<span class=\"rounded px-2 py-1 text-white' + (' bg-success' if value.lower() == 'low' else ' bg-danger' if value.lower(
-                                        ) == 'high' else ' bg-info') + '\">' + value.title().replace('_', ' ') + '</span>' if key == 'eudr_risk_level' else str(value).replace('_', ' ').title() if value else '-'}"
-                                        f"</span></div>"
-                                        for key, value in farm['analysis'].items()
-                                    ])
-                                }
-                """, min_width="300", max_width="500").add_to(geo_pol)
-                            geo_pol.add_to(m)
-                    else:
-                        folium.Marker(
-                            location=[farm['latitude'], farm['longitude']],
-                            popup=folium.Popup(html=f"""
-                <div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Plot Info</div>
-                    <div class='d-flex justify-content-between mb-2'><b>GeoID:</b> <span class='align-self-end'>{farm['geoid']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farmer Name:</b> <span class='align-self-end'>{farm['farmer_name']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farm Size:</b> <span class='align-self-end'>{farm['farm_size']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Collection Site:</b> <span class='align-self-end'>{farm['collection_site']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Agent Name:</b> <span class='align-self-end'>{farm['agent_name']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>Farm Village:</b> <span class='align-self-end'>{farm['farm_village']}</span></div>
-                    <div class='d-flex justify-content-between mb-2'><b>District:</b> <span class='align-self-end'>{farm['farm_district']}</span></div>
-                <div class='bg-dark rounded p-2 text-white fs-4 mb-2'>Farm Analysis</div>
-                {
-                                "".join([
-                                    f"<div class='d-flex justify-content-between mb-2'><b>{
-                                        key.replace('_', ' ').capitalize()}:</b> "
-                                    f"<span class='align-self-end'>"
-                                    f"{f'<span class=\"rounded px-2 py-1 text-white' + (' bg-success' if value.lower() == 'low' else ' bg-danger' if value.lower(
-                                    ) == 'high' else ' bg-info') + '\">' + value.title().replace('_', ' ') + '</span>' if key == 'eudr_risk_level' else str(value).replace('_', ' ').title() if value else '-'}"
-                                    f"</span></div>"
-                                    for key, value in farm['analysis'].items()
-                                ])
-                            }
-                """, min_width="300", max_width="500", show=True if farmId or (not farmId and farms.index(farm) == 0) else False
-                            ),
-                            icon=folium.Icon(color='green' if farm['analysis']['eudr_risk_level'] ==
-                                             'low' else 'red' if farm['analysis']['eudr_risk_level'] == 'high' else 'lightblue', icon='leaf'),
-                        ).add_to(m)
-
-                # zoom to the extent of the map to the first polygon
-                has_polygon = next(
-                    ((flatten_multipolygon_coordinates(farm['polygon']) if farm['polygon_type'] == 'MultiPolygon' else farm['polygon']) for farm in farms if farm['id'] == farmId and not (flatten_multipolygon_coordinates(farm['polygon']) if farm['polygon_type'] == 'MultiPolygon' else farm['polygon']) or not len(flatten_multipolygon_coordinates(farm['polygon']) if farm['polygon_type'] == 'MultiPolygon' else farm['polygon']) == 2), None)
-                if has_polygon:
-                    m.fit_bounds([reverse_polygon_points(has_polygon)],
-                                 max_zoom=18 if not farmId else 16)
-                else:
-                    m.fit_bounds(
-                        [[farms[0]['latitude'], farms[0]['longitude']]], max_zoom=18)
+        # Only the farm the map is zoomed to is loaded, the farms are drawn from the vector tiles
+        farm = get_map_view_farm(
+            request.user, file_id=fileId, farm_id=farmId, overlapping=overLap)
+        if farm is not None:
+            tile_url = get_farm_tile_url(
+                request, fileId, farmId, accessCode, overLap, farms_version)
+            for risk_level, layer_name, color in RISK_LAYERS:
+                layer = get_risk_tile_layer(tile_url, risk_level, layer_name, color)
+                FarmTilePopup().add_to(layer)
+                layer.add_to(m)
+            m.get_root().script.add_child(folium.Element(FARM_POPUP_SCRIPT))
+
+            # zoom to the extent of the farm, or its point when its bounding box is unknown
+            if farm.min_lat is not None:
+                m.fit_bounds([[farm.min_lat, farm.min_lon], [farm.max_lat, farm.max_lon]],
+                             max_zoom=16 if farmId and farm.polygon_type != 'Point' else 18)
+            else:
+                m.fit_bounds([[farm.latitude, farm.longitude]], max_zoom=18)
         else:
-            print("Failed to fetch data from the API")
+            logger.info("No farms to draw for file %s and farm %s", fileId, farmId)
     except BaseException:
         return JsonResponse({"message": "Failed to fetch data from the API"}, status=500)
     except Exception as e:
         return JsonResponse({"message": "An error occurred"}, status=500)
 
-    # Add protected areas layer
-    protected_areas_vis = {'palette': ['#585858']}
-    protected_areas_map = geemap.ee_tile_layer(
-        protected_areas, protected_areas_vis, 'Protected Areas', shown=False)
-    m.add_child(protected_areas_map)
-
-    # Add forest mapped areas from ee_images.py
-    forest_mapped_areas_map = geemap.ee_tile_layer(
-        combine_forest_cover_images(), {}, 'Forest Mapped Areas', shown=False)
-    m.add_child(forest_mapped_areas_map)
-
-    # Add commodity areas from ee_images.py
-    commodity_areas_map = geemap.ee_tile_layer(
-        combine_commodities_images(), {}, 'Commodity Areas', shown=False)
-    m.add_child(commodity_areas_map)
-
-    # add disturbed areas before 2020
-    disturbed_areas_before_2020_map = geemap.ee_tile_layer(
-        combine_disturbances_before_2020_images(), {}, 'Disturbed Areas Before 2020', shown=False)
-    m.add_child(disturbed_areas_before_2020_map)
-
-    # add disturbed areas after 2020
-    disturbed_areas_after_2020_map = geemap.ee_tile_layer(
-        combine_disturbances_after_2020_images(), {}, 'Disturbed Areas After 2020', shown=False)
-    m.add_child(disturbed_areas_after_2020_map)
+    # Add the reference layers, their tile URLs are shared by every map
+    reference_tile_urls = get_reference_tile_urls(
+        [layer_key for layer_key, _ in REFERENCE_LAYER_NAMES])
+    for layer_key, layer_name in REFERENCE_LAYER_NAMES:
+        folium.TileLayer(
+            tiles=reference_tile_urls[layer_key],
+            attr='Google Earth Engine',
+            name=layer_name,
+            overlay=True,
+            control=True,
+            show=False,
+            max_zoom=24,
+        ).add_to(m)
 
     # Add layer control
     folium.LayerControl(collapsed=False).add_to(m)
@@ -310,5 +262,8 @@ def map_view(request):
 
     # Generate map HTML
     map_html = m._repr_html_()
+    # maps without farms are centred on the user's position, they are not shared
+    if cache_key and farm is not None:
+        map_html_cache.set(cache_key, map_html, timeout=settings.MAP_HTML_CACHE_TIMEOUT)
 
     return JsonResponse({'map_html': map_html}, status=200)
@@ -1,21 +1,63 @@
+import asyncio
+import gzip
+import json
+import os
+import logging
+import re
+from io import StringIO
+import shutil
+import tempfile
+import time
+from types import SimpleNamespace
 from django.urls import reverse
 from eudr_backend.models import EUDRSharedMapAccessCodeModel
 from rest_framework.test import APIClient
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from django.core.cache import cache, caches
+from django.core.files.storage import storages
+from django.conf import settings
+from background_task.models import Task
+from django.core.management import call_command
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.utils import timezone
 import datetime
+import pandas as pd
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+import httpx
+import shapely
+
+from eudr_backend.async_tasks import perform_analysis
+from eudr_backend.bulk_operations import bulk_sync_farm_backups, bulk_upsert_farms
+from eudr_backend.cache import NamespacedCache, ee_tile_cache, farm_tile_cache, flush_stats, get_cache_stats
+from eudr_backend.geojson_stream import GeoJSONFeatureReader
+from eudr_backend.log_utils import LazyPayload, StructuredFormatter, log_sampled
+from eudr_backend.ingestion import ingest_feature_batches, iter_csv_feature_batches, iter_upload_feature_batches, validate_csv_file, validate_upload_file
+from eudr_backend.serializers import EUDRCollectionSiteModelSerializer, EUDRFarmBackupModelSerializer, EUDRFarmModelSerializer, EUDRFarmSummarySerializer
+from eudr_backend.services import filter_overlapping_farms, get_farms_version, get_map_farms, get_map_view_farm, get_overlapping_farms, get_tile_farms
+from eudr_backend.tasks import register_file_geoids
+from eudr_backend.upload_jobs import run_upload_job
+from eudr_backend.spatial import find_overlapping_farms
+from eudr_backend.utils import compute_geometry_hash, format_geojson_data, list_s3_objects, store_file_in_s3
+from eudr_backend.vector_tiles import encode_polygons, sign_tile_version
+from eudr_backend.validators import parse_json_column, validate_csv_rows, validate_geojson, validate_ring_coordinates
+from my_eudr_app import ee_images
 
 from eudr_backend.models import (
     EUDRFarmModel,
     EUDRFarmBackupModel,
     EUDRCollectionSiteModel,
+    EUDRDeletedFarmBackupModel,
     EUDRUploadedFilesModel,
+    EUDRUploadJobModel,
     EUDRSharedMapAccessCodeModel,
-    WhispAPISetting
+    WhispAPISetting,
+    WhispAnalysisCacheModel
 )
 
 
@@ -611,3 +653,1354 @@ class MapViewTest(TestCase):
         self.assertEqual(response.status_code, 403)
         self.assertJSONEqual(response.content, {
                              "message": "Invalid file ID or access code.", "status": 403})
+
+
+    @patch('my_eudr_app.map_views.get_reference_tile_urls',
+           side_effect=lambda keys: {key: f"https://ee.test/{key}/{{z}}/{{x}}/{{y}}" for key in keys})
+    @patch('my_eudr_app.map_views.initialize_earth_engine')
+    def test_risk_layers_are_drawn_from_the_vector_tiles(self, mock_initialize, mock_tile_urls):
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='testuser')
+        EUDRFarmModel.objects.create(
+            farmer_name="Map Farmer", farm_size=1.0, farm_village="V", farm_district="D",
+            latitude=-1.9, longitude=30.0, polygon=[], analysis={"eudr_risk_level": "low"},
+            file_id=uploaded_file.id)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        with patch('ee.FeatureCollection') as feature_collection:
+            response = self.client.get(self.map_url, {'file-id': uploaded_file.id})
+
+        self.assertEqual(response.status_code, 200)
+        map_html = response.json()["map_html"]
+        self.assertIn("vectorGrid.protobuf", map_html)
+        self.assertIn(f"/api/farm/tiles/{{z}}/{{x}}/{{y}}.mvt?file-id={uploaded_file.id}", map_html)
+        # the tiles are keyed on the signed version of the map farms
+        self.assertIn("&amp;version=", map_html)
+        self.assertIn("EUDR Risk Level (More Info Needed)", map_html)
+        feature_collection.assert_not_called()
+
+    @patch('my_eudr_app.map_views.get_reference_tile_urls',
+           side_effect=lambda keys: {key: f"https://ee.test/{key}/{{z}}/{{x}}/{{y}}" for key in keys})
+    @patch('my_eudr_app.map_views.initialize_earth_engine')
+    def test_overlaps_map_draws_the_overlapping_farm_tiles(self, mock_initialize, mock_tile_urls):
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='testuser')
+        square = [[30.0, -1.0], [30.001, -1.0], [30.001, -0.999], [30.0, -0.999], [30.0, -1.0]]
+        for i in range(2):
+            EUDRFarmModel.objects.create(
+                farmer_name=f"Map Farmer {i}", farm_size=1.0, farm_village="V", farm_district="D",
+                polygon=[[[x + i * 0.0005, y] for x, y in square]], polygon_type="Polygon",
+                analysis={"eudr_risk_level": "low"}, file_id=uploaded_file.id)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        response = self.client.get(self.map_url, {'file-id': uploaded_file.id},
+                                   HTTP_REFERER='http://testserver/overlaps')
+
+        self.assertEqual(response.status_code, 200)
+        map_html = response.json()["map_html"]
+        self.assertIn(f".mvt?file-id={uploaded_file.id}&", map_html)
+        self.assertIn("overlapping=true", map_html)
+
+    @patch('my_eudr_app.map_views.get_reference_tile_version', return_value="1:1:1:1:1")
+    @patch('my_eudr_app.map_views.get_reference_tile_urls',
+           side_effect=lambda keys: {key: f"https://ee.test/{key}/{{z}}/{{x}}/{{y}}" for key in keys})
+    @patch('my_eudr_app.map_views.initialize_earth_engine')
+    def test_rendered_map_is_cached_until_its_farms_change(self, mock_initialize, *mocks):
+        cache.clear()
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='testuser')
+        farm = EUDRFarmModel.objects.create(
+            farmer_name="Map Farmer", farm_size=1.0, farm_village="V", farm_district="D",
+            latitude=-1.9, longitude=30.0, polygon=[], analysis={"eudr_risk_level": "low"},
+            file_id=uploaded_file.id)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        first = self.client.get(self.map_url, {'file-id': uploaded_file.id})
+        second = self.client.get(self.map_url, {'file-id': uploaded_file.id})
+        self.assertEqual(mock_initialize.call_count, 1)
+        self.assertEqual(first.json(), second.json())
+
+        farm.farmer_name = "Renamed Farmer"
+        farm.save()
+        third = self.client.get(self.map_url, {'file-id': uploaded_file.id})
+        self.assertEqual(mock_initialize.call_count, 2)
+        self.assertNotEqual(first.json(), third.json())
+
+    @patch('my_eudr_app.map_views.get_reference_tile_urls',
+           side_effect=lambda keys: {key: f"https://ee.test/{key}/{{z}}/{{x}}/{{y}}" for key in keys})
+    @patch('my_eudr_app.map_views.initialize_earth_engine')
+    def test_map_html_does_not_grow_with_the_farms(self, mock_initialize, mock_tile_urls):
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='testuser')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        def add_farms(count):
+            for i in range(count):
+                EUDRFarmModel.objects.create(
+                    farmer_name=f"Map Farmer {i}", farm_size=1.0, farm_village="V", farm_district="D",
+                    latitude=-1.9, longitude=30.0 + i / 1000, polygon=[],
+                    analysis={"eudr_risk_level": "low"}, file_id=uploaded_file.id)
+            return self.client.get(self.map_url, {'file-id': uploaded_file.id}).json()["map_html"]
+
+        one_farm = add_farms(1)
+        many_farms = add_farms(50)
+
+        self.assertLess(abs(len(many_farms) - len(one_farm)), 100)
+        self.assertNotIn("Map Farmer", many_farms)
+        # the popups are built from the tile features in the browser
+        self.assertIn("getFarmPopupHtml(e.layer.properties)", many_farms)
+
+class PerformAnalysisTest(TestCase):
+    def setUp(self):
+        WhispAPISetting.objects.create(chunk_size=2, concurrency_limit=3)
+        self.data = {"type": "FeatureCollection", "features": [
+            {
+                "type": "Feature",
+                "properties": {"farmer_name": f"farmer {i}"},
+                "geometry": {"type": "Point", "coordinates": [30.0 + i, -1.9]}
+            } for i in range(7)
+        ]}
+
+    def _fake_post(self, running, failing_chunk=None):
+        async def post(client, url, headers=None, json=None):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            first = json["features"][0]["geometry"]["coordinates"][0]
+            # finish the later chunks first to check the results order
+            await asyncio.sleep(0.05 - first / 1000)
+            running["now"] -= 1
+            if first == failing_chunk:
+                return httpx.Response(500)
+            return httpx.Response(200, json={"data": {"features": [
+                {"properties": {"farmer_name": feature["properties"]["farmer_name"]}}
+                for feature in json["features"]
+            ]}})
+        return post
+
+    def test_chunks_are_submitted_concurrently_in_order(self):
+        running = {"now": 0, "max": 0}
+        with patch('httpx.AsyncClient.post', self._fake_post(running)):
+            err, results = async_to_sync(perform_analysis)(self.data)
+
+        self.assertIsNone(err)
+        self.assertEqual([result["properties"]["farmer_name"] for result in results],
+                         [f"farmer {i}" for i in range(7)])
+        self.assertEqual(running["max"], 3)
+
+    def test_failed_chunk_fails_the_whole_batch(self):
+        running = {"now": 0, "max": 0}
+        with patch('httpx.AsyncClient.post', self._fake_post(running, failing_chunk=32.0)):
+            err, results = async_to_sync(perform_analysis)(self.data)
+
+        self.assertEqual(err, {"error": "Validation against global database failed."})
+        self.assertIsNone(results)
+
+    def test_cached_features_are_not_submitted_again(self):
+        running = {"now": 0, "max": 0}
+        with patch('httpx.AsyncClient.post', self._fake_post(running)):
+            async_to_sync(perform_analysis)(self.data)
+        self.assertEqual(WhispAnalysisCacheModel.objects.count(), 7)
+
+        self.data["features"].append({
+            "type": "Feature",
+            "properties": {"farmer_name": "farmer 7"},
+            "geometry": {"type": "Point", "coordinates": [37.0, -1.9]}
+        })
+        submitted = []
+        fake_post = self._fake_post(running)
+
+        async def post(client, url, headers=None, json=None):
+            submitted.extend(feature["properties"]["farmer_name"]
+                             for feature in json["features"])
+            return await fake_post(client, url, headers=headers, json=json)
+
+        with patch('httpx.AsyncClient.post', post):
+            err, results = async_to_sync(perform_analysis)(self.data)
+
+        self.assertIsNone(err)
+        self.assertEqual(submitted, ["farmer 7"])
+        self.assertEqual([result["properties"]["farmer_name"] for result in results],
+                         [f"farmer {i}" for i in range(8)])
+
+
+class FormatGeoJSONDataTest(TestCase):
+    def _feature(self, remote_id, commodity, feature_id=None):
+        feature = {
+            "type": "Feature",
+            "properties": {"remote_id": remote_id, "commodity": commodity, "farm_size": 1},
+            "geometry": {"type": "Point", "coordinates": [30.0, -1.9]},
+        }
+        if feature_id is not None:
+            feature["id"] = feature_id
+        return feature
+
+    def test_each_feature_gets_the_risk_of_its_own_result_and_commodity(self):
+        geojson = {"type": "FeatureCollection", "features": [
+            self._feature("a", "Coffee"), self._feature("b", "Soy"), self._feature("c", None)]}
+        analysis = [
+            {"properties": {"risk_pcrop": "low", "risk_acrop": "high"}},
+            {"properties": {"risk_pcrop": "low", "risk_acrop": "high"}},
+            {"properties": {"risk_pcrop": "more_info_needed"}},
+        ]
+
+        records = format_geojson_data(geojson, analysis, file_id=1)
+
+        self.assertEqual([record["analysis"]["eudr_risk_level"] for record in records],
+                         ["low", "high", "more_info_needed"])
+        self.assertEqual(records[2]["commodity"], "Coffee")
+
+    def test_commodities_are_matched_whatever_their_case(self):
+        geojson = {"type": "FeatureCollection", "features": [
+            self._feature("a", "COFFEE"), self._feature("b", "SOY"), self._feature("c", "Cashew")]}
+        analysis = [{"properties": {"risk_pcrop": "low", "risk_acrop": "high"}}] * 3
+
+        records = format_geojson_data(geojson, analysis, file_id=1)
+
+        # commodities without their own risk get the one of the default commodity
+        self.assertEqual([record["analysis"]["eudr_risk_level"] for record in records],
+                         ["low", "high", "low"])
+
+    def test_results_are_matched_on_the_feature_id_when_some_are_missing(self):
+        geojson = {"type": "FeatureCollection", "features": [
+            self._feature("a", "Coffee", feature_id=1), self._feature("b", "Coffee", feature_id=2)]}
+        analysis = [{"id": 2, "properties": {"risk_pcrop": "high"}}]
+
+        records = format_geojson_data(geojson, analysis)
+
+        self.assertIsNone(records[0]["analysis"]["eudr_risk_level"])
+        self.assertEqual(records[1]["analysis"]["eudr_risk_level"], "high")
+
+
+class StructuredLoggingTest(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('eudr_backend.tests')
+
+    def test_records_are_formatted_as_json_with_their_extra_fields(self):
+        record = self.logger.makeRecord(
+            self.logger.name, logging.INFO, __file__, 1, "Saved file %s", (3,), None,
+            extra={"file_id": 3})
+
+        entry = json.loads(StructuredFormatter().format(record))
+
+        self.assertEqual(entry["message"], "Saved file 3")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["file_id"], 3)
+
+    def test_payloads_are_only_serialised_when_emitted(self):
+        payload = MagicMock()
+        self.logger.setLevel(logging.WARNING)
+        self.logger.debug("Payload %s", LazyPayload(payload))
+        payload.__str__.assert_not_called()
+
+        self.assertEqual(str(LazyPayload("x" * 10, limit=4)), "xxxx... (10 characters)")
+
+    def test_sampled_events_follow_the_rate(self):
+        self.logger.setLevel(logging.DEBUG)
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            for _ in range(5):
+                log_sampled(self.logger, logging.DEBUG, "Feature event", rate=1)
+                log_sampled(self.logger, logging.DEBUG, "Skipped event", rate=0)
+
+        self.assertEqual(len(logs.records), 5)
+        self.assertTrue(all(record.getMessage() == "Feature event" for record in logs.records))
+
+
+class GeometryHashTest(TestCase):
+    def test_hash_ignores_ring_start_orientation_and_noise(self):
+        ring = [[30.0, -1.0], [30.1, -1.0], [30.1, -1.1], [30.0, -1.0]]
+        rotated_reversed = [[30.1, -1.1], [30.1, -1.0], [30.0000000001, -1.0], [30.1, -1.1]]
+        self.assertEqual(
+            compute_geometry_hash({"type": "Polygon", "coordinates": [ring]}),
+            compute_geometry_hash({"type": "Polygon", "coordinates": [rotated_reversed]}))
+
+    def test_hash_changes_with_geometry(self):
+        self.assertNotEqual(
+            compute_geometry_hash({"type": "Point", "coordinates": [30.0, -1.0]}),
+            compute_geometry_hash({"type": "Point", "coordinates": [30.0, -1.1]}))
+
+
+class BulkUpsertFarmsTest(TestCase):
+    def setUp(self):
+        self.uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='owner')
+
+    def _farm(self, i, **kwargs):
+        farm = {
+            "farmer_name": f"farmer {i}",
+            "farm_size": 1.0,
+            "collection_site": "Site A",
+            "farm_village": "Village A",
+            "farm_district": "District A",
+            "latitude": -1.9 - i / 100,
+            "longitude": 30.0 + i / 100,
+            "polygon": [],
+            "polygon_type": "Point",
+            "file_id": self.uploaded_file.id,
+            "analysis": {"eudr_risk_level": "low"},
+        }
+        farm.update(kwargs)
+        return farm
+
+    def test_creates_and_updates_in_batches(self):
+        existing = EUDRFarmModel.objects.create(**self._farm(0))
+        items = [self._farm(i) for i in range(50)]
+        items[0]["analysis"] = {"eudr_risk_level": "high"}
+
+        with CaptureQueriesContext(connection) as queries:
+            errors, saved_records = bulk_upsert_farms(items, batch_size=20)
+
+        self.assertIsNone(errors)
+        self.assertEqual(len(saved_records), 50)
+        # the file of the 50 farms is looked up once
+        self.assertLess(len(queries), 11)
+        self.assertEqual(EUDRFarmModel.objects.count(), 50)
+        existing.refresh_from_db()
+        self.assertEqual(existing.analysis, {"eudr_risk_level": "high"})
+        self.assertEqual(saved_records[0].pk, existing.pk)
+
+    def test_duplicate_farms_in_one_batch_are_saved_once(self):
+        errors, saved_records = bulk_upsert_farms([self._farm(1), self._farm(1)])
+
+        self.assertIsNone(errors)
+        self.assertEqual(EUDRFarmModel.objects.count(), 1)
+
+    def test_invalid_farms_are_reported_without_saving(self):
+        errors, saved_records = bulk_upsert_farms(
+            [self._farm(1), self._farm(2, farm_size="large")])
+
+        self.assertIsNone(saved_records)
+        self.assertEqual(errors[0]["record"], 2)
+        self.assertIn("farm_size", errors[0]["errors"])
+        self.assertEqual(EUDRFarmModel.objects.count(), 0)
+
+
+class BulkSyncFarmBackupsTest(TestCase):
+    def _farm(self, remote_id, **kwargs):
+        return {"remote_id": remote_id, "farmer_name": f"Farmer {remote_id}", "village": "V",
+                "district": "D", "size": 1.5, "coordinates": [], "accuracies": [], **kwargs}
+
+    def _entry(self, site_name, farms):
+        return {"device_id": "device", "collection_site": {
+            "name": site_name, "village": "V", "district": "D"}, "farms": farms}
+
+    def test_sites_and_farms_are_upserted_in_a_few_queries(self):
+        site = EUDRCollectionSiteModel.objects.create(name="Site A", village="Old", district="D")
+        existing = EUDRFarmBackupModel.objects.create(
+            remote_id="farm-0", farmer_name="Old name", village="V", district="D")
+        entries = [
+            self._entry("Site A", [self._farm(f"farm-{i}") for i in range(100)]),
+            self._entry("Site B", [self._farm(f"farm-{i}") for i in range(100, 200)]),
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            synced_remote_ids = bulk_sync_farm_backups(entries, batch_size=50)
+
+        self.assertEqual(synced_remote_ids, [f"farm-{i}" for i in range(200)])
+        self.assertLess(len(queries), 15)
+        self.assertEqual(EUDRCollectionSiteModel.objects.count(), 2)
+        self.assertEqual(EUDRFarmBackupModel.objects.count(), 200)
+        site.refresh_from_db()
+        existing.refresh_from_db()
+        self.assertEqual((site.village, site.device_id), ("V", "device"))
+        self.assertEqual((existing.farmer_name, existing.site_id), ("Farmer farm-0", site))
+        self.assertEqual(EUDRFarmBackupModel.objects.get(
+            remote_id="farm-150").site_id.name, "Site B")
+
+    def test_farms_sent_twice_are_saved_once_with_their_last_values(self):
+        synced_remote_ids = bulk_sync_farm_backups([
+            self._entry("Site A", [self._farm("farm-1", size=1.0)]),
+            self._entry("Site A", [self._farm("farm-1", size=2.0)]),
+        ])
+
+        self.assertEqual(synced_remote_ids, ["farm-1", "farm-1"])
+        self.assertEqual(EUDRFarmBackupModel.objects.get(remote_id="farm-1").size, 2.0)
+        self.assertEqual(EUDRCollectionSiteModel.objects.filter(name="Site A").count(), 1)
+
+
+class DeltaSyncTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='agent', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('delta_sync_farm_data')
+        self.site = EUDRCollectionSiteModel.objects.create(
+            name="Site A", device_id="device", village="V", district="D")
+        self.farms = [
+            EUDRFarmBackupModel.objects.create(
+                remote_id=f"farm-{i}", farmer_name=f"Farmer {i}", village="V", district="D",
+                site_id=self.site)
+            for i in range(3)
+        ]
+        EUDRFarmBackupModel.objects.create(
+            remote_id="other", farmer_name="Other", village="V", district="D",
+            site_id=EUDRCollectionSiteModel.objects.create(
+                name="Site B", device_id="other-device", village="V", district="D"))
+
+    def _sync(self, **data):
+        response = self.client.post(self.url, {"device_id": "device", **data}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def _age_rows(self):
+        an_hour_ago = timezone.now() - datetime.timedelta(hours=1)
+        EUDRFarmBackupModel.objects.update(updated_at=an_hour_ago)
+        EUDRCollectionSiteModel.objects.update(updated_at=an_hour_ago)
+
+    def test_first_sync_returns_a_full_snapshot_of_the_device_sites(self):
+        result = self._sync()
+
+        self.assertTrue(result["full"])
+        self.assertEqual([entry["collection_site"]["name"] for entry in result["changes"]], ["Site A"])
+        self.assertEqual([farm["remote_id"] for farm in result["changes"][0]["farms"]],
+                         ["farm-0", "farm-1", "farm-2"])
+
+    def test_next_syncs_only_exchange_the_changes_since_the_token(self):
+        self._age_rows()
+        token = self._sync()["sync_token"]
+        self._age_rows()
+        changed = self.farms[1]
+        changed.farmer_name = "Renamed on the server"
+        changed.save()
+        EUDRDeletedFarmBackupModel.objects.create(remote_id="removed", site_id=self.site)
+
+        result = self._sync(sync_token=token, changes=[{
+            "collection_site": {"name": "Site A", "village": "V", "district": "D"},
+            "farms": [{"remote_id": "farm-3", "farmer_name": "New", "village": "V", "district": "D"}],
+        }], deleted_remote_ids=["farm-0", "other"])
+
+        self.assertFalse(result["full"])
+        self.assertEqual(result["synced_remote_ids"], ["farm-3"])
+        # farms of the other devices are not deleted
+        self.assertEqual(result["synced_deleted_remote_ids"], ["farm-0"])
+        self.assertTrue(EUDRFarmBackupModel.objects.filter(remote_id="other").exists())
+        # the pushed farm is not sent back, the farm changed on the server is
+        self.assertEqual([farm["remote_id"] for farm in result["changes"][0]["farms"]], ["farm-1"])
+        self.assertEqual(result["deleted_remote_ids"], ["removed"])
+
+        # nothing changed since the last sync once its rows are out of the overlap window
+        self._age_rows()
+        EUDRDeletedFarmBackupModel.objects.update(
+            deleted_at=timezone.now() - datetime.timedelta(hours=1))
+        result = self._sync(sync_token=result["sync_token"])
+        self.assertEqual((result["changes"], result["deleted_remote_ids"]), ([], []))
+
+    def test_first_sync_snapshot_includes_the_pushed_farms(self):
+        result = self._sync(changes=[{
+            "collection_site": {"name": "Site A", "village": "V", "district": "D"},
+            "farms": [{"remote_id": "f1", "farmer_name": "New", "village": "V", "district": "D"}],
+        }])
+
+        self.assertTrue(result["full"])
+        self.assertEqual(result["synced_remote_ids"], ["f1"])
+        self.assertEqual([farm["remote_id"] for farm in result["changes"][0]["farms"]],
+                         ["farm-0", "farm-1", "farm-2", "f1"])
+
+    def test_farms_created_again_are_not_sent_as_deleted(self):
+        self._age_rows()
+        token = self._sync()["sync_token"]
+        EUDRDeletedFarmBackupModel.objects.create(remote_id="farm-0", site_id=self.site)
+        EUDRDeletedFarmBackupModel.objects.create(remote_id="removed", site_id=self.site)
+        self.farms[0].save()
+
+        result = self._sync(sync_token=token)
+
+        self.assertEqual([farm["remote_id"] for farm in result["changes"][0]["farms"]], ["farm-0"])
+        self.assertEqual(result["deleted_remote_ids"], ["removed"])
+
+    def test_tokens_of_other_devices_are_rejected(self):
+        token = self._sync()["sync_token"]
+        response = self.client.post(
+            self.url, {"device_id": "other-device", "sync_token": token}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.post(self.url, {"device_id": "device"}, format='json').status_code, 401)
+
+    def test_gzip_bodies_are_accepted_and_responses_compressed(self):
+        body = gzip.compress(json.dumps({"device_id": "device"}).encode())
+        response = self.client.post(
+            self.url, body, content_type='application/json',
+            HTTP_CONTENT_ENCODING='gzip', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["changes"][0]["farms"]), 3)
+
+
+class RestoreFarmDataTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.sites = [
+            EUDRCollectionSiteModel.objects.create(
+                name=f"Site {i}", device_id="device", village="V", district="D")
+            for i in range(5)
+        ]
+        for site in self.sites[:4]:
+            for i in range(3):
+                EUDRFarmBackupModel.objects.create(
+                    remote_id=f"{site.name}-{i}", farmer_name="Farmer", village="V", district="D",
+                    size=1.5, coordinates=[[30.0, -1.9]], site_id=site)
+
+    def _restore(self, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('restore_farm_data'), data, format='json')
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, json.loads(content), queries
+
+    def test_sites_are_restored_in_the_serializer_format_with_two_queries(self):
+        response, data, queries = self._restore({'device_id': 'device'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        expected = [{
+            "device_id": site.device_id,
+            "collection_site": EUDRCollectionSiteModelSerializer(site).data,
+            "farms": EUDRFarmBackupModelSerializer(
+                EUDRFarmBackupModel.objects.filter(site_id=site.id).order_by('id'), many=True).data,
+        } for site in self.sites]
+        self.assertEqual(data, json.loads(json.dumps(expected)))
+        self.assertEqual(data[4]["farms"], [])
+
+    def test_unknown_devices_restore_nothing(self):
+        self.assertEqual(self._restore({'device_id': 'unknown'})[1], [])
+        self.assertEqual(self._restore({})[1], [])
+
+
+class OverlappingFarmsTest(TestCase):
+    def _square(self, lon, lat, size=0.001):
+        return [[[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]]
+
+    def test_only_overlapping_pairs_are_returned_with_area(self):
+        farms = [
+            {"id": 1, "polygon": self._square(30.0, -1.0), "polygon_type": "Polygon"},
+            {"id": 2, "polygon": self._square(30.0005, -1.0), "polygon_type": "Polygon"},
+            {"id": 3, "polygon": self._square(31.0, -1.0), "polygon_type": "Polygon"},
+            {"id": 4, "polygon": [], "polygon_type": "Point"},
+        ]
+
+        overlapping = find_overlapping_farms(farms)
+
+        self.assertEqual([farm["id"] for farm in overlapping], [1, 2])
+        self.assertEqual(overlapping[0]["overlaps"][0]["farm_id"], 2)
+        self.assertEqual(overlapping[1]["overlaps"][0]["farm_id"], 1)
+        # half of a 0.001 degree square near the equator is about 0.62 ha
+        self.assertAlmostEqual(overlapping[0]["overlaps"][0]["overlap_area_ha"], 0.62, places=1)
+
+
+class FarmGeometryColumnsTest(TestCase):
+    square = [[[30.0, -1.0], [30.001, -1.0], [30.001, -0.999], [30.0, -0.999], [30.0, -1.0]]]
+
+    def setUp(self):
+        self.uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='owner')
+
+    def _farm(self, name, polygon, **kwargs):
+        return {"farmer_name": name, "farm_size": 1.0, "farm_village": "V", "farm_district": "D",
+                "collection_site": "Site", "polygon": polygon, "file_id": self.uploaded_file.id,
+                **kwargs}
+
+    def test_save_stores_the_wkb_and_bounding_box(self):
+        farm = EUDRFarmModel.objects.create(**self._farm("Polygon", self.square))
+        point = EUDRFarmModel.objects.create(
+            **self._farm("Point", [], latitude=-1.5, longitude=30.5))
+        farm.refresh_from_db()
+
+        self.assertTrue(shapely.from_wkb(bytes(farm.geometry_wkb)).equals(
+            shapely.Polygon(self.square[0])))
+        self.assertEqual([farm.min_lon, farm.min_lat, farm.max_lon, farm.max_lat],
+                         [30.0, -1.0, 30.001, -0.999])
+        self.assertIsNone(point.geometry_wkb)
+        self.assertEqual([point.min_lon, point.max_lat], [30.5, -1.5])
+
+    def test_bulk_upsert_fills_the_geometry_columns(self):
+        existing = EUDRFarmModel.objects.create(
+            **self._farm("Farmer", [[[0, 0], [0, 1], [1, 1], [0, 0]]]))
+
+        bulk_upsert_farms([self._farm("Farmer", self.square, polygon_type="Polygon"),
+                           self._farm("New Farmer", self.square, polygon_type="Polygon")])
+
+        existing.refresh_from_db()
+        self.assertEqual(EUDRFarmModel.objects.count(), 2)
+        self.assertFalse(EUDRFarmModel.objects.filter(geometry_wkb__isnull=True).exists())
+        self.assertEqual(existing.min_lon, 30.0)
+
+    def test_overlaps_are_read_from_the_stored_geometries(self):
+        first = EUDRFarmModel.objects.create(**self._farm("First", self.square))
+        second = EUDRFarmModel.objects.create(**self._farm(
+            "Second", [[[x + 0.0005, y] for x, y in self.square[0]]]))
+        EUDRFarmModel.objects.create(**self._farm("Point", []))
+        # farms saved before the geometry columns existed are read from their polygon
+        EUDRFarmModel.objects.filter(id=second.id).update(geometry_wkb=None)
+
+        overlapping = get_overlapping_farms(self.uploaded_file.id)
+
+        self.assertEqual({farm["id"] for farm in overlapping}, {first.id, second.id})
+        self.assertEqual(set(filter_overlapping_farms(get_map_farms(User.objects.create_user(
+            username='staff', is_staff=True))).values_list('id', flat=True)), {first.id, second.id})
+
+
+class FarmFileForeignKeyTest(TestCase):
+    def setUp(self):
+        self.uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='owner')
+        self.farm = EUDRFarmModel.objects.create(
+            farmer_name="Farmer", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=str(self.uploaded_file.id))
+
+    def test_serializers_keep_the_file_id_key(self):
+        self.assertEqual(EUDRFarmModelSerializer(self.farm).data["file_id"], self.uploaded_file.id)
+        self.assertIn("file_id", EUDRFarmSummarySerializer.summary_fields())
+        self.assertEqual(EUDRFarmModel.objects.filter(file_id=str(self.uploaded_file.id)).count(), 1)
+
+    def test_unknown_file_ids_are_rejected(self):
+        user = User.objects.create_user(username='owner', password='password123')
+        client = APIClient()
+        client.force_authenticate(user=user)
+
+        response = client.put(reverse('update_farm_data', args=[self.farm.id]), {
+            "farmer_name": "Farmer", "farm_size": 1.0, "farm_village": "V", "farm_district": "D",
+            "polygon": [], "file_id": 999999}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file_id", response.data)
+        self.farm.refresh_from_db()
+        self.assertEqual(self.farm.file_id, self.uploaded_file.id)
+
+    def test_frontend_compares_integer_file_ids_with_the_url_text(self):
+        for name in ('custom.js', 'argon-dashboard.js'):
+            with open(os.path.join(settings.BASE_DIR, 'staticfiles', 'assets', 'js', name)) as script:
+                self.assertNotRegex(script.read(), r'[^(]file_id\s*===', name)
+
+    def test_deleting_a_file_keeps_its_farms(self):
+        self.uploaded_file.delete()
+
+        self.farm.refresh_from_db()
+        self.assertIsNone(self.farm.file_id)
+
+    def test_query_plans_are_shown_with_and_without_the_indexes(self):
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+
+        self.assertIn("farm list of the user's files", out.getvalue())
+        self.assertIn("without indexes", out.getvalue())
+        # the indexes dropped to read the plans are restored
+        self.assertIn("farm_file_updated_idx", [
+            index.name for index in EUDRFarmModel._meta.indexes])
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, EUDRFarmModel._meta.db_table)
+        self.assertIn("farm_file_updated_idx", constraints)
+
+
+class FarmQueryServiceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='password123')
+        self.staff = User.objects.create_user(
+            username='staff', password='password123', is_staff=True)
+        own_file = EUDRUploadedFilesModel.objects.create(
+            file_name='own.csv', uploaded_by='owner')
+        other_file = EUDRUploadedFilesModel.objects.create(
+            file_name='other.csv', uploaded_by='someone')
+        self.own_farm = EUDRFarmModel.objects.create(
+            farmer_name="Alice", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=own_file.id)
+        self.other_farm = EUDRFarmModel.objects.create(
+            farmer_name="Bob", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=other_file.id)
+
+    def test_map_farms_are_scoped_to_the_user_files(self):
+        self.assertEqual(list(get_map_farms(self.user)), [self.own_farm])
+        self.assertEqual(get_map_view_farm(self.user), self.own_farm)
+
+    def test_staff_see_every_farm(self):
+        self.assertEqual(get_map_farms(self.staff).count(), 2)
+        # the map is zoomed to the latest farm
+        self.assertEqual(get_map_view_farm(self.staff), self.other_farm)
+
+    def test_single_farm_lookup(self):
+        self.assertEqual(get_map_view_farm(self.user, farm_id=self.other_farm.id), self.other_farm)
+        self.assertIsNone(get_map_view_farm(self.user, farm_id=self.other_farm.id + 100))
+
+
+class ReferenceTileCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.layers = {
+            'forest_cover': (lambda: 'forest', {}),
+            'commodities': (lambda: 'commodities', {}),
+        }
+
+    def _mock_image(self):
+        image = MagicMock()
+        image.return_value.getMapId.side_effect = lambda vis_params: {
+            'tile_fetcher': SimpleNamespace(url_format=f"https://ee/{len(image.call_args_list)}/{{z}}/{{x}}/{{y}}")}
+        return image
+
+    def test_map_ids_are_requested_once(self):
+        image = self._mock_image()
+        with patch.dict(ee_images.REFERENCE_LAYERS, self.layers), \
+                patch('my_eudr_app.ee_images.ee.Image', image):
+            first = ee_images.get_reference_tile_urls(['forest_cover', 'commodities'])
+            second = ee_images.get_reference_tile_urls(['forest_cover', 'commodities'])
+
+        self.assertEqual(image.return_value.getMapId.call_count, 2)
+        self.assertEqual(first, second)
+
+    def test_urls_close_to_expiry_are_refreshed_in_background(self):
+        ee_tile_cache.set('forest_cover', {'url': 'https://ee/old', 'fetched_at': time.time() - 3500})
+        with patch.dict(ee_images.REFERENCE_LAYERS, self.layers), \
+                patch('my_eudr_app.ee_images.refresh_reference_tile_url') as refresh:
+            urls = ee_images.get_reference_tile_urls(['forest_cover'])
+
+        # the stale URL is still served while a new one is fetched
+        self.assertEqual(urls['forest_cover'], 'https://ee/old')
+        refresh.assert_called_once_with('forest_cover')
+
+
+class SharedCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_keys_are_namespaced_and_lookups_counted(self):
+        first, second = NamespacedCache('first'), NamespacedCache('second')
+        first.set('key', 1)
+        second.set('key', 2)
+
+        self.assertEqual(cache.get('first:key'), 1)
+        self.assertEqual(first.get('key'), 1)
+        self.assertEqual(second.get('key'), 2)
+        self.assertIsNone(first.get('missing'))
+        self.assertEqual(first.get_many(['key', 'missing']), {'key': 1})
+        flush_stats()
+
+        stats = get_cache_stats()
+        self.assertEqual(stats['first'], {'hits': 2, 'misses': 2, 'hit_ratio': 0.5})
+        self.assertEqual(stats['second'], {'hits': 1, 'misses': 0, 'hit_ratio': 1.0})
+
+    def test_farm_tiles_do_not_evict_the_default_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        small_caches = {
+            alias: {**options, "LOCATION": os.path.join(location, alias), "OPTIONS": {"MAX_ENTRIES": 5}}
+            for alias, options in settings.CACHES.items()
+        }
+        with self.settings(CACHES=small_caches):
+            ee_tile_cache.set('forest_cover', 'https://ee.test/{z}/{x}/{y}')
+            for i in range(20):
+                farm_tile_cache.set(f'tile:{i}', b'tile')
+
+            self.assertEqual(ee_tile_cache.get('forest_cover'), 'https://ee.test/{z}/{x}/{y}')
+            self.assertIsNone(cache.get('farm_tiles:tile:0'))
+
+    @patch('eudr_backend.utils.boto3.client')
+    def test_s3_listing_is_cached_until_a_file_is_stored(self, client):
+        client.return_value.list_objects_v2.return_value = {'Contents': [
+            {'Key': 'file.csv', 'LastModified': timezone.now(), 'Size': 10, 'ETag': 'x'}]}
+
+        self.assertEqual(list_s3_objects()[0]['Key'], 'file.csv')
+        list_s3_objects()
+        self.assertEqual(client.return_value.list_objects_v2.call_count, 1)
+
+        store_file_in_s3(SimpleUploadedFile('other.csv', b'a'), SimpleNamespace(username='user'), 'other.csv')
+        list_s3_objects()
+        self.assertEqual(client.return_value.list_objects_v2.call_count, 2)
+
+
+class FarmListPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='staff', password='password123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='staff')
+        self.farms = [
+            EUDRFarmModel.objects.create(
+                farmer_name=f"Farmer {i}", farm_size=1.0, farm_village="V", farm_district="D",
+                polygon=[[[0, 0], [0, 1], [1, 1], [0, 0]]], analysis={"eudr_risk_level": "low"},
+                file_id=uploaded_file.id)
+            for i in range(5)
+        ]
+        # give some farms the same updated_at to exercise the id tie-break
+        EUDRFarmModel.objects.filter(id__in=[farm.id for farm in self.farms[:3]]).update(
+            updated_at=timezone.now())
+        self.url = reverse('retrieve_farm_data')
+
+    def test_list_is_unchanged_without_parameters(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertIn("polygon", response.data[0])
+
+    def test_cursor_walks_every_farm_once(self):
+        seen = []
+        params = {'limit': 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(farm["id"] for farm in response.data["results"])
+            self.assertNotIn("polygon", response.data["results"][0])
+            if not response.data["next_cursor"]:
+                break
+            params = {'limit': 2, 'cursor': response.data["next_cursor"]}
+
+        self.assertEqual(sorted(seen), sorted(farm.id for farm in self.farms))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_fields_projection(self):
+        response = self.client.get(self.url, {'limit': 10, 'fields': 'id,polygon'})
+
+        self.assertEqual(set(response.data["results"][0]), {"id", "polygon"})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'fields': 'password'}).status_code, 400)
+
+    def test_frontend_walks_the_farm_list_pages(self):
+        for name in ('custom.js', 'argon-dashboard.js'):
+            with open(os.path.join(settings.BASE_DIR, 'staticfiles', 'assets', 'js', name)) as script:
+                source = script.read()
+            self.assertNotRegex(source, r'fetch\(["`]/api/farm/list', name)
+            # the fields the pages request are known to the list endpoints
+            for fields in re.findall(r'(?:farmListFields = |fetchFarmPages\("[^"]+", )\[([^\]]+)\]', source):
+                fields = ",".join(re.findall(r'"(\w+)"', fields))
+                response = self.client.get(self.url, {'limit': 2, 'fields': fields})
+                self.assertEqual(response.status_code, 200, name)
+                self.assertIn("polygon", response.data["results"][0])
+
+
+class FarmBoundingBoxTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username='staff', password='password123', is_staff=True)
+        self.client.force_authenticate(user=self.user)
+        file_id = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='staff').id
+        # a detailed circle near Kigali and a point farm far away
+        self.circle = EUDRFarmModel.objects.create(
+            farmer_name="Circle", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[list(map(list, shapely.Point(30.06, -1.95).buffer(0.001, 64).exterior.coords))],
+            file_id=file_id)
+        self.point = EUDRFarmModel.objects.create(
+            farmer_name="Point", farm_size=1.0, farm_village="V", farm_district="D",
+            latitude=0.3, longitude=32.5, polygon=[], file_id=file_id)
+        self.url = reverse('retrieve_farm_data')
+
+    def test_bbox_keeps_the_farms_in_the_viewport(self):
+        response = self.client.get(self.url, {'bbox': '30,-2,30.1,-1.9'})
+        self.assertEqual([farm["id"] for farm in response.data], [self.circle.id])
+
+        response = self.client.get(self.url, {'bbox': '32,0,33,1', 'limit': 10})
+        self.assertEqual([farm["id"] for farm in response.data["results"]], [self.point.id])
+
+    def test_zoom_simplifies_the_polygons(self):
+        full = {farm["id"]: farm["polygon"] for farm in self.client.get(
+            self.url, {'fields': 'id,polygon'}).data}
+        zoomed_out = {farm["id"]: farm["polygon"] for farm in self.client.get(
+            self.url, {'fields': 'id,polygon', 'zoom': 12}).data}
+
+        self.assertEqual(len(full[self.circle.id][0]), 257)
+        self.assertLess(len(zoomed_out[self.circle.id][0]), 20)
+        self.assertEqual(zoomed_out[self.point.id], [])
+
+    def test_invalid_bbox_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'bbox': '1,2,3'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'bbox': '3,2,1,4'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'zoom': 'far'}).status_code, 400)
+
+    def test_backfill_command_fills_the_missing_columns(self):
+        EUDRFarmModel.objects.update(geometry_wkb=None, min_lon=None, min_lat=None,
+                                     max_lon=None, max_lat=None)
+        updated_at = EUDRFarmModel.objects.get(id=self.circle.id).updated_at
+
+        call_command('backfill_farm_geometries', batch_size=1, stdout=StringIO())
+
+        circle = EUDRFarmModel.objects.get(id=self.circle.id)
+        self.assertIsNotNone(circle.geometry_wkb)
+        self.assertAlmostEqual(circle.min_lon, 30.059)
+        # the cached tiles and maps of the farm are rebuilt
+        self.assertGreater(circle.updated_at, updated_at)
+        self.assertEqual(EUDRFarmModel.objects.get(id=self.point.id).max_lat, 0.3)
+
+
+class FarmVectorTileTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['farm_tiles'].clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='owner', password='password123')
+        self.uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='owner')
+        square = [[30.0, -1.0], [30.001, -1.0], [30.001, -0.999], [30.0, -0.999], [30.0, -1.0]]
+        self.farm = EUDRFarmModel.objects.create(
+            farmer_name="Tile Farmer", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[square], analysis={"eudr_risk_level": "high"}, file_id=self.uploaded_file.id)
+        EUDRFarmModel.objects.create(
+            farmer_name="Overlapping Farmer", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[[[x + 0.0005, y] for x, y in square]], file_id=self.uploaded_file.id)
+        # tile 14/9557/8237 covers the farms
+        self.url = reverse('retrieve_farm_tile', args=[14, 9557, 8237])
+
+    def test_polygon_commands_follow_the_specification(self):
+        # example polygon of the vector tile specification
+        self.assertEqual(encode_polygons([shapely.Polygon([(3, 6), (8, 12), (20, 34)])]),
+                         [9, 6, 12, 18, 10, 12, 24, 44, 15])
+        # the exterior ring is rewound to a positive area
+        self.assertEqual(encode_polygons([shapely.Polygon([(3, 6), (20, 34), (8, 12)])]),
+                         [9, 6, 12, 18, 10, 12, 24, 44, 15])
+
+    def test_tile_contains_the_farms_with_their_attributes(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        for value in (b"farms", b"Tile Farmer", b"eudr_risk_level", b"high", b"overlapping",
+                      b"farm_village", b'{"eudr_risk_level": "high"}'):
+            self.assertIn(value, response.content)
+        self.assertEqual(self.client.get(
+            reverse('retrieve_farm_tile', args=[14, 0, 0])).content, b"")
+
+    def test_tiles_are_cached_until_the_farms_change(self):
+        self.client.force_authenticate(user=self.user)
+        with patch('eudr_backend.views.build_farm_tile', return_value=b"tile") as build:
+            self.client.get(self.url)
+            self.client.get(self.url)
+            self.assertEqual(build.call_count, 1)
+
+            self.farm.farmer_name = "Renamed"
+            self.farm.save()
+            self.client.get(self.url)
+            self.assertEqual(build.call_count, 2)
+
+    def test_overlapping_tiles_only_draw_the_overlapping_farms(self):
+        EUDRFarmModel.objects.create(
+            farmer_name="Lone Farmer", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[[[30.0, -0.9995], [30.0002, -0.9995], [30.0002, -0.9993], [30.0, -0.9995]]],
+            file_id=self.uploaded_file.id)
+        self.client.force_authenticate(user=self.user)
+
+        self.assertIn(b"Lone Farmer", self.client.get(self.url).content)
+        tile = self.client.get(self.url, {'overlapping': 'true'}).content
+        self.assertNotIn(b"Lone Farmer", tile)
+        self.assertIn(b"Tile Farmer", tile)
+        self.assertIn(b"Overlapping Farmer", tile)
+
+    def test_signed_versions_skip_the_version_query(self):
+        self.client.force_authenticate(user=self.user)
+        version = get_farms_version(get_tile_farms(self.user))
+        with patch('eudr_backend.views.build_farm_tile', return_value=b"tile") as build:
+            self.client.get(self.url, {'version': sign_tile_version(version)})
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url, {'version': sign_tile_version(version)})
+            self.assertEqual(build.call_count, 1)
+            self.assertFalse([query for query in queries if 'MAX(' in query['sql']])
+
+            # a tampered version is read again
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url, {'version': f"{version}:forged"})
+            self.assertTrue([query for query in queries if 'MAX(' in query['sql']])
+
+    def test_shared_maps_open_tiles_with_their_access_code(self):
+        EUDRSharedMapAccessCodeModel.objects.create(
+            file_id=self.uploaded_file.id, access_code="CODE",
+            valid_until=timezone.now() + datetime.timedelta(days=1))
+
+        response = self.client.get(
+            self.url, {'file-id': self.uploaded_file.id, 'access-code': 'CODE'})
+        self.assertIn(b"Tile Farmer", response.content)
+        self.assertEqual(self.client.get(
+            self.url, {'file-id': self.uploaded_file.id, 'access-code': 'WRONG'}).status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class FarmExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='owner', password='password123')
+        self.client.force_authenticate(user=self.user)
+        uploaded_file = EUDRUploadedFilesModel.objects.create(
+            file_name='farms.csv', uploaded_by='owner')
+        EUDRFarmModel.objects.create(
+            farmer_name="Point Farm", farm_size=1.0, farm_village="V", farm_district="D",
+            latitude=1.5, longitude=2.5, polygon=[], file_id=uploaded_file.id)
+        EUDRFarmModel.objects.create(
+            farmer_name="Polygon Farm", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[[[0, 0], [0, 1], [1, 1], [0, 0]]], file_id=uploaded_file.id)
+        EUDRFarmModel.objects.create(
+            farmer_name="Other Farm", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=EUDRUploadedFilesModel.objects.create(
+                file_name='other.csv', uploaded_by='someone').id)
+        self.url = reverse('export_farm_data')
+
+    def test_geojson_export_streams_a_feature_collection(self):
+        # one row per chunk so the features are joined across chunks
+        with patch('eudr_backend.views.settings.EXPORT_CHUNK_SIZE', 1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        geojson = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(geojson["type"], "FeatureCollection")
+        self.assertEqual([feature["geometry"]["type"] for feature in geojson["features"]],
+                         ["Point", "Polygon"])
+        self.assertEqual(geojson["features"][0]["properties"]["farmer_name"], "Point Farm")
+        self.assertEqual(geojson["features"][1]["bbox"], [0, 0, 1, 1])
+        self.assertNotIn("geometry_wkb", geojson["features"][1]["properties"])
+
+    def test_ndjson_export_writes_one_feature_per_line(self):
+        response = self.client.get(self.url, {'file_format': 'ndjson'})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])["properties"]["farmer_name"], "Polygon Farm")
+
+    def test_unknown_format_is_rejected(self):
+        response = self.client.get(self.url, {'file_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_numeric_file_ids_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'file_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(
+            reverse('retrieve_farm_tile', args=[1, 1, 1]), {'file-id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post(
+            reverse('revalidate_farm_data'), {'file_id': 'abc'}, format='json').status_code, 400)
+
+
+class RegisterFileGeoidsTest(TestCase):
+    def setUp(self):
+        self.uploaded_file, other_file = [
+            EUDRUploadedFilesModel.objects.create(file_name=name, uploaded_by='owner')
+            for name in ('farms.csv', 'other.csv')]
+        self.farms = [
+            EUDRFarmModel.objects.create(
+                farmer_name=f"Farmer {i}", farm_size=5.0, farm_village="V", farm_district="D",
+                polygon=[[[i, 0], [i, 1], [i + 1, 1], [i, 0]]], file_id=self.uploaded_file.id)
+            for i in range(3)
+        ]
+        self.point_farm = EUDRFarmModel.objects.create(
+            farmer_name="Point", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=self.uploaded_file.id)
+        self.other_file_farm = EUDRFarmModel.objects.create(
+            farmer_name="Other", farm_size=5.0, farm_village="V", farm_district="D",
+            polygon=[[[9, 0], [9, 1], [10, 1], [9, 0]]], file_id=other_file.id)
+
+    def _fake_post(self, running):
+        async def post(client, url, json=None, headers=None):
+            if url.endswith('/login'):
+                return httpx.Response(200, json={"access_token": "token"},
+                                      request=httpx.Request("POST", url))
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+            if json["wkt"].startswith("POLYGON ((0"):
+                return httpx.Response(400, json={"matched geo ids": ["existing"]})
+            return httpx.Response(200, json={"Geo Id": json["wkt"][10:11]})
+        return post
+
+    def test_only_the_file_farms_are_registered_concurrently(self):
+        running = {"now": 0, "max": 0}
+        with patch('httpx.AsyncClient.post', self._fake_post(running)), \
+                patch('eudr_backend.tasks.settings.AGSTACK_CONCURRENCY', 2):
+            async_to_sync(register_file_geoids)(self.uploaded_file.id)
+
+        self.assertEqual(running["max"], 2)
+        self.assertEqual(
+            [farm.geoid for farm in EUDRFarmModel.objects.filter(
+                id__in=[farm.id for farm in self.farms]).order_by('id')],
+            ["existing", "1", "2"])
+        self.point_farm.refresh_from_db()
+        self.other_file_farm.refresh_from_db()
+        self.assertIsNone(self.point_farm.geoid)
+        self.assertIsNone(self.other_file_farm.geoid)
+
+
+class CsvIngestionTest(TestCase):
+    header = "farmer_name,farm_size,collection_site,farm_district,farm_village,latitude,longitude,polygon,commodity\n"
+
+    def _upload(self, rows):
+        return SimpleUploadedFile("farms.csv", (self.header + "".join(rows)).encode())
+
+    def test_features_are_yielded_in_batches(self):
+        upload = self._upload([
+            f"Farmer {i},1,Site,District,Village,{i},2,,Coffee\n" for i in range(5)
+        ] + ['Polygon Farmer,5,Site,District,Village,0,0,"[[1, 2], [1, 3], [2, 3], [1, 2]]",Coffee\n'])
+
+        batches = list(iter_csv_feature_batches(upload, 2))
+
+        self.assertEqual([len(batch["features"]) for batch in batches], [2, 2, 2])
+        self.assertEqual(batches[0]["features"][1]["geometry"]["coordinates"], [2.0, 1.0])
+        self.assertEqual(batches[2]["features"][1]["geometry"]["type"], "Polygon")
+        # the upload is still open for the S3 copy
+        self.assertFalse(upload.closed)
+
+    def test_validation_reports_every_invalid_record(self):
+        upload = self._upload([
+            "Farmer,abc,Site,District,Village,1,2,,Coffee\n",
+            "Farmer,1,Site,District,Village,x,2,,Coffee\n",
+        ])
+
+        self.assertEqual(validate_csv_file(upload), [
+            'Record 1: "farm_size" must be a number.',
+            'Record 2: "latitude" must be a number.',
+        ])
+
+    def test_failing_batch_rolls_back_the_upload(self):
+        uploaded_file = EUDRUploadedFilesModel.objects.create(file_name="farms.csv", uploaded_by="agent")
+        EUDRFarmModel.objects.create(
+            farmer_name="Earlier upload", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=uploaded_file.id)
+        atomic_depths = {}
+
+        def get_atomic_depth():
+            return len(connection.atomic_blocks)
+
+        async def analyse(batch):
+            atomic_depths.setdefault("analysis", await sync_to_async(get_atomic_depth)())
+            if len(batch["features"]) == 2:
+                return None, []
+            return {"error": "Validation against global database failed."}, None
+
+        async def save(batch, file_id, analysis_results):
+            atomic_depths.setdefault("save", await sync_to_async(get_atomic_depth)())
+            await sync_to_async(EUDRFarmModel.objects.create)(
+                farmer_name="Saved", farm_size=1.0, farm_village="V", farm_district="D",
+                polygon=[], file_id=file_id)
+            return None, []
+
+        upload = self._upload([
+            f"Farmer {i},1,Site,District,Village,{i},2,,Coffee\n" for i in range(3)
+        ])
+        with patch('eudr_backend.ingestion.perform_analysis', analyse), \
+                patch('eudr_backend.ingestion.save_farm_data', save):
+            errors = ingest_feature_batches(iter_csv_feature_batches(upload, 2), uploaded_file.id)
+
+        self.assertEqual(errors, [{"error": "Validation against global database failed."}])
+        self.assertFalse(EUDRFarmModel.objects.filter(farmer_name="Saved").exists())
+        self.assertTrue(EUDRFarmModel.objects.filter(farmer_name="Earlier upload").exists())
+        # only the saves hold a transaction
+        self.assertEqual(atomic_depths["save"], atomic_depths["analysis"] + 1)
+
+
+class ColumnarValidationTest(TestCase):
+    header = ['farmer_name', 'farm_size', 'collection_site', 'farm_district', 'farm_village',
+              'latitude', 'longitude', 'polygon', 'commodity']
+
+    def _row(self, farm_size='1', latitude='1', longitude='2', polygon=''):
+        return ['Farmer', farm_size, 'Site', 'District', 'Village', latitude, longitude, polygon, 'Coffee']
+
+    def test_errors_keep_record_order_and_messages(self):
+        rows = [
+            self._row(),
+            self._row(farm_size='abc', polygon='[[1, 2], [1, 3], [2, 3]]'),
+            self._row(latitude='', longitude=' 2.5 '),
+            self._row(latitude='north', longitude='east'),
+            self._row(farm_size='5', polygon='[1, 2'),
+            self._row(farm_size='5', polygon='[[1, 2]]'),
+            ['Farmer', '1'],
+        ]
+
+        self.assertEqual(validate_csv_rows([self.header, *rows]), [
+            'Record 2: "farm_size" must be a number.',
+            'Record 2: "polygon" must be a valid list.',
+            'Record 4: "latitude" must be a number.',
+            'Record 4: "longitude" must be a number.',
+            'Record 5: "polygon" must be a valid list.',
+            'Record 6: Should have valid polygon format.',
+        ])
+
+    def test_record_indices_continue_across_batches(self):
+        rows = [self._row(farm_size='nan'), self._row(), self._row(farm_size='x'),
+                self._row(), self._row(latitude='y')]
+
+        self.assertEqual(validate_csv_rows([self.header, *rows], batch_size=2), [
+            'Record 3: "farm_size" must be a number.',
+            'Record 5: "latitude" must be a number.',
+        ])
+
+    def test_joined_polygon_parsing_matches_json_loads(self):
+        texts = ['[[1, 2], [1, 3], [2, 3]]', '[1],[2]', '[[3]', '[4]]', '0],[1', '1, 2', ' ', '[]',
+                 '[["1", 2], [1, 3], [2, 3]]', '[[[1, 2], [1, 3], [2, 3], [1, 2]]]', '{}', 'NaN',
+                 '[1, 2', '[[1, 2]]', '["]"]', '[{"a": 1}]']
+        expected = []
+        for text in texts:
+            try:
+                expected.append((True, json.loads(text)))
+            except ValueError:
+                expected.append((False, None))
+
+        parsed, valid = parse_json_column(pd.Series(texts, dtype=object))
+
+        self.assertEqual(list(valid), [is_valid for is_valid, _ in expected])
+        for (is_valid, value), parsed_value in zip(expected, parsed):
+            if is_valid and value == value:
+                self.assertEqual(parsed_value, value)
+
+    def test_ring_coordinates_are_checked_as_a_whole(self):
+        self.assertEqual(validate_ring_coordinates([[1, 2], [1.5, 3], [2, 3], [1, 2]]), [])
+        self.assertEqual(validate_ring_coordinates([[1, 2], ["1", 3], [2, 3, 4]]), [
+            'Invalid GeoJSON coordinates. Must be a list of lists with numbers',
+            'Invalid GeoJSON coordinates. Must be a list of lists with 2 coordinates',
+        ])
+
+
+class GeoJSONFeatureReaderTest(TestCase):
+    def _collection(self, count):
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {
+                        "farmer_name": f"Farmer {i}", "farm_village": "V", "farm_district": "D",
+                        "farm_size": 1.5, "latitude": 1.0, "longitude": 2.0, "commodity": "Coffee",
+                    },
+                    "geometry": {"type": "Point", "coordinates": [2.0, 1.0]},
+                }
+                for i in range(count)
+            ],
+            "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+        }
+
+    def test_features_are_read_incrementally(self):
+        collection = self._collection(20)
+        reader = GeoJSONFeatureReader(
+            SimpleUploadedFile("farms.geojson", json.dumps(collection).encode()), read_size=16)
+
+        self.assertEqual(list(reader), collection["features"])
+        self.assertEqual(reader.collection["crs"], collection["crs"])
+
+    def test_upload_validation_matches_validate_geojson(self):
+        collection = self._collection(3)
+        collection["features"][1]["properties"]["farm_size"] = "big"
+        upload = SimpleUploadedFile("farms.geojson", json.dumps(collection).encode())
+
+        self.assertEqual(validate_upload_file(upload, 'geojson'), validate_geojson(collection))
+        self.assertEqual(validate_upload_file(
+            SimpleUploadedFile("farms.geojson", b'{"type": "Feature"'), 'geojson'),
+            ['Invalid GeoJSON. Must be a dictionary'])
+
+    def test_features_are_batched(self):
+        upload = SimpleUploadedFile("farms.geojson", json.dumps(self._collection(5)).encode())
+
+        batches = list(iter_upload_feature_batches(upload, 'geojson', 2))
+
+        self.assertEqual([len(batch["features"]) for batch in batches], [2, 2, 1])
+
+
+class UploadJobTest(TestCase):
+    csv_content = (
+        "farmer_name,farm_size,collection_site,farm_district,farm_village,latitude,longitude,polygon,commodity\n"
+        "Farmer,1,Site,District,Village,1,2,,Coffee\n"
+        "Other Farmer,1,Site,District,Village,3,4,,Coffee\n"
+    )
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = self.settings(STORAGES={**settings.STORAGES, "upload_jobs": {
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": self.media_root},
+        }})
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='uploader', password='password123')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+    def _create_job(self, content):
+        response = self.client.post(reverse('create_upload_job'), {
+            'format': 'csv',
+            'file': SimpleUploadedFile("farms.csv", content.encode()),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return EUDRUploadJobModel.objects.get(id=response.data['job_id'])
+
+    def test_upload_returns_a_queued_job(self):
+        job = self._create_job(self.csv_content)
+
+        self.assertEqual(job.status, 'pending')
+        self.assertTrue(Task.objects.filter(task_name='eudr_backend.tasks.process_upload_job').exists())
+        self.assertTrue(storages["upload_jobs"].exists(job.stored_file))
+
+    def test_upload_is_documented_as_a_form(self):
+        response = self.client.get('/swagger.json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('multipart/form-data', response.json()['paths']['/api/farm/upload/']['post']['consumes'])
+
+    def test_job_runs_every_stage(self):
+        async def analyse(batch):
+            return None, []
+
+        async def save(batch, file_id, analysis_results):
+            return None, []
+
+        job = self._create_job(self.csv_content)
+        with patch('eudr_backend.ingestion.perform_analysis', analyse), \
+                patch('eudr_backend.ingestion.save_farm_data', save), \
+                patch('eudr_backend.upload_jobs.store_file_in_s3') as store_file:
+            file_id = run_upload_job(job.id)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage), ('completed', 'done'))
+        self.assertEqual((job.total_records, job.processed_records), (2, 2))
+        self.assertEqual(job.file_id, str(file_id))
+        store_file.assert_called_once()
+        self.assertFalse(storages["upload_jobs"].exists(job.stored_file))
+
+        response = self.client.get(reverse('retrieve_upload_job', args=[job.id]))
+        self.assertEqual((response.data['status'], response.data['file_id']), ('completed', file_id))
+        self.assertNotIn('stored_file', response.data)
+
+    def test_invalid_file_fails_the_job(self):
+        job = self._create_job(self.csv_content.replace("Farmer,1,", "Farmer,abc,", 1))
+        with patch('eudr_backend.upload_jobs.store_file_in_s3'):
+            self.assertIsNone(run_upload_job(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.errors, ['Record 1: "farm_size" must be a number.'])
+
+    def test_failed_upload_keeps_the_existing_file_entry(self):
+        uploaded_file = EUDRUploadedFilesModel.objects.create(file_name='farms.csv', uploaded_by='uploader')
+        farm = EUDRFarmModel.objects.create(
+            farmer_name="Earlier upload", farm_size=1.0, farm_village="V", farm_district="D",
+            polygon=[], file_id=uploaded_file.id)
+
+        async def analyse(batch):
+            return None, []
+
+        # the analysis or the save of the new farms fails
+        for failure in (
+            patch('eudr_backend.ingestion.perform_analysis', AsyncMock(
+                return_value=({"error": "Validation against global database failed."}, None))),
+            patch('eudr_backend.async_tasks.bulk_upsert_farms', return_value=([{"record": 1}], None)),
+        ):
+            job = self._create_job(self.csv_content)
+            with patch('eudr_backend.ingestion.perform_analysis', analyse), failure, \
+                    patch('eudr_backend.upload_jobs.store_file_in_s3'):
+                self.assertIsNone(run_upload_job(job.id))
+
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'failed')
+            self.assertTrue(EUDRUploadedFilesModel.objects.filter(id=uploaded_file.id).exists())
+            farm.refresh_from_db()
+            self.assertEqual(farm.file_id, uploaded_file.id)
+
+    def test_jobs_of_other_users_are_hidden(self):
+        job = EUDRUploadJobModel.objects.create(
+            file_name='farms', data_format='csv', uploaded_by='someone', stored_file='x')
+
+        response = self.client.get(reverse('retrieve_upload_job', args=[job.id]))
+
+        self.assertEqual(response.status_code, 404)
@@ -29,6 +29,36 @@
   }
 })();
 
+// Fetch every farm of a farm list endpoint one page at a time, so the server never builds
+// the whole list in a single response. fields lists the farm fields to return.
+function fetchFarmPages(url, fields) {
+  const farms = [];
+  const fetchPage = (cursor) => {
+    const params = new URLSearchParams({ limit: 1000, fields: fields.join(",") });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    return fetch(`${url}?${params}`, {
+      method: "GET",
+      headers: {
+        "Content-Type": "application/json",
+        Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
+      },
+    })
+      .then((resp) => {
+        if (!resp.ok) {
+          throw new Error("Network response was not ok");
+        }
+        return resp.json();
+      })
+      .then((page) => {
+        farms.push(...page.results);
+        return page.next_cursor ? fetchPage(page.next_cursor) : farms;
+      });
+  };
+  return fetchPage(null);
+}
+
 function mapDefaultLocation(baseMaps, overlayMaps) {
   var layerControl = L.control.layers(baseMaps, overlayMaps).addTo(map);
 
@@ -206,19 +236,11 @@ function initMap() {
         };
         legend.addTo(map);
 
-        fetch("/api/farm/list/", {
-          method: "GET",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
-          },
-        })
-          .then((response) => {
-            if (!response.ok) {
-              throw new Error("Network response failed");
-            }
-            return response.json();
-          })
+        fetchFarmPages("/api/farm/list/", [
+          "id", "farmer_name", "farm_size", "collection_site", "agent_name", "farm_village",
+          "farm_district", "file_id", "latitude", "longitude", "polygon", "is_validated",
+          "analysis", "updated_at",
+        ])
           .then((data) => {
             for (const farm of data) {
               geojsonData.push({
@@ -305,7 +327,7 @@ function initMap() {
             if (fileId) {
               // find the farm with the file id
               const farm = geojsonData.find(
-                (farm) => farm.properties.file_id === fileId
+                (farm) => String(farm.properties.file_id) === fileId
               );
 
               // if farm is found, zoom to the first farm
@@ -314,7 +336,7 @@ function initMap() {
                   map.setView(farm.geometry.coordinates, 19);
                   // open popup
                   geoJsonLayer.eachLayer(function (layer) {
-                    if (layer.feature.properties.file_id === fileId) {
+                    if (String(layer.feature.properties.file_id) === fileId) {
                       layer.openPopup();
                     }
                   });
@@ -323,7 +345,7 @@ function initMap() {
 
                   // highlight the farm with random color
                   geoJsonLayer.eachLayer(function (layer) {
-                    if (layer.feature.properties.file_id === fileId) {
+                    if (String(layer.feature.properties.file_id) === fileId) {
                       layer.setStyle({
                         fillColor: "#ff0000",
                         fillOpacity: 0.5,
@@ -333,7 +355,7 @@ function initMap() {
 
                   // open popup
                   geoJsonLayer.eachLayer(function (layer) {
-                    if (layer.feature.properties.file_id === fileId) {
+                    if (String(layer.feature.properties.file_id) === fileId) {
                       layer.openPopup();
                     }
                   });
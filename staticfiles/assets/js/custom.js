@@ -225,7 +225,52 @@ function sendDataToAPI(data, file_name, format, file) {
   formData.append("format", format);
   formData.append("file", file);
 
-  fetch("/api/farm/add/", {
+  const stageTexts = {
+    queued: "Waiting for a worker...",
+    validating: "Validating records...",
+    processing: "Analysing and saving plots...",
+    storing: "Storing the file...",
+  };
+
+  function enableForm() {
+    saveBtn.removeAttribute("disabled");
+    closeBtn.removeAttribute("disabled");
+    fileInputContainer.removeAttribute("disabled");
+    downloadDropdown.removeAttribute("disabled");
+    progressContainer.style.visibility = "hidden";
+  }
+
+  function showUploadError(message) {
+    document.querySelector("#modal-error-container").classList.remove("d-none");
+
+    document.querySelector("#headingOneErrorText").textContent = message;
+    document
+      .querySelector("#close-error-accordion")
+      .addEventListener("click", (e) => {
+        e.preventDefault();
+
+        document.querySelector("#modal-error-container").classList.add("d-none");
+      });
+  }
+
+  function showJobProgress(job) {
+    // the job reports its own stage, stop cycling through the generic texts
+    clearInterval(intervalId);
+    const counts = job.total_records
+      ? ` (${job.processed_records}/${job.total_records})`
+      : "";
+    progressText.innerText = `${
+      stageTexts[job.stage] || texts[0]
+    }${counts}`;
+    if (job.stage === "processing" && job.total_records) {
+      progressBar.style.width = `${Math.max(
+        5,
+        Math.round((job.processed_records * 100) / job.total_records)
+      )}%`;
+    }
+  }
+
+  fetch("/api/farm/upload/", {
     method: "POST",
     headers: {
       "X-CSRFToken": csrftoken,
@@ -233,91 +278,83 @@ function sendDataToAPI(data, file_name, format, file) {
     },
     body: formData,
   })
-    .then((response) => {
-      clearInterval(intervalId);
-      // Update the progress text
-      progressText.innerText = "Finishing up...";
-      progressBar.style.width = "100%";
-
-      // Sleep for 2 seconds before checking the response.ok
-      return new Promise((resolve) => {
-        setTimeout(() => {
-          resolve(response);
-        }, 2000);
-      });
-    })
     .then((response) => {
       if (!response.ok) {
-        if (response.status === 400) {
-          document
-            .querySelector("#modal-error-container")
-            .classList.remove("d-none");
-
-          return response.json().then((errorData) => {
-            document.querySelector("#headingOneErrorText").textContent =
-              errorData?.errors?.[0];
-            document
-              .querySelector("#close-error-accordion")
-              .addEventListener("click", (e) => {
-                e.preventDefault();
-
-                document
-                  .querySelector("#modal-error-container")
-                  .classList.add("d-none");
-              });
-          });
-        }
         throw new Error("Network response was not ok.");
       }
       return response.json();
     })
-    .then((data) => {
-      if (data) {
-        Toastify({
-          text: "Data were processed successfully!!!",
-          duration: 3000,
-          close: true,
-          gravity: "top",
-          position: "right",
-          backgroundColor: "green",
-        }).showToast();
+    .then((job) => pollUploadJob(job.job_id, showJobProgress))
+    .then((job) => {
+      clearInterval(intervalId);
+      // Update the progress text
+      progressText.innerText = "Finishing up...";
+      progressBar.style.width = "100%";
 
-        setTimeout(function () {
-          window.location.href = `/validator/?file-id=${data.file_id}`;
-        }, 2000);
+      if (job.status === "failed") {
+        const error = job.errors?.[0];
+        showUploadError(
+          typeof error === "string"
+            ? error
+            : error?.error || "Error while uploading data. please try again"
+        );
+        enableForm();
+        return;
       }
 
-      saveBtn.removeAttribute("disabled");
-      closeBtn.removeAttribute("disabled");
-      fileInputContainer.removeAttribute("disabled");
-      downloadDropdown.removeAttribute("disabled");
-      progressContainer.style.visibility = "hidden";
-    })
-    .catch((error) => {
-      document
-        .querySelector("#modal-error-container")
-        .classList.remove("d-none");
-
-      document.querySelector("#headingOneErrorText").textContent =
-        "Error while uploading data. please try again";
-      document
-        .querySelector("#close-error-accordion")
-        .addEventListener("click", (e) => {
-          e.preventDefault();
+      Toastify({
+        text: "Data were processed successfully!!!",
+        duration: 3000,
+        close: true,
+        gravity: "top",
+        position: "right",
+        backgroundColor: "green",
+      }).showToast();
 
-          document
-            .querySelector("#modal-error-container")
-            .classList.add("d-none");
-        });
+      setTimeout(function () {
+        window.location.href = `/validator/?file-id=${job.file_id}`;
+      }, 2000);
 
-      saveBtn.removeAttribute("disabled");
-      closeBtn.removeAttribute("disabled");
-      fileInputContainer.removeAttribute("disabled");
-      downloadDropdown.removeAttribute("disabled");
-      progressContainer.style.visibility = "hidden";
+      enableForm();
+    })
+    .catch((error) => {
+      clearInterval(intervalId);
+      showUploadError("Error while uploading data. please try again");
+      enableForm();
     });
 }
 
+// Poll an upload job until the worker has completed or failed it
+function pollUploadJob(jobId, onProgress) {
+  return new Promise((resolve, reject) => {
+    const poll = () => {
+      fetch(`/api/farm/upload/${jobId}/`, {
+        method: "GET",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
+        },
+      })
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error("Network response was not ok.");
+          }
+          return response.json();
+        })
+        .then((job) => {
+          if (job.status === "completed" || job.status === "failed") {
+            resolve(job);
+            return;
+          }
+          onProgress(job);
+          setTimeout(poll, 3000);
+        })
+        .catch(reject);
+    };
+    poll();
+  });
+}
+
 let dropArea = document.getElementById("drop-area");
 
 ["dragenter", "dragover", "dragleave", "drop"].forEach((eventName) => {
@@ -428,41 +465,24 @@ const colorClasses = {
   high: "high",
 };
 
+// every field of the farms, the list is filtered, exported and drawn from them
+const farmListFields = [
+  "id", "file_id", "remote_id", "farmer_name", "member_id", "farm_size", "collection_site",
+  "agent_name", "farm_village", "farm_district", "latitude", "longitude", "polygon",
+  "polygon_type", "accuracies", "geoid", "is_validated", "analysis", "validated_at",
+  "min_lon", "min_lat", "max_lon", "max_lat", "created_at", "updated_at",
+];
 let response = null;
 if (fileId) {
-  response = fetch(`/api/farm/list/file/${fileId}/`, {
-    method: "GET",
-    headers: {
-      "Content-Type": "application/json",
-      Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
-    },
-  });
+  response = fetchFarmPages(`/api/farm/list/file/${fileId}/`, farmListFields);
 } else {
   response = userId
-    ? fetch(`/api/farm/list/user/${userId}`, {
-        method: "GET",
-        headers: {
-          "Content-Type": "application/json",
-          Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
-        },
-      })
-    : fetch("/api/farm/list/", {
-        method: "GET",
-        headers: {
-          "Content-Type": "application/json",
-          Authorization: `Token ${localStorage.getItem("terratracAuthToken")}`,
-        },
-      });
+    ? fetchFarmPages(`/api/farm/list/user/${userId}/`, farmListFields)
+    : fetchFarmPages("/api/farm/list/", farmListFields);
 }
 
 if (response) {
   response
-    .then((resp) => {
-      if (!resp.ok) {
-        throw new Error("Network response was not ok");
-      }
-      return resp.json();
-    })
     .then((data) => {
       // const farmsWithAnalysis = data.filter(farm => farm.analysis);
       // console.log("famr data",data)
@@ -573,7 +593,7 @@ if (response) {
       }
       if (farmsContainer) {
         const cs =
-          farmData.find((item) => item.file_id === fileId)?.collection_site ||
+          farmData.find((item) => String(item.file_id) === fileId)?.collection_site ||
           "";
         if (data.length > 0) {
           document